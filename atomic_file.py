@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+from contextlib import contextmanager
+from typing import (
+    IO,
+    Any,
+    Iterator,
+)
+
+
+# Write path through a temporary file in the same directory that is moved
+# into place once the block completes, so readers (and concurrent writers)
+# see either the old file or the complete new one. If the block raises the
+# temporary file is removed and path is left alone.
+@contextmanager
+def atomic_write(path: str, mode: str = "w") -> Iterator[IO[Any]]:
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
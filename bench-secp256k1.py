@@ -0,0 +1,446 @@
+import argparse
+import gc
+import importlib
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import secp256k1
+
+random.seed(a='bench-secp256k1', version=2)
+
+
+def random_scalars(count):
+    return [random.randrange(1, secp256k1.N) for _ in range(count)]
+
+
+def timed(fn, args):
+    start_time = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - start_time) / len(args)
+
+
+def bench_fixed_base(count=200):
+    print("Fixed-base generator tables (%d random scalars)" % count)
+    scalars = random_scalars(count)
+    G3 = secp256k1.to_jacobian(secp256k1.G)
+
+    generic = timed(lambda k: secp256k1.jacobian_multiply(G3, k), scalars)
+    print("\tgeneric jacobian_multiply: %8.1f us/op" % (generic * 1e6))
+
+    # A fresh cache directory, so each window is built once and then loaded
+    # back from its cache file the way a later process would
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for window in (4, 6, 8, 10):
+            stats = secp256k1.precompute_base_table(window, cache_dir)
+            loaded = secp256k1.precompute_base_table(window, cache_dir)
+            per_op = timed(lambda k: secp256k1.multiply(secp256k1.G, k), scalars)
+            print("\twindow %2d: build %6.2fs, load %6.3fs, %6d points, %8.1f KiB, "
+                  "%3d additions, %8.1f us/op (%.1fx)" % (
+                      window, stats["build_seconds"], loaded["build_seconds"],
+                      stats["points"], stats["bytes"] / 1024,
+                      stats["additions_per_multiply"], per_op * 1e6, generic / per_op))
+    secp256k1.precompute_base_table()
+
+
+# The recursive double-and-add that jacobian_multiply used before wNAF
+def recursive_multiply(a, n):
+    if a[1] == 0 or n == 0:
+        return (0, 0, 1)
+    if n == 1:
+        return a
+    if n < 0 or n >= secp256k1.N:
+        return recursive_multiply(a, n % secp256k1.N)
+    if (n % 2) == 0:
+        return secp256k1.jacobian_double(recursive_multiply(a, n // 2))
+    return secp256k1.jacobian_add(
+        secp256k1.jacobian_double(recursive_multiply(a, n // 2)), a)
+
+
+def bench_variable_base(count=200):
+    print("Variable-base multiplication (%d random 256-bit scalars)" % count)
+    scalars = random_scalars(count)
+    pt = secp256k1.to_jacobian(secp256k1.multiply(secp256k1.G, scalars[0]))
+
+    recursive = timed(lambda k: recursive_multiply(pt, k), scalars)
+    print("\trecursive double-and-add: %8.1f us/op" % (recursive * 1e6))
+    for engine, fn in sorted(secp256k1.MULTIPLY_ENGINES.items()):
+        for window in (3, 4, 5, 6):
+            per_op = timed(lambda k: fn(pt, k, window), scalars)
+            print("\t%-4s window %d:          %8.1f us/op (%.2fx)" % (
+                engine, window, per_op * 1e6, recursive / per_op))
+
+
+# ecdsa_raw_recover as it was before multi-scalar multiplication: three
+# separate multiplications and an addition
+def separate_recover(msghash, vrs):
+    v, r, s = vrs
+    x = r
+    beta = pow((x * x * x + secp256k1.B) % secp256k1.P,
+               (secp256k1.P + 1) // 4, secp256k1.P)
+    y = beta if v % 2 ^ beta % 2 else (secp256k1.P - beta)
+    z = secp256k1.bytes_to_int(msghash)
+    Gz = secp256k1.jacobian_multiply(
+        (secp256k1.Gx, secp256k1.Gy, 1), (secp256k1.N - z) % secp256k1.N)
+    XY = secp256k1.jacobian_multiply((x, y, 1), s)
+    Qr = secp256k1.jacobian_add(Gz, XY)
+    Q = secp256k1.jacobian_multiply(Qr, secp256k1.inv(r, secp256k1.N))
+    return secp256k1.from_jacobian(Q)
+
+
+def bench_recover(count=100):
+    print("ECDSA public key recovery (%d signatures)" % count)
+    sigs = []
+    for k in random_scalars(count):
+        msghash = random.getrandbits(256).to_bytes(32, 'big')
+        sigs.append((msghash, secp256k1.ecdsa_raw_sign(
+            msghash, k.to_bytes(32, 'big'))))
+
+    separate = timed(lambda sig: separate_recover(*sig), sigs)
+    print("\tthree multiplications: %8.1f us/op" % (separate * 1e6))
+    multi = timed(lambda sig: secp256k1.ecdsa_raw_recover(*sig), sigs)
+    print("\tmulti-scalar:          %8.1f us/op (%.2fx)" % (
+        multi * 1e6, separate / multi))
+    batch = timed(secp256k1.ecdsa_batch_recover, [sigs]) / count
+    print("\tbatch of %d:          %8.1f us/op (%.2fx)" % (
+        count, batch * 1e6, separate / batch))
+
+
+def bench_verify(count=100):
+    print("ECDSA verification against known public keys (%d signatures)" % count)
+    sigs = []
+    for k in random_scalars(count):
+        priv = k.to_bytes(32, 'big')
+        msghash = random.getrandbits(256).to_bytes(32, 'big')
+        sigs.append((msghash, secp256k1.ecdsa_raw_sign(msghash, priv),
+                     secp256k1.privtopub(priv)))
+
+    recover = timed(
+        lambda sig: secp256k1.ecdsa_raw_recover(sig[0], sig[1]) == sig[2], sigs)
+    print("\trecover and compare:   %8.1f us/op" % (recover * 1e6))
+    single = timed(lambda sig: secp256k1.ecdsa_raw_verify(*sig), sigs)
+    print("\tecdsa_raw_verify:      %8.1f us/op (%.2fx)" % (
+        single * 1e6, recover / single))
+    batch = timed(secp256k1.ecdsa_batch_verify, [sigs]) / count
+    print("\tbatch of %d:          %8.1f us/op (%.2fx)" % (
+        count, batch * 1e6, recover / batch))
+
+
+def bench_field_backends(count=100):
+    print("Field backends (%d operations each)" % count)
+    scalars = random_scalars(count)
+    privs = [k.to_bytes(32, 'big') for k in scalars]
+    msghashes = [random.getrandbits(256).to_bytes(32, 'big') for _ in scalars]
+    pt = secp256k1.multiply(secp256k1.G, scalars[0])
+    sigs = [(h, secp256k1.ecdsa_raw_sign(h, k)) for h, k in zip(msghashes, privs)]
+    default = secp256k1.FIELD_BACKEND
+
+    baseline = {}
+    for name in sorted(secp256k1.FIELD_BACKENDS, key=lambda n: n != "python"):
+        secp256k1.set_field_backend(name)
+        results = [
+            ("multiply", timed(lambda k: secp256k1.multiply(pt, k), scalars)),
+            ("sign", timed(lambda i: secp256k1.ecdsa_raw_sign(
+                msghashes[i], privs[i]), range(count))),
+            ("recover", timed(lambda sig: secp256k1.ecdsa_raw_recover(*sig), sigs)),
+        ]
+        for op, per_op in results:
+            baseline.setdefault(op, per_op)
+            print("\t%-7s %-9s %8.0f ops/s (%.2fx)" % (
+                name, op, 1 / per_op, baseline[op] / per_op))
+    secp256k1.set_field_backend(default)
+
+
+def bench_enumerate(count=20000):
+    print("Sequential key range address derivation (%d keys)" % count)
+    start = random_scalars(1)[0]
+
+    per_key = timed(lambda k: secp256k1.pub_to_address(
+        secp256k1.privtopub(k.to_bytes(32, 'big'))), range(start, start + 500))
+    print("\tprivtopub + pub_to_address: %10.0f keys/min" % (60 / per_key))
+    for block_size in (64, 256, 1024, 4096):
+        start_time = time.perf_counter()
+        for _ in secp256k1.enumerate_addresses(start, count, block_size):
+            pass
+        per_key_range = (time.perf_counter() - start_time) / count
+        print("\tenumerate, blocks of %4d:  %10.0f keys/min (%.1fx)" % (
+            block_size, 60 / per_key_range, per_key / per_key_range))
+
+
+def bench_ecdh(count=1000):
+    print("ECDH, one private key against %d peer public keys" % count)
+    priv = random_scalars(1)[0]
+    pubs = [secp256k1.multiply(secp256k1.G, k) for k in random_scalars(count)]
+
+    per_peer = timed(lambda pub: secp256k1.multiply(pub, priv), pubs)
+    print("\tmultiply per peer: %8.1f us/peer" % (per_peer * 1e6))
+    for batch_size in (16, 256, count):
+        start_time = time.perf_counter()
+        for i in range(0, count, batch_size):
+            secp256k1.batch_ecdh(priv, pubs[i:i + batch_size])
+        per_peer_batch = (time.perf_counter() - start_time) / count
+        print("\tbatch_ecdh, %4d peers: %8.1f us/peer (%.2fx)" % (
+            batch_size, per_peer_batch * 1e6, per_peer / per_peer_batch))
+
+
+def bench_stealth_table(count=256):
+    import stealth_address
+    print("Stealth addresses for a new MainKey, with and without a public-key table")
+    threshold = stealth_address.PUBLIC_KEY_TABLE_MIN_ADDRESSES
+    size = 8
+    try:
+        while size <= count:
+            times = []
+            for min_addresses in (count + 1, 0):
+                stealth_address.PUBLIC_KEY_TABLE_MIN_ADDRESSES = min_addresses
+                main_key = stealth_address.MainKey()
+                start_time = time.perf_counter()
+                main_key.generate_stealth_address(size)
+                times.append(time.perf_counter() - start_time)
+            print("\t%4d addresses: no table %8.1f ms, table %8.1f ms (%.2fx)%s" % (
+                size, times[0] * 1e3, times[1] * 1e3, times[0] / times[1],
+                "  <- threshold" if size == threshold else ""))
+            size *= 2
+    finally:
+        stealth_address.PUBLIC_KEY_TABLE_MIN_ADDRESSES = threshold
+
+
+def bench_msm(count=1024):
+    print("Multi-scalar multiplication, Strauss tables vs Pippenger buckets")
+    scalars = random_scalars(2 * count)
+    points = [secp256k1.to_jacobian(secp256k1.multiply(secp256k1.G, k)) for k in scalars[:count]]
+    pairs = list(zip(points, scalars[count:]))
+    size = 4
+    while size <= count:
+        strauss = timed(lambda n: secp256k1._jacobian_interleaved(
+            [t for a, k in pairs[:n] for t in secp256k1._glv_terms(a, k, secp256k1.WNAF_WINDOW)]), [size])
+        pippenger = timed(lambda n: secp256k1.jacobian_pippenger_multi_multiply(pairs[:n]), [size])
+        print("\t%5d points: Strauss %8.1f us/point, Pippenger %8.1f us/point (%.2fx)" % (
+            size, strauss / size * 1e6, pippenger / size * 1e6, strauss / pippenger))
+        size *= 4
+
+
+def bench_ibs_batch(count=200):
+    print("Identity signature verification (%d signatures, one identity)" % count)
+    ibs = importlib.import_module("ibs-secpk1")
+    key = ibs.IdentityManager(random_scalars(1)[0]).generate_child_key("child-1")
+    sigs = [("msg-%d" % i,) + key.sign("msg-%d" % i) for i in range(count)]
+    key.verify(*sigs[0])
+
+    per_sig = timed(lambda sig: key.verify(*sig), sigs)
+    print("\tIdentityKey.verify:  %8.1f us/sig" % (per_sig * 1e6))
+    for batch_size in (16, 64, count):
+        start_time = time.perf_counter()
+        for i in range(0, count, batch_size):
+            assert key.batch_verify(sigs[i:i + batch_size]) == []
+        per_sig_batch = (time.perf_counter() - start_time) / count
+        print("\tbatch_verify, %4d: %8.1f us/sig (%.2fx)" % (
+            batch_size, per_sig_batch * 1e6, per_sig / per_sig_batch))
+
+
+BENCHMARKS = {
+    "fixed-base": bench_fixed_base,
+    "variable-base": bench_variable_base,
+    "recover": bench_recover,
+    "verify": bench_verify,
+    "field-backends": bench_field_backends,
+    "enumerate": bench_enumerate,
+    "ecdh": bench_ecdh,
+    "stealth-table": bench_stealth_table,
+    "msm": bench_msm,
+    "ibs-batch": bench_ibs_batch,
+}
+
+
+# Reproducible suite: every case draws its inputs from its own fixed seed,
+# times each call separately and reports throughput and latency
+# percentiles. Results are written as JSON and can be compared against a
+# saved baseline to flag regressions.
+SUITE_SEED = 'bench-secp256k1-suite'
+
+
+def _suite_inputs(name, count):
+    rng = random.Random('%s/%s' % (SUITE_SEED, name))
+    scalars = [rng.randrange(1, secp256k1.N) for _ in range(count)]
+    privs = [k.to_bytes(32, 'big') for k in scalars]
+    msghashes = [rng.getrandbits(256).to_bytes(32, 'big') for _ in range(count)]
+    return rng, scalars, privs, msghashes
+
+
+def suite_cases(count):
+    cases = {}
+
+    def case(fn):
+        cases[fn.__name__[len('case_'):]] = fn
+        return fn
+
+    @case
+    def case_jacobian_double():
+        _, scalars, _, _ = _suite_inputs('jacobian_double', count)
+        points = [secp256k1.to_jacobian(secp256k1.privtopub(p.to_bytes(32, 'big')))
+                  for p in scalars]
+        return secp256k1.jacobian_double, [(p,) for p in points]
+
+    @case
+    def case_jacobian_add():
+        _, scalars, _, _ = _suite_inputs('jacobian_add', count)
+        points = [secp256k1.jacobian_double(
+            secp256k1.to_jacobian(secp256k1.multiply(secp256k1.G, k))) for k in scalars]
+        return secp256k1.jacobian_add, list(zip(points, points[1:] + points[:1]))
+
+    @case
+    def case_inv():
+        rng, _, _, _ = _suite_inputs('inv', count)
+        return secp256k1.inv, [(rng.randrange(1, secp256k1.P), secp256k1.P)
+                               for _ in range(count)]
+
+    @case
+    def case_multiply():
+        _, scalars, _, _ = _suite_inputs('multiply', count)
+        pt = secp256k1.multiply(secp256k1.G, scalars[0])
+        return secp256k1.multiply, [(pt, k) for k in scalars]
+
+    @case
+    def case_privtopub():
+        _, _, privs, _ = _suite_inputs('privtopub', count)
+        return secp256k1.privtopub, [(p,) for p in privs]
+
+    @case
+    def case_ecdsa_raw_sign():
+        _, _, privs, msghashes = _suite_inputs('ecdsa_raw_sign', count)
+        return secp256k1.ecdsa_raw_sign, list(zip(msghashes, privs))
+
+    @case
+    def case_ecdsa_raw_recover():
+        _, _, privs, msghashes = _suite_inputs('ecdsa_raw_recover', count)
+        return secp256k1.ecdsa_raw_recover, [
+            (h, secp256k1.ecdsa_raw_sign(h, p)) for h, p in zip(msghashes, privs)]
+
+    @case
+    def case_pub_to_address():
+        _, _, privs, _ = _suite_inputs('pub_to_address', count)
+        return secp256k1.pub_to_address, [(secp256k1.privtopub(p),) for p in privs]
+
+    return cases
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn, args, warmup=5):
+    for a in args[:warmup]:
+        fn(*a)
+    latencies = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for a in args:
+            start = time.perf_counter_ns()
+            fn(*a)
+            latencies.append(time.perf_counter_ns() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    latencies.sort()
+    return {
+        "iterations": len(latencies),
+        "ops_per_sec": len(latencies) / (sum(latencies) / 1e9),
+        "p50_us": _percentile(latencies, 0.50) / 1e3,
+        "p90_us": _percentile(latencies, 0.90) / 1e3,
+        "p99_us": _percentile(latencies, 0.99) / 1e3,
+    }
+
+
+def run_suite(count, names=None):
+    secp256k1.precompute_base_table()
+    results = {}
+    for name, setup in suite_cases(count).items():
+        if names and name not in names:
+            continue
+        fn, args = setup()
+        results[name] = measure(fn, args)
+        r = results[name]
+        print("\t%-18s %10.0f ops/s  p50 %9.1f us  p90 %9.1f us  p99 %9.1f us" % (
+            name, r["ops_per_sec"], r["p50_us"], r["p90_us"], r["p99_us"]),
+            file=sys.stderr)
+    return {
+        "meta": {
+            "seed": SUITE_SEED,
+            "iterations": count,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "field_backend": secp256k1.FIELD_BACKEND,
+            "multiply_engine": secp256k1.MULTIPLY_ENGINE,
+            "base_table_window": secp256k1.base_table_stats()["window"],
+        },
+        "results": results,
+    }
+
+
+# Cases whose median latency grew by more than threshold (a fraction)
+# relative to the baseline. The median is far less sensitive to scheduler
+# noise than the mean behind ops_per_sec.
+def compare(baseline, current, threshold):
+    regressions = []
+    for name, base in sorted(baseline["results"].items()):
+        if name not in current["results"]:
+            continue
+        p50 = current["results"][name]["p50_us"]
+        slowdown = p50 / base["p50_us"] - 1
+        flag = "REGRESSION" if slowdown > threshold else ""
+        print("\t%-18s p50 %9.1f -> %9.1f us (%+6.1f%%) %s" % (
+            name, base["p50_us"], p50, slowdown * 100, flag), file=sys.stderr)
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="secp256k1 benchmarks")
+    parser.add_argument("benchmarks", nargs="*", metavar="NAME",
+                        help="comparison benchmarks to run (%s), or suite cases "
+                             "with --suite" % ", ".join(BENCHMARKS))
+    parser.add_argument("--suite", action="store_true",
+                        help="run the reproducible per-primitive suite")
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    parser.add_argument("-o", "--output", help="write suite results as JSON")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="compare suite results against a saved JSON file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown fraction flagged as a regression")
+    args = parser.parse_args(argv)
+
+    if not args.suite:
+        for name in args.benchmarks or list(BENCHMARKS):
+            BENCHMARKS[name]()
+            print("\n")
+        return 0
+
+    print("Benchmark suite (%d iterations per case)" % args.iterations,
+          file=sys.stderr)
+    current = run_suite(args.iterations, args.benchmarks)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(current, indent=2, sort_keys=True))
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("Compared to %s:" % args.compare, file=sys.stderr)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print("Regressions: %s" % ", ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
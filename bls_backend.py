@@ -0,0 +1,392 @@
+import sys
+import time
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from py_ecc import (
+    bls12_381,
+    optimized_bls12_381,
+)
+from py_ecc.bls import point_compression
+from py_ecc.optimized_bls12_381 import (
+    add as optimized_add,
+    double as optimized_double,
+    neg as optimized_neg,
+)
+
+# The NAF encoding is curve-independent; secp256k1's is the one both use
+from secp256k1 import wnaf
+
+
+# BLS12-381 backends for the pairing-based modules (identity-signatures,
+# universal-accumulator, kzg-stuff/kzg). Each backend has the same
+# interface: G1/G2/Z1/Z2, curve_order, add/double/neg/multiply,
+# multi_multiply, fixed_base_table/fixed_base_multiply, multiply_base
+# (fixed-base G1), eq, is_inf, is_on_curve_g1, normalize (to affine),
+# serialize_g1 (compressed, the canonical form to hash) and deserialize_g1,
+# pairing and pairing_check. Points are in the backend's own representation,
+# so points from one backend must not be handed to the other.
+#
+# The modules use this module as their curve: attribute lookups that are
+# not defined here (bls_backend.multiply, bls_backend.G1, ...) go to the
+# selected backend, so set_bls_backend switches all of them at once.
+
+curve_order = bls12_381.curve_order
+
+MULTIPLY_WINDOW = 5
+BASE_TABLE_WINDOW = 6
+
+
+# What both backends share, written against their add/double/neg so it works
+# for either point representation and for G1 and G2 alike. An accumulator of
+# None stands for "nothing added yet".
+class BLSBackend:
+
+    name = ""
+    G1: Any = None
+    G2: Any = None
+    Z1: Any = None
+    Z2: Any = None
+    _base_table: Optional[List[List[Any]]] = None
+
+    # The point at infinity of P's group: G2 points have their coordinates in
+    # the same field as G2's, whatever the backend's representation
+    @classmethod
+    def zero_like(cls, P: Any) -> Any:
+        if P is not None and type(P[0]) is type(cls.G2[0]):
+            return cls.Z2
+        return cls.Z1
+
+    # sum(n * P for P, n in pairs), interleaving the wNAF expansions of all
+    # scalars (Strauss) so the doublings are shared: one table of odd
+    # multiples per point, then one doubling per bit for the whole sum.
+    @classmethod
+    def multi_multiply(cls, pairs: List[Tuple[Any, int]]) -> Any:
+        terms = []
+        for P, n in pairs:
+            n %= curve_order
+            if n and not cls.is_inf(P):
+                terms.append((P, wnaf(n, MULTIPLY_WINDOW)))
+        if not terms:
+            return cls.zero_like(pairs[0][0]) if pairs else cls.Z1
+        tables = []
+        for P, _ in terms:
+            twice = cls.double(P)
+            table = [P]
+            for _ in range((1 << (MULTIPLY_WINDOW - 2)) - 1):
+                table.append(cls.add(table[-1], twice))
+            tables.append(table)
+        o = None
+        for i in range(max(len(digits) for _, digits in terms) - 1, -1, -1):
+            if o is not None:
+                o = cls.double(o)
+            for table, (_, digits) in zip(tables, terms):
+                d = digits[i] if i < len(digits) else 0
+                if d > 0:
+                    o = table[d >> 1] if o is None else cls.add(o, table[d >> 1])
+                elif d < 0:
+                    Q = cls.neg(table[-d >> 1])
+                    o = Q if o is None else cls.add(o, Q)
+        return cls.zero_like(terms[0][0]) if o is None else o
+
+    # Row i holds j * 2^(window*i) * P for j = 1 .. 2^window - 1, so n * P is
+    # one addition per window of n and no doublings. Pays off once P is
+    # multiplied by more than a handful of scalars.
+    @classmethod
+    def fixed_base_table(cls, P: Any, window: int = BASE_TABLE_WINDOW) -> List[List[Any]]:
+        rows = []
+        for _ in range((curve_order.bit_length() + window - 1) // window):
+            row = [P]
+            for _ in range((1 << window) - 2):
+                row.append(cls.add(row[-1], P))
+            rows.append(row)
+            P = cls.add(row[-1], P)
+        return rows
+
+    @classmethod
+    def fixed_base_multiply(cls, table: List[List[Any]], n: int) -> Any:
+        window = len(table[0]).bit_length()
+        mask = (1 << window) - 1
+        n %= curve_order
+        o = None
+        for row in table:
+            d = n & mask
+            if d:
+                o = row[d - 1] if o is None else cls.add(o, row[d - 1])
+            n >>= window
+        return cls.zero_like(table[0][0]) if o is None else o
+
+    # The G1 table, built once per backend on first use
+    @classmethod
+    def base_table(cls) -> List[List[Any]]:
+        if cls._base_table is None:
+            cls._base_table = cls.fixed_base_table(cls.G1)
+        return cls._base_table
+
+    # n * G1 from the fixed-base table
+    @classmethod
+    def multiply_base(cls, n: int) -> Any:
+        return cls.fixed_base_multiply(cls.base_table(), n)
+
+
+# py_ecc.bls12_381 as it is: affine points (None at infinity) with an
+# inversion per addition, and a pairing that does a full final
+# exponentiation every time. Kept as the reference the optimized backend is
+# checked against.
+class ReferenceBLSBackend(BLSBackend):
+
+    name = "reference"
+
+    FQ = bls12_381.FQ
+    FQ2 = bls12_381.FQ2
+    FQ12 = bls12_381.FQ12
+    G1 = bls12_381.G1
+    G2 = bls12_381.G2
+    Z1 = bls12_381.Z1
+    Z2 = bls12_381.Z2
+    curve_order = bls12_381.curve_order
+
+    @staticmethod
+    def add(p: Any, q: Any) -> Any:
+        return bls12_381.bls12_381_curve.add(p, q)
+
+    @staticmethod
+    def double(p: Any) -> Any:
+        return bls12_381.bls12_381_curve.double(p)
+
+    @staticmethod
+    def neg(p: Any) -> Any:
+        return bls12_381.bls12_381_curve.neg(p)
+
+    @staticmethod
+    def multiply(p: Any, n: int) -> Any:
+        return bls12_381.bls12_381_curve.multiply(p, n % curve_order)
+
+    @staticmethod
+    def eq(p: Any, q: Any) -> bool:
+        return p == q
+
+    @staticmethod
+    def is_on_curve_g1(p: Any) -> bool:
+        return bls12_381.is_on_curve(p, bls12_381.b)
+
+    @staticmethod
+    def is_inf(p: Any) -> bool:
+        return p is None
+
+    @staticmethod
+    def normalize(p: Any) -> Any:
+        return p
+
+    @staticmethod
+    def serialize_g1(p: Any) -> bytes:
+        if p is None:
+            pt = optimized_bls12_381.Z1
+        else:
+            pt = (optimized_bls12_381.FQ(p[0].n), optimized_bls12_381.FQ(p[1].n),
+                  optimized_bls12_381.FQ.one())
+        return point_compression.compress_G1(pt).to_bytes(48, "big")
+
+    @staticmethod
+    def deserialize_g1(data: bytes) -> Any:
+        pt = point_compression.decompress_G1(int.from_bytes(data, "big"))
+        if optimized_bls12_381.is_inf(pt):
+            return None
+        x, y = optimized_bls12_381.normalize(pt)
+        return (bls12_381.FQ(x.n), bls12_381.FQ(y.n))
+
+    @staticmethod
+    def pairing(Q: Any, P: Any) -> Any:
+        return bls12_381.bls12_381_pairing.pairing(Q, P)
+
+    @staticmethod
+    def pairing_check(pairs: List[Tuple[Any, Any]]) -> bool:
+        result = bls12_381.FQ12.one()
+        for Q, P in pairs:
+            result = result * bls12_381.bls12_381_pairing.pairing(Q, P)
+        return result == bls12_381.FQ12.one()
+
+
+# py_ecc.optimized_bls12_381: projective points, so additions and doublings
+# need no inversion, and a pairing whose final exponentiation is split into
+# Frobenius maps and a short power. Scalar multiplication is wNAF over the
+# projective formulas, and pairing_check multiplies Miller loops together
+# and exponentiates once.
+class OptimizedBLSBackend(BLSBackend):
+
+    name = "optimized"
+
+    FQ = optimized_bls12_381.FQ
+    FQ2 = optimized_bls12_381.FQ2
+    FQ12 = optimized_bls12_381.FQ12
+    G1 = optimized_bls12_381.G1
+    G2 = optimized_bls12_381.G2
+    Z1 = optimized_bls12_381.Z1
+    Z2 = optimized_bls12_381.Z2
+    curve_order = optimized_bls12_381.curve_order
+
+    @staticmethod
+    def add(p: Any, q: Any) -> Any:
+        return optimized_add(p, q)
+
+    @staticmethod
+    def double(p: Any) -> Any:
+        return optimized_double(p)
+
+    @staticmethod
+    def neg(p: Any) -> Any:
+        return optimized_neg(p)
+
+    @classmethod
+    def multiply(cls, p: Any, n: int) -> Any:
+        return cls.multi_multiply([(p, n)])
+
+    @staticmethod
+    def eq(p: Any, q: Any) -> bool:
+        return optimized_bls12_381.eq(p, q)
+
+    @staticmethod
+    def is_on_curve_g1(p: Any) -> bool:
+        return optimized_bls12_381.is_on_curve(p, optimized_bls12_381.b)
+
+    @staticmethod
+    def is_inf(p: Any) -> bool:
+        return optimized_bls12_381.is_inf(p)
+
+    @staticmethod
+    def normalize(p: Any) -> Any:
+        if optimized_bls12_381.is_inf(p):
+            return None
+        return optimized_bls12_381.normalize(p)
+
+    @staticmethod
+    def serialize_g1(p: Any) -> bytes:
+        return point_compression.compress_G1(p).to_bytes(48, "big")
+
+    @staticmethod
+    def deserialize_g1(data: bytes) -> Any:
+        return point_compression.decompress_G1(int.from_bytes(data, "big"))
+
+    @staticmethod
+    def pairing(Q: Any, P: Any) -> Any:
+        return optimized_bls12_381.pairing(Q, P)
+
+    @staticmethod
+    def pairing_check(pairs: List[Tuple[Any, Any]]) -> bool:
+        result = optimized_bls12_381.FQ12.one()
+        for Q, P in pairs:
+            result = result * optimized_bls12_381.pairing(Q, P, final_exponentiate=False)
+        return optimized_bls12_381.final_exponentiate(result) == optimized_bls12_381.FQ12.one()
+
+
+BLS_BACKENDS: Dict[str, Any] = {
+    "reference": ReferenceBLSBackend,
+    "optimized": OptimizedBLSBackend,
+}
+BLS_BACKEND = "optimized"
+_backend: Any = BLS_BACKENDS[BLS_BACKEND]
+
+
+def set_bls_backend(name: str) -> None:
+    global BLS_BACKEND, _backend
+    if name not in BLS_BACKENDS:
+        raise ValueError("unknown BLS backend %r, expected one of %s" % (
+            name, ", ".join(sorted(BLS_BACKENDS))))
+    BLS_BACKEND = name
+    _backend = BLS_BACKENDS[name]
+
+
+def get_bls_backend() -> Any:
+    return _backend
+
+
+def __getattr__(name: str) -> Any:
+    if name.startswith("__"):
+        raise AttributeError(name)
+    return getattr(_backend, name)
+
+
+# Time the same operations under every backend
+def timing_table(operations: List[Tuple[str, Callable[[], Any]]], backends: Optional[List[str]] = None) -> str:
+    backends = backends or list(BLS_BACKENDS)
+    previous = BLS_BACKEND
+    times: Dict[str, Dict[str, float]] = {}
+    try:
+        for name in backends:
+            set_bls_backend(name)
+            times[name] = {}
+            for label, operation in operations:
+                start = time.perf_counter()
+                operation()
+                times[name][label] = time.perf_counter() - start
+    finally:
+        set_bls_backend(previous)
+    width = max(len(label) for label, _ in operations)
+    lines = ["%-*s" % (width, "operation") + "".join("%12s" % name for name in backends) +
+             ("%10s" % "speedup" if len(backends) == 2 else "")]
+    for label, _ in operations:
+        row = "%-*s" % (width, label) + "".join("%11.3fs" % times[name][label] for name in backends)
+        if len(backends) == 2:
+            row += "%9.1fx" % (times[backends[0]][label] / times[backends[1]][label])
+        lines.append(row)
+    return "\n".join(lines)
+
+
+def main() -> None:
+    import importlib
+    import os
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:0] = [here, os.path.join(here, "kzg-stuff")]
+    import kzg
+    bls_ibs = importlib.import_module("identity-signatures")
+    accumulator = importlib.import_module("universal-accumulator")
+
+    scalar = 0x1234567890abcdef1234567890abcdef1234567890abcdef1234567890abcdef
+    state: Dict[str, Any] = {}
+
+    def kzg_setup() -> None:
+        state["setup"] = kzg.trusted_setup(4)
+        points, state["polynomial"] = kzg.encode_as_polynomial(b'\x99' * 100, 4)
+        state["point"] = points[2]
+
+    def kzg_prove() -> None:
+        setup_g1, _ = state["setup"]
+        state["commitment"] = kzg.commit(state["polynomial"], setup_g1)
+        state["proof"] = kzg.proof(state["polynomial"], state["point"], setup_g1)
+
+    def kzg_verify() -> None:
+        assert kzg.verify(state["commitment"], state["proof"], state["point"], state["setup"][1])
+
+    def accumulator_witness() -> None:
+        acc = accumulator.Accumulator(scalar)
+        acc.batch_add_elements(["1", "2"])
+        assert acc.verify_membership_witness(acc.generate_membership_witness("1"), "1")
+
+    def ibs_round_trip() -> None:
+        key = bls_ibs.IdentityManager(scalar).generate_child_key("child-1")
+        assert key.verify("msg", *key.sign("msg"))
+
+    print(timing_table([
+        ("G1 multiply", lambda: get_bls_backend().multiply(get_bls_backend().G1, scalar)),
+        ("G2 multiply", lambda: get_bls_backend().multiply(get_bls_backend().G2, scalar)),
+        ("pairing", lambda: get_bls_backend().pairing(get_bls_backend().G2, get_bls_backend().G1)),
+        ("kzg trusted_setup(4)", kzg_setup),
+        ("kzg commit + proof", kzg_prove),
+        ("kzg verify", kzg_verify),
+        ("accumulator add 2 + witness check", accumulator_witness),
+        ("identity-signatures keygen/sign/verify", ibs_round_trip),
+    ]))
+
+
+if __name__ == "__main__":
+    # The modules import bls_backend, not __main__: time through that copy
+    # so switching backends reaches them
+    import bls_backend
+    bls_backend.main()
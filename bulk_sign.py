@@ -0,0 +1,128 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+from typing import (
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+import parallel
+import secp256k1
+
+
+# Every worker builds the generator table once, before its first chunk
+def _init_worker(window: int) -> None:
+    secp256k1.precompute_base_table(window)
+
+
+def _sign_chunk(chunk: List[Tuple[bytes, bytes]]) -> List[Tuple[int, int, int]]:
+    return [secp256k1.ecdsa_raw_sign(msghash, priv) for msghash, priv in chunk]
+
+
+# Sign (msghash, privkey) records on a process pool and yield (v, r, s) in
+# input order. Records are pulled lazily and at most max_pending chunks are
+# in flight, so memory stays bounded however long the input is.
+def bulk_sign(
+    records: Iterable[Tuple[bytes, bytes]],
+    workers: Optional[int] = None,
+    chunk_size: int = 256,
+    max_pending: Optional[int] = None,
+    window: int = secp256k1.BASE_TABLE_WINDOW,
+) -> Iterator[Tuple[int, int, int]]:
+    workers = workers or os.cpu_count() or 1
+    for signatures in parallel.imap_ordered(
+            _sign_chunk, ((chunk,) for chunk in parallel.chunks(records, chunk_size)),
+            workers, _init_worker, (window,), max_pending):
+        yield from signatures
+
+
+# One record per line: hex msghash and hex private key separated by whitespace
+def read_records(f: TextIO) -> Iterator[Tuple[bytes, bytes]]:
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            msghash, priv = line.split()
+            record = (bytes.fromhex(msghash), bytes.fromhex(priv))
+        except ValueError:
+            raise ValueError("line %d: expected '<msghash hex> <privkey hex>'" % lineno)
+        if len(record[0]) != 32 or len(record[1]) != 32:
+            raise ValueError("line %d: msghash and privkey must be 32 bytes" % lineno)
+        yield record
+
+
+def write_signatures(f: TextIO, signatures: Iterable[Tuple[int, int, int]]) -> int:
+    count = 0
+    for v, r, s in signatures:
+        f.write("%d %064x %064x\n" % (v, r, s))
+        count += 1
+    return count
+
+
+def random_records(count: int, seed: str = 'bulk-sign') -> List[Tuple[bytes, bytes]]:
+    rng = random.Random(seed)
+    return [(rng.getrandbits(256).to_bytes(32, 'big'),
+             rng.randrange(1, secp256k1.N).to_bytes(32, 'big'))
+            for _ in range(count)]
+
+
+def benchmark(count: int, worker_counts: List[int], chunk_size: int) -> None:
+    records = random_records(count)
+    print("Bulk signing %d messages" % count)
+    baseline = None
+    for workers in worker_counts:
+        start_time = time.perf_counter()
+        for _ in bulk_sign(records, workers, chunk_size):
+            pass
+        t = time.perf_counter() - start_time
+        baseline = baseline or t
+        print("\t%2d workers: %8.0f sigs/s (took %.2fs, %.2fx)" % (
+            workers, count / t, t, baseline / t))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Sign a stream of 32-byte message hashes with ecdsa_raw_sign")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="file of '<msghash hex> <privkey hex>' lines, - for stdin")
+    parser.add_argument("-o", "--output", default="-",
+                        help="where to write '<v> <r hex> <s hex>' lines, - for stdout")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--benchmark", type=int, metavar="COUNT",
+                        help="sign COUNT random messages with 1..WORKERS workers "
+                             "and report throughput")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        worker_counts = sorted({1, args.workers} | {
+            w for w in (2, 4, 8, 16, 32) if w < args.workers})
+        benchmark(args.benchmark, worker_counts, args.chunk_size)
+        return
+
+    fin = sys.stdin if args.input == "-" else open(args.input)
+    fout = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        start_time = time.perf_counter()
+        count = write_signatures(
+            fout, bulk_sign(read_records(fin), args.workers, args.chunk_size))
+        t = time.perf_counter() - start_time
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+    print("Signed %d messages with %d workers (took %.2fs, %.0f sigs/s)" % (
+        count, args.workers, t, count / t if t else 0), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
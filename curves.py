@@ -0,0 +1,172 @@
+import hashlib
+import os
+import struct
+
+from typing import (
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from atomic_file import atomic_write
+
+
+# Parameters of the short Weierstrass curve y^2 = x^3 + ax + b over GF(p),
+# with generator (Gx, Gy) of prime order n
+class CurveParameters(NamedTuple):
+    name: str
+    p: int
+    a: int
+    b: int
+    Gx: int
+    Gy: int
+    n: int
+
+
+SECP256K1 = CurveParameters(
+    "secp256k1",
+    2**256 - 2**32 - 977,
+    0,
+    7,
+    55066263022277343669578718895168534326250603453777594175500187360389116729240,
+    32670510020758816978083085130507043184471273380659243275938904335757337482424,
+    115792089237316195423570985008687907852837564279074904382605163141518161494337,
+)
+
+P256 = CurveParameters(
+    "P-256",
+    2**256 - 2**224 + 2**192 + 2**96 - 1,
+    -3,
+    0x5ac635d8aa3a93e7b3ebbd55769886bc651d06b0cc53b0f63bce3c3e27d2604b,
+    0x6b17d1f2e12c4247f8bce6e563a440f277037d812deb33a0f4a13945d898c296,
+    0x4fe342e2fe1a7f9b8ee7eb4a7c0f9e162bce33576b315ececbb6406837bf51f5,
+    0xffffffff00000000ffffffffffffffffbce6faada7179e84f3b9cac2fc632551,
+)
+
+CURVE_PARAMETERS: Dict[str, CurveParameters] = {
+    SECP256K1.name: SECP256K1,
+    P256.name: P256,
+}
+
+
+# Persisted fixed-base tables. A table is rows of affine points; on disk it
+# is a small header followed by every point as fixed-width big-endian x || y,
+# so a later process reads the points back instead of redoing the table's
+# thousands of point additions.
+#
+# Files are keyed on a digest of the curve parameters and the window, so a
+# user-supplied curve never picks up another curve's table. The directory is
+# EC_BASEPOINT_CACHE if set, else ~/.cache/ec-basepoint (under
+# XDG_CACHE_HOME when that is set).
+#
+# Every key derived from a table is only as good as the table, so a file is
+# trusted only if its SHA-256 digest matches and spot checks pass: row 0
+# starts with the generator, and the first row and the ends of every other
+# row are on the curve. Anything else is rebuilt and rewritten.
+
+CACHE_ENV = "EC_BASEPOINT_CACHE"
+
+_MAGIC = b"ECFB"
+_VERSION = 2
+# magic, version, window, rows, row width, coordinate bytes, SHA-256 of the
+# points
+_HEADER = struct.Struct(">4sHHIII32s")
+
+
+def default_cache_dir() -> str:
+    if os.environ.get(CACHE_ENV):
+        return os.environ[CACHE_ENV]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ec-basepoint")
+
+
+def table_path(params: CurveParameters, window: int, cache_dir: Optional[str] = None) -> str:
+    digest = hashlib.sha256(repr(tuple(params[1:]) + (window,)).encode()).hexdigest()
+    name = "".join(c if c.isalnum() else "-" for c in params.name) or "curve"
+    return os.path.join(cache_dir or default_cache_dir(),
+                        "%s-w%d-%s.table" % (name, window, digest[:16]))
+
+
+def _coordinate_size(params: CurveParameters) -> int:
+    return (params.p.bit_length() + 7) // 8
+
+
+def _on_curve(params: CurveParameters, pt: Optional[Tuple[int, int]]) -> bool:
+    if pt is None:
+        return True
+    x, y = pt
+    return (y * y - x * x * x - params.a * x - params.b) % params.p == 0
+
+
+# Rows of the table stored at path. Raises ValueError unless the file is a
+# complete, intact window-sized table for params. Infinity, which only shows
+# up on toy curves, is stored as x = y = p.
+def read_table(path: str, params: CurveParameters, window: int) -> List[List[Optional[Tuple[int, int]]]]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        raise ValueError("%s is truncated" % path)
+    magic, version, file_window, rows, width, size, digest = _HEADER.unpack_from(data)
+    body = data[_HEADER.size:]
+    if (magic, version, file_window, size) != (_MAGIC, _VERSION, window, _coordinate_size(params)) \
+            or len(body) != rows * width * 2 * size or not rows or not width:
+        raise ValueError("%s is not a window %d table for %s" % (path, window, params.name))
+    if hashlib.sha256(body).digest() != digest:
+        raise ValueError("%s is corrupt: digest mismatch" % path)
+    table = []
+    offset = 0
+    for _ in range(rows):
+        row: List[Optional[Tuple[int, int]]] = []
+        for _ in range(width):
+            x = int.from_bytes(body[offset:offset + size], "big")
+            y = int.from_bytes(body[offset + size:offset + 2 * size], "big")
+            row.append(None if x == params.p else (x, y))
+            offset += 2 * size
+        table.append(row)
+    if table[0][0] != (params.Gx, params.Gy) or not all(
+            _on_curve(params, pt) for pt in table[0] + [pt for row in table for pt in (row[0], row[-1])]):
+        raise ValueError("%s is corrupt: points are not multiples of the generator" % path)
+    return table
+
+
+def write_table(path: str, params: CurveParameters, window: int,
+                rows: List[List[Optional[Tuple[int, int]]]]) -> None:
+    size = _coordinate_size(params)
+    infinity = params.p.to_bytes(size, "big") * 2
+    body = b"".join(infinity if pt is None else
+                    int(pt[0]).to_bytes(size, "big") + int(pt[1]).to_bytes(size, "big")
+                    for row in rows for pt in row)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Concurrent processes see either no table or a complete one
+    with atomic_write(path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, window, len(rows), len(rows[0]), size,
+                             hashlib.sha256(body).digest()))
+        f.write(body)
+
+
+# Rows of the cached table for (params, window), building them with build()
+# and persisting them first if there is no usable cache file: missing,
+# from an older format, or failing its integrity checks. Also returns
+# whether the rows came from the cache. A cache directory that cannot be
+# written only costs the persistence, not the table.
+def load_fixed_base_table(
+    params: CurveParameters,
+    window: int,
+    build: Callable[[], List[List[Optional[Tuple[int, int]]]]],
+    cache_dir: Optional[str] = None,
+) -> Tuple[List[List[Optional[Tuple[int, int]]]], bool]:
+    path = table_path(params, window, cache_dir)
+    try:
+        return read_table(path, params, window), True
+    except (OSError, ValueError, struct.error):
+        pass
+    rows = build()
+    try:
+        write_table(path, params, window, rows)
+    except OSError:
+        pass
+    return rows, False
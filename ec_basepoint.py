@@ -1,14 +1,37 @@
 
 import random
 
+import curves
+
 INF_POINT = None
 
+BASE_TABLE_WINDOW = 6
+
 
 class EllipticCurve:
-    def __init__(self, p, a, b):
+    # G and n (the generator and its order) are optional; a curve that has
+    # them gets a fixed-base table for multiples of G, built on first use
+    # and persisted in the curves cache under cache_dir.
+    def __init__(self, p, a, b, G=None, n=None, name=None, cache_dir=None):
         self.p = p
         self.a = a
         self.b = b
+        self.G = G
+        self.n = n
+        self.name = name
+        self.cache_dir = cache_dir
+        self._base_table = None
+
+    @classmethod
+    def from_parameters(cls, params, cache_dir=None):
+        return cls(params.p, params.a, params.b, (params.Gx, params.Gy),
+                   params.n, params.name, cache_dir)
+
+    def parameters(self):
+        if self.G is None or self.n is None:
+            raise ValueError("curve has no generator")
+        return curves.CurveParameters(
+            self.name or "", self.p, self.a, self.b, self.G[0], self.G[1], self.n)
 
     def addition(self, P1, P2):
         if P1 == INF_POINT:
@@ -33,19 +56,201 @@ class EllipticCurve:
         y3 = self.reduce_modp(-u * x3 - v)
         return (x3, y3)
 
-    def multiple(self, k, P):
-        Q = INF_POINT
-        i = 0
-        j = 0
-        while k != 0:
-            if k & 1 != 0:
-                i += 1
-                Q = self.addition(Q, P)
-            j += 1
-            P = self.addition(P, P)
-            k >>= 1
+    # Sliding-window multiplication in Jacobian coordinates: the only
+    # inversion is the final conversion back to affine. Multiples of the
+    # generator go through the fixed-base table instead.
+    def multiple(self, k, P, window=None):
+        if P == INF_POINT or k == 0:
+            return INF_POINT
+        if window is None and P == self.G and self.n is not None:
+            return self.multiple_base(k)
+        if window is None:
+            window = self.window_size(k)
+        return self.from_jacobian(self.jacobian_multiple(
+            self.sliding_window(k, window), self.to_jacobian(P), window))
+
+    # ECDH with one private key against many public keys: k is recoded once,
+    # every base reuses the recoding, and all the shared points are
+    # normalized with a single inversion. Results are in input order.
+    def batch_ecdh(self, k, points, window=None):
+        for i, P in enumerate(points):
+            if P == INF_POINT or not self.is_point_on_curve(*P):
+                raise ValueError("public key %d is not a point on the curve" % i)
+        if k == 0:
+            return [INF_POINT] * len(points)
+        if window is None:
+            window = self.window_size(k)
+        steps = self.sliding_window(k, window)
+        return self.batch_from_jacobian([
+            self.jacobian_multiple(steps, self.to_jacobian(P), window) for P in points])
+
+    # Recode k, most significant part first, as (doublings, digit) steps:
+    # double that many times, then add digit * P. Every digit is odd and
+    # below 2^window.
+    @staticmethod
+    def sliding_window(k, window):
+        steps = []
+        doublings = 0
+        i = k.bit_length() - 1
+        while i >= 0:
+            if not (k >> i) & 1:
+                doublings += 1
+                i -= 1
+                continue
+            # Longest window of at most `window` bits ending in a set bit
+            j = max(i - window + 1, 0)
+            while not (k >> j) & 1:
+                j += 1
+            steps.append((doublings + i - j + 1, (k >> j) & ((1 << (i - j + 1)) - 1)))
+            doublings = 0
+            i = j - 1
+        steps.append((doublings, 0))
+        return steps
+
+    def jacobian_multiple(self, steps, P1, window):
+        table = self.jacobian_odd_multiples(P1, window)
+        Q = self.to_jacobian(INF_POINT)
+        for doublings, digit in steps:
+            for _ in range(doublings):
+                Q = self.jacobian_double(Q)
+            if digit:
+                Q = self.jacobian_add(Q, table[digit >> 1])
         return Q
 
+    # Row i of the table holds d * 2^(window * i) * G for every window digit
+    # d, so k * G is one addition per window of k and no doublings.
+    def fixed_base_table(self, window=BASE_TABLE_WINDOW):
+        if self._base_table is None or self._base_table[0] != window:
+            rows, _ = curves.load_fixed_base_table(
+                self.parameters(), window,
+                lambda: self.build_fixed_base_table(window), self.cache_dir)
+            self._base_table = (window, rows)
+        return self._base_table
+
+    def build_fixed_base_table(self, window):
+        rows = []
+        base = self.to_jacobian(self.G)
+        for _ in range((self.n.bit_length() + window - 1) // window):
+            row = [base]
+            for _ in range((1 << window) - 2):
+                row.append(self.jacobian_add(row[-1], base))
+            rows.append(row)
+            base = self.jacobian_add(row[-1], base)
+        flat = self.batch_from_jacobian([P1 for row in rows for P1 in row])
+        width = (1 << window) - 1
+        return [flat[i:i + width] for i in range(0, len(flat), width)]
+
+    def multiple_base(self, k):
+        window, rows = self.fixed_base_table()
+        k %= self.n
+        mask = (1 << window) - 1
+        Q = self.to_jacobian(INF_POINT)
+        for row in rows:
+            if not k:
+                break
+            d = k & mask
+            if d:
+                Q = self.jacobian_add(Q, self.to_jacobian(row[d - 1]))
+            k >>= window
+        return self.from_jacobian(Q)
+
+    @staticmethod
+    def window_size(k):
+        bits = k.bit_length()
+        if bits <= 16:
+            return 1
+        if bits <= 64:
+            return 3
+        if bits <= 320:
+            return 4
+        return 5
+
+    # Jacobian coordinates: (X, Y, Z) stands for (X / Z^2, Y / Z^3), and any
+    # point with Z == 0 is the point at infinity. The formulas are the
+    # general short Weierstrass ones, so the curve's own a term is honoured.
+
+    def to_jacobian(self, P1):
+        if P1 == INF_POINT:
+            return (1, 1, 0)
+        (x1, y1) = P1
+        return (x1, y1, 1)
+
+    def from_jacobian(self, P1):
+        (X1, Y1, Z1) = P1
+        if self.reduce_modp(Z1) == 0:
+            return INF_POINT
+        z = self.inverse_modp(Z1)
+        zz = self.reduce_modp(z * z)
+        return (self.reduce_modp(X1 * zz), self.reduce_modp(Y1 * zz * z))
+
+    # Normalize many points with a single inversion (Montgomery's trick)
+    def batch_from_jacobian(self, points):
+        prefix = []
+        acc = 1
+        for (_, _, Z1) in points:
+            prefix.append(acc)
+            if self.reduce_modp(Z1):
+                acc = self.reduce_modp(acc * Z1)
+        acc_inv = self.inverse_modp(acc)
+        out = [INF_POINT] * len(points)
+        for i in range(len(points) - 1, -1, -1):
+            (X1, Y1, Z1) = points[i]
+            if not self.reduce_modp(Z1):
+                continue
+            z = self.reduce_modp(acc_inv * prefix[i])
+            acc_inv = self.reduce_modp(acc_inv * Z1)
+            zz = self.reduce_modp(z * z)
+            out[i] = (self.reduce_modp(X1 * zz), self.reduce_modp(Y1 * zz * z))
+        return out
+
+    def jacobian_double(self, P1):
+        (X1, Y1, Z1) = P1
+        if self.reduce_modp(Z1) == 0 or self.reduce_modp(Y1) == 0:
+            return (1, 1, 0)
+        YY = self.reduce_modp(Y1 * Y1)
+        S = self.reduce_modp(4 * X1 * YY)
+        ZZ = self.reduce_modp(Z1 * Z1)
+        M = self.reduce_modp(3 * X1 * X1 + self.a * ZZ * ZZ)
+        X3 = self.reduce_modp(M * M - 2 * S)
+        Y3 = self.reduce_modp(M * (S - X3) - 8 * YY * YY)
+        Z3 = self.reduce_modp(2 * Y1 * Z1)
+        return (X3, Y3, Z3)
+
+    def jacobian_add(self, P1, P2):
+        (X1, Y1, Z1) = P1
+        (X2, Y2, Z2) = P2
+        if self.reduce_modp(Z1) == 0:
+            return P2
+        if self.reduce_modp(Z2) == 0:
+            return P1
+        Z1Z1 = self.reduce_modp(Z1 * Z1)
+        Z2Z2 = self.reduce_modp(Z2 * Z2)
+        U1 = self.reduce_modp(X1 * Z2Z2)
+        U2 = self.reduce_modp(X2 * Z1Z1)
+        S1 = self.reduce_modp(Y1 * Z2 * Z2Z2)
+        S2 = self.reduce_modp(Y2 * Z1 * Z1Z1)
+        if U1 == U2:
+            if S1 != S2:
+                return (1, 1, 0)
+            return self.jacobian_double(P1)
+        H = U2 - U1
+        R = S2 - S1
+        HH = self.reduce_modp(H * H)
+        HHH = self.reduce_modp(H * HH)
+        U1HH = self.reduce_modp(U1 * HH)
+        X3 = self.reduce_modp(R * R - HHH - 2 * U1HH)
+        Y3 = self.reduce_modp(R * (U1HH - X3) - S1 * HHH)
+        Z3 = self.reduce_modp(H * Z1 * Z2)
+        return (X3, Y3, Z3)
+
+    # P, 3P, 5P, ..., (2^window - 1)P
+    def jacobian_odd_multiples(self, P1, window):
+        twice = self.jacobian_double(P1)
+        table = [P1]
+        for _ in range((1 << (window - 1)) - 1):
+            table.append(self.jacobian_add(table[-1], twice))
+        return table
+
     def is_point_on_curve(self, x, y):
         return self.equal_modp(y * y, x * x * x + self.a * x + self.b)
 
@@ -60,81 +265,101 @@ class EllipticCurve:
     def inverse_modp(self, x):
         if self.reduce_modp(x) == 0:
             return None
-        return pow(x, p - 2, p)
+        return pow(x, self.p - 2, self.p)
 
 
-p = 2**256 - 2**32 - 977
-a = 0
-b = 7
+# Named curves, built from the parameters in curves.py on first lookup.
+# register_curve adds user-supplied curves (which need a generator and its
+# order) under their own name.
+CURVES = {}
 
-SECPK1_256 = EllipticCurve(p, a, b)
 
-Gx = 55066263022277343669578718895168534326250603453777594175500187360389116729240
-Gy = 32670510020758816978083085130507043184471273380659243275938904335757337482424
-G = (Gx, Gy)
+def register_curve(curve):
+    if not curve.name:
+        raise ValueError("curve needs a name to be registered")
+    if curve.G is None or curve.n is None:
+        raise ValueError("curve %s has no generator" % curve.name)
+    if not curve.is_point_on_curve(*curve.G):
+        raise ValueError("generator of %s is not on the curve" % curve.name)
+    CURVES[curve.name] = curve
+    return curve
 
-print("Check that generator point is on curve: %s" %
-      SECPK1_256.is_point_on_curve(Gx, Gy))
 
-Q = SECPK1_256.multiple(1, G)
-print("Check generator point times 1 is equal to itself: %s" % (Q == G))
+def get_curve(name):
+    if name not in CURVES:
+        if name not in curves.CURVE_PARAMETERS:
+            raise KeyError("unknown curve %r" % name)
+        register_curve(EllipticCurve.from_parameters(curves.CURVE_PARAMETERS[name]))
+    return CURVES[name]
 
 
-# Number of points in SECPK1_256 sub-group
-n = 115792089237316195423570985008687907852837564279074904382605163141518161494337
+SECPK1_256 = get_curve("secp256k1")
+
+p = SECPK1_256.p
+a = SECPK1_256.a
+b = SECPK1_256.b
 
-Q = SECPK1_256.multiple(n - 1, G)
+Gx, Gy = SECPK1_256.G
+G = SECPK1_256.G
 
-print("Multiply the generator point by 1 minus the size of the sub-group (last point in group) result: \n\n\tX:%i\n\tY:%i\n" % Q)
+# Number of points in SECPK1_256 sub-group
+n = SECPK1_256.n
 
 
-print("Check to make sure the last point in the group is on the curve: %s" %
-      (SECPK1_256.is_point_on_curve(Q[0], Q[1])))
+if __name__ == "__main__":
+    print("Check that generator point is on curve: %s" %
+          SECPK1_256.is_point_on_curve(Gx, Gy))
 
-Q = SECPK1_256.multiple(n, G)
-print("Check that the group loops back around to the first element of the group (point at infinity): %s" % (Q == INF_POINT))
+    Q = SECPK1_256.multiple(1, G)
+    print("Check generator point times 1 is equal to itself: %s" % (Q == G))
 
+    Q = SECPK1_256.multiple(n - 1, G)
 
-Z = SECPK1_256.multiple(n+1, G)
-print("Check that the group loops back around to the second element of the group (generator point): %s" % (Z == G))
+    print("Multiply the generator point by 1 minus the size of the sub-group (last point in group) result: \n\n\tX:%i\n\tY:%i\n" % Q)
 
+    print("Check to make sure the last point in the group is on the curve: %s" %
+          (SECPK1_256.is_point_on_curve(Q[0], Q[1])))
 
-alice_private_key = random.randint(0, 2**256)
-print("\nGenerate random SECPK1_256 private key for Alice:\n\n\t%s\n" %
-      alice_private_key)
+    Q = SECPK1_256.multiple(n, G)
+    print("Check that the group loops back around to the first element of the group (point at infinity): %s" % (Q == INF_POINT))
 
-alice_public_key = SECPK1_256.multiple(alice_private_key, G)
-print("Generate the associated public key for Alice's private key: \n\n\tX:%i\n\tY:%i\n" %
-      alice_public_key)
+    Z = SECPK1_256.multiple(n+1, G)
+    print("Check that the group loops back around to the second element of the group (generator point): %s" % (Z == G))
 
-bob_private_key = random.randint(0, 2**256)
-print("\nGenerate random SECPK1_256 private key for Bob:\n\n\t%s\n" %
-      bob_private_key)
+    alice_private_key = random.randint(0, 2**256)
+    print("\nGenerate random SECPK1_256 private key for Alice:\n\n\t%s\n" %
+          alice_private_key)
 
-bob_public_key = SECPK1_256.multiple(bob_private_key, G)
-print("Generate the associated public key for Bob's private key: \n\n\tX:%i\n\tY:%i\n" % bob_public_key)
+    alice_public_key = SECPK1_256.multiple(alice_private_key, G)
+    print("Generate the associated public key for Alice's private key: \n\n\tX:%i\n\tY:%i\n" %
+          alice_public_key)
 
+    bob_private_key = random.randint(0, 2**256)
+    print("\nGenerate random SECPK1_256 private key for Bob:\n\n\t%s\n" %
+          bob_private_key)
 
-alice_ecdh = SECPK1_256.multiple(alice_private_key, bob_public_key)
-bob_ecdh = SECPK1_256.multiple(bob_private_key, alice_public_key)
+    bob_public_key = SECPK1_256.multiple(bob_private_key, G)
+    print("Generate the associated public key for Bob's private key: \n\n\tX:%i\n\tY:%i\n" % bob_public_key)
 
-print("Generated ECDH shared secret: \n\n\tX:%i\n\tY:%i\n" % alice_ecdh)
+    alice_ecdh = SECPK1_256.multiple(alice_private_key, bob_public_key)
+    bob_ecdh = SECPK1_256.multiple(bob_private_key, alice_public_key)
 
-print("Check both Alice and Bob generate the same shared secret: %s" %
-      (alice_ecdh == bob_ecdh))
+    print("Generated ECDH shared secret: \n\n\tX:%i\n\tY:%i\n" % alice_ecdh)
 
-# For funsies
+    print("Check both Alice and Bob generate the same shared secret: %s" %
+          (alice_ecdh == bob_ecdh))
 
-combined_private_key = alice_private_key * bob_private_key
+    # For funsies
 
-combined_key_public_key = SECPK1_256.multiple(combined_private_key, G)
+    combined_private_key = alice_private_key * bob_private_key
 
-print("Check combining private keys is equivalent to ECDH: %s" %
-      (alice_ecdh == combined_key_public_key))
+    combined_key_public_key = SECPK1_256.multiple(combined_private_key, G)
 
+    print("Check combining private keys is equivalent to ECDH: %s" %
+          (alice_ecdh == combined_key_public_key))
 
-print("\n\n\n")
+    print("\n\n\n")
 
-# Do an ecdh from alice to herself.
-alice_ecdh_self = SECPK1_256.multiple(alice_private_key, alice_public_key)
-print("Generate the ECDH from Alice to herself: \n\n\tX:%i\n\tY:%i\n" % alice_ecdh_self)
+    # Do an ecdh from alice to herself.
+    alice_ecdh_self = SECPK1_256.multiple(alice_private_key, alice_public_key)
+    print("Generate the ECDH from Alice to herself: \n\n\tX:%i\n\tY:%i\n" % alice_ecdh_self)
@@ -1,4 +1,3 @@
-import sys
 import random
 import pytest
 
@@ -7,17 +6,18 @@ from py_ecc.utils import (
     prime_field_inv,
 )
 
+import secrets
 from hashlib import sha384
+from typing import Dict, List, Optional, Tuple, cast
 import secp256k1
 from py_ecc.typing import (
-    PlainPoint2D
+    PlainPoint2D,
+    PlainPoint3D,
 )
 
 
 random.seed(a='tests2', version=2)
 
-sys.setrecursionlimit(10000000)
-
 
 def string_to_number(id: str) -> int:
     id_hash = sha384(id.encode("utf-8")).digest()
@@ -28,16 +28,19 @@ def random_scalar():
     return random.randint(0, secp256k1.N) % secp256k1.N
 
 
+# Points are hashed in their compressed SEC1 encoding, which is fixed-width
+# and canonical (unlike str(), which also depends on how the coordinates
+# happen to be represented)
 def hash_message(msg: str, id: str, Ga: 'PlainPoint2D') -> int:
     hsh = sha384(msg.encode("utf-8"))
     hsh.update(id.encode("utf-8"))
-    hsh.update(str(Ga).encode("utf-8"))
+    hsh.update(secp256k1.encode_pubkey(Ga))
     return int.from_bytes(
         hsh.digest(), "big") % secp256k1.N
 
 
 def hash_id(Gr: 'PlainPoint2D', id: str) -> int:
-    hsh = sha384(str(Gr).encode("utf-8"))
+    hsh = sha384(secp256k1.encode_pubkey(Gr))
     hsh.update(id.encode("utf-8"))
     return int.from_bytes(
         hsh.digest(), "big") % secp256k1.N
@@ -52,6 +55,7 @@ class IdentityKey:
         self.master_public_key = master_public_key
         self.id = id
         self.Gr = Gr
+        self._verifier: Optional[IdentityVerifier] = None
 
     def sign(self, msg: str):
         a = random_scalar()
@@ -61,20 +65,114 @@ class IdentityKey:
         b = a + ((self.secret_key * hsh_scalar) % self.curve.N) % self.curve.N
         return (Ga, b, self.Gr)
 
+    # Table-free: building W's table costs about fifty verifications, so it
+    # is left to callers that verify repeatedly and ask for an
+    # IdentityVerifier themselves
     def verify(self, msg: str, Ga: 'PlainPoint2D', b: int, Gr: 'PlainPoint2D') -> bool:
-        d = hash_message(msg, self.id, Ga)
-        c = hash_id(Gr, self.id)
+        if Gr != self.Gr:
+            return IdentityVerifier(self.master_public_key, self.id, Gr, window=0).verify(msg, Ga, b)
+        return self._get_verifier().verify(msg, Ga, b)
+
+    def batch_verify(self, sigs: List[Tuple[str, 'PlainPoint2D', int, 'PlainPoint2D']]) -> List[int]:
+        return batch_verify(self.master_public_key, self.id, sigs, self._get_verifier())
+
+    def _get_verifier(self) -> 'IdentityVerifier':
+        if self._verifier is None:
+            self._verifier = IdentityVerifier(self.master_public_key, self.id, self.Gr, window=0)
+        return self._verifier
+
+
+# Verification for one (master public key, id, Gr). A signature (Ga, b) is
+# valid when b * G == Ga + d * (Gr + c * master_public_key), with
+# c = hash_id(Gr, id) and d = hash_message(msg, id, Ga). Everything but d is
+# fixed, so W = Gr + c * master_public_key is computed once and gets its own
+# fixed-base table; each verification is then b * G - d * W from two
+# fixed-base tables and one comparison, with no inversion. window=0 skips
+# the table, for one-off verifications.
+class IdentityVerifier:
+
+    curve = secp256k1
 
-        m1 = self.curve.multiply(self.curve.neg(self.curve.G), b)
-        m2 = self.curve.multiply(
-            self.master_public_key, c*d % self.curve.N)
-        m3 = self.curve.multiply(Gr, d)
+    def __init__(self, master_public_key: 'PlainPoint2D', id: str, Gr: 'PlainPoint2D',
+                 window: int = secp256k1.BASE_TABLE_WINDOW) -> None:
+        self.master_public_key = master_public_key
+        self.id = id
+        self.Gr = Gr
+        self.c = hash_id(Gr, id)
+        self.c_master_public_key = self.curve.multiply(master_public_key, self.c)
+        self.W = self.curve.add(Gr, self.c_master_public_key)
+        self.W_table = self.curve.precompute_fixed_base(self.W, window) if window else None
 
-        added_m = self.curve.add(self.curve.add(m1, m2), m3)
-        x, y = added_m
-        y = y - self.curve.P
-        added_m = (x, y)
-        return added_m == self.curve.neg(Ga)
+    def verify(self, msg: str, Ga: 'PlainPoint2D', b: int) -> bool:
+        d = hash_message(msg, self.id, Ga)
+        curve = self.curve
+        if self.W_table is None:
+            # b * G from the generator table and -d * W in the same pass
+            o = curve.jacobian_multi_multiply([
+                (cast('PlainPoint3D', (curve.Gx, curve.Gy, 1)), b),
+                (curve.to_jacobian(self.W), -d),
+            ])
+            return curve.JacobianPoint(*o) == Ga
+        G = curve.AffinePoint(*curve.G)
+        dW = curve.JacobianPoint(*curve.jacobian_fixed_base_multiply(self.W_table, d))
+        return G * b - dW == Ga
+
+
+# Batch verification (see secp256k1.jacobian_multi_multiply) of
+# (msg, Ga, b, Gr) signatures for one identity: each satisfies
+# -b*G + c*d*MPK + d*Gr + Ga == 0. Gr terms fold per distinct Gr; with a
+# verifier, those for its Gr fold into its W = Gr + c*MPK instead.
+def batch_verify(
+    master_public_key: 'PlainPoint2D',
+    id: str,
+    sigs: List[Tuple[str, 'PlainPoint2D', int, 'PlainPoint2D']],
+    verifier: Optional['IdentityVerifier'] = None,
+) -> List[int]:
+    curve = secp256k1
+    failed = []
+    batched = []
+    for i, (msg, Ga, b, Gr) in enumerate(sigs):
+        if not (curve.is_on_curve(Ga) and curve.is_on_curve(Gr)):
+            failed.append(i)
+        else:
+            batched.append(i)
+
+    verifiers: Dict['PlainPoint2D', IdentityVerifier] = {}
+    if verifier is not None:
+        verifiers[verifier.Gr] = verifier
+    g_scalar = 0
+    mpk_scalar = 0
+    w_scalar = 0
+    gr_scalars: Dict['PlainPoint2D', int] = {}
+    cs: Dict['PlainPoint2D', int] = {}
+    pairs = []
+    for i in batched:
+        msg, Ga, b, Gr = sigs[i]
+        a = secrets.randbits(128) | 1
+        d = hash_message(msg, id, Ga)
+        g_scalar -= a * b
+        if verifier is not None and Gr == verifier.Gr:
+            w_scalar += a * d
+        else:
+            if Gr not in cs:
+                cs[Gr] = hash_id(Gr, id)
+            mpk_scalar += a * cs[Gr] * d
+            gr_scalars[Gr] = gr_scalars.get(Gr, 0) + a * d
+        pairs.append((Ga, a))
+    pairs += [(curve.G, g_scalar), (master_public_key, mpk_scalar)] + list(gr_scalars.items())
+    if verifier is not None and verifier.W_table is None:
+        pairs.append((verifier.W, w_scalar))
+    o = curve.jacobian_multi_multiply([(curve.to_jacobian(pt), n) for pt, n in pairs])
+    if verifier is not None and verifier.W_table is not None and w_scalar % curve.N:
+        o = curve.jacobian_add(o, curve.jacobian_fixed_base_multiply(verifier.W_table, w_scalar))
+    if batched and o[1]:
+        for i in batched:
+            msg, Ga, b, Gr = sigs[i]
+            if Gr not in verifiers:
+                verifiers[Gr] = IdentityVerifier(master_public_key, id, Gr, window=0)
+            if not verifiers[Gr].verify(msg, Ga, b):
+                failed.append(i)
+    return sorted(failed)
 
 
 class IdentityManager:
@@ -106,4 +204,34 @@ if __name__ == "__main__":
     assert (id_key.verify("test-msg2", Ga1, b1, Gr1) == False)
     assert (id_key.verify("test-msg3", Ga1, b1, Gr1) == False)
 
+    verifier = IdentityVerifier(ibs.public_key_g1, id_key.id, id_key.Gr)
+    assert (verifier.verify("test-msg", Ga1, b1) == True)
+    assert (verifier.verify("test-msg21321", Ga2, b2) == True)
+    assert (verifier.verify("test-msg", Ga1, b1 + 1) == False)
+    assert (verifier.verify("test-msg", Ga2, b1) == False)
+    # A key issued for the same id with a different Gr verifies through the
+    # one-off path, and signatures do not carry over between the two
+    other_key = ibs.generate_child_key(id_key.id)
+    (Ga3, b3, Gr3) = other_key.sign("test-msg")
+    assert (id_key.verify("test-msg", Ga3, b3, Gr3) == True)
+    assert (id_key.verify("test-msg", Ga1, b1, Gr3) == False)
+    assert (verifier.verify("test-msg", Ga3, b3) == False)
+
+    msgs = ["batch-msg-%d" % i for i in range(40)]
+    sigs = [(msg,) + id_key.sign(msg) for msg in msgs]
+    sigs.append(("test-msg",) + other_key.sign("test-msg"))
+    assert (id_key.batch_verify(sigs) == [])
+    assert (batch_verify(ibs.public_key_g1, id_key.id, sigs[:3]) == [])
+    assert (id_key.batch_verify([]) == [])
+    bad = list(sigs)
+    bad[3] = ("forged",) + bad[3][1:]
+    bad[17] = bad[17][:2] + (bad[17][2] + 1,) + bad[17][3:]
+    bad[25] = (bad[25][0], (Ga1[0], Ga1[1] + 1)) + bad[25][2:]
+    bad[40] = bad[40][:3] + (Gr1,)
+    assert (id_key.batch_verify(bad) == [3, 17, 25, 40])
+    # W folds into the multi-scalar multiplication without a table, and
+    # comes from its own table with one
+    assert (batch_verify(ibs.public_key_g1, id_key.id, sigs, verifier) == [])
+    assert (batch_verify(ibs.public_key_g1, id_key.id, bad, verifier) == [3, 17, 25, 40])
+
     print("All tests passed!")
@@ -1,66 +1,55 @@
-import sys
 import random
+import secrets
 import pytest
 
-from py_ecc import (
-    bls12_381,
-)
-from py_ecc.bls import point_compression
-
 from py_ecc.fields import (
     bls12_381_FQ,
-    bls12_381_FQ2,
-    bls12_381_FQ12,
-
-)
-
-from py_ecc.utils import (
-    prime_field_inv,
 )
 
 from hashlib import sha384
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
 
 from py_ecc.typing import (
     Point2D,
 )
 
+import bls_backend
 
-random.seed(a='tests2', version=2)
 
-sys.setrecursionlimit(10000000)
+random.seed(a='tests2', version=2)
 
 
 def string_to_number(id: str) -> int:
     id_hash = sha384(id.encode("utf-8")).digest()
-    return int.from_bytes(id_hash, "big") % bls12_381.bls12_381_curve.curve_order
+    return int.from_bytes(id_hash, "big") % bls_backend.curve_order
 
 
 def random_scalar():
-    return random.randint(0, bls12_381.bls12_381_curve.curve_order) % bls12_381.bls12_381_curve.curve_order
+    return random.randint(0, bls_backend.curve_order) % bls_backend.curve_order
 
 
 def hash_message(msg: str, id: str, Ga: 'Point2D[bls12_381_FQ]') -> int:
     hsh = sha384(msg.encode("utf-8"))
     hsh.update(id.encode("utf-8"))
-    hsh.update(str(Ga).encode("utf-8"))
+    hsh.update(bls_backend.serialize_g1(Ga))
     return int.from_bytes(
-        hsh.digest(), "big") % bls12_381.bls12_381_curve.curve_order
+        hsh.digest(), "big") % bls_backend.curve_order
 
 
 def hash_id(Gr: 'Point2D[bls12_381_FQ]', id: str) -> int:
-    hsh = sha384(str(Gr).encode("utf-8"))
+    hsh = sha384(bls_backend.serialize_g1(Gr))
     hsh.update(id.encode("utf-8"))
     return int.from_bytes(
-        hsh.digest(), "big") % bls12_381.bls12_381_curve.curve_order
+        hsh.digest(), "big") % bls_backend.curve_order
 
 
 class IdentityKey:
 
-    curve = bls12_381.bls12_381_curve
-    pairing = bls12_381.bls12_381_pairing
-    FQ = bls12_381_FQ
-    FQ2 = bls12_381_FQ2
-    FQ12 = bls12_381_FQ12
+    curve = bls_backend
 
     def __init__(self, secret_key: int, master_public_key: 'Point2D[bls12_381_FQ]', id: str, Gr: 'Point2D[bls12_381_FQ]') -> None:
         self.secret_key = secret_key
@@ -70,47 +59,96 @@ class IdentityKey:
 
     def sign(self, msg: str):
         a = random_scalar()
-        Ga = self.curve.multiply(self.curve.G1, a)
+        Ga = self.curve.multiply_base(a)
         hsh_scalar = hash_message(msg, self.id, Ga)
 
         b = a + ((self.secret_key * hsh_scalar) % self.curve.curve_order)
         return (Ga, b, self.Gr)
 
     def verify(self, msg: str, Ga: 'Point2D[bls12_381_FQ]', b: int, Gr: 'Point2D[bls12_381_FQ]') -> bool:
-        d = hash_message(msg, self.id, Ga)
-        c = hash_id(Gr, self.id)
-
-        m1 = self.curve.multiply(self.curve.neg(self.curve.G1), b)
-        m2 = self.curve.multiply(
-            self.master_public_key, c*d % self.curve.curve_order)
-        m3 = self.curve.multiply(Gr, d)
-
-        added_m = self.curve.add(self.curve.add(m1, m2), m3)
-        return added_m == self.curve.neg(Ga)
+        return verify(self.master_public_key, self.id, msg, Ga, b, Gr)
+
+    def batch_verify(self, sigs: List[Tuple[str, 'Point2D[bls12_381_FQ]', int, 'Point2D[bls12_381_FQ]']]) -> List[int]:
+        return batch_verify(self.master_public_key, [(self.id,) + tuple(sig) for sig in sigs])
+
+
+# A signature (Ga, b) by the key for id issued with Gr is valid when
+# b*G1 == Ga + c*d*master_public_key + d*Gr, with c = hash_id(Gr, id) and
+# d = hash_message(msg, id, Ga). b*G1 comes from the fixed-base table and the
+# right-hand side is one multi-scalar multiplication.
+def verify(master_public_key: 'Point2D[bls12_381_FQ]', id: str, msg: str,
+           Ga: 'Point2D[bls12_381_FQ]', b: int, Gr: 'Point2D[bls12_381_FQ]') -> bool:
+    curve = bls_backend
+    if not (curve.is_on_curve_g1(Ga) and curve.is_on_curve_g1(Gr)):
+        return False
+    d = hash_message(msg, id, Ga)
+    c = hash_id(Gr, id)
+    expected = curve.multi_multiply([(Ga, 1), (master_public_key, c * d), (Gr, d)])
+    return curve.eq(curve.multiply_base(b), expected)
+
+
+# Batch verification (see secp256k1.jacobian_multi_multiply) of
+# (id, msg, Ga, b, Gr) signatures under one master public key; the ids may
+# differ. Each satisfies -b*G1 + c*d*MPK + d*Gr + Ga == 0, with the G1 term
+# taken from the fixed-base table. Points are assumed to be in G1, as
+# everywhere else in this module; off-curve points fail.
+def batch_verify(
+    master_public_key: 'Point2D[bls12_381_FQ]',
+    sigs: List[Tuple[str, str, 'Point2D[bls12_381_FQ]', int, 'Point2D[bls12_381_FQ]']],
+) -> List[int]:
+    curve = bls_backend
+    failed = []
+    batched = []
+    for i, (id, msg, Ga, b, Gr) in enumerate(sigs):
+        if not (curve.is_on_curve_g1(Ga) and curve.is_on_curve_g1(Gr)):
+            failed.append(i)
+        else:
+            batched.append(i)
+
+    g_scalar = 0
+    mpk_scalar = 0
+    # serialized Gr -> [Gr, scalar]
+    gr_terms: Dict[bytes, list] = {}
+    pairs = []
+    for i in batched:
+        id, msg, Ga, b, Gr = sigs[i]
+        a = secrets.randbits(128) | 1
+        d = hash_message(msg, id, Ga)
+        c = hash_id(Gr, id)
+        g_scalar += a * b
+        mpk_scalar += a * c * d
+        term = gr_terms.setdefault(curve.serialize_g1(Gr), [Gr, 0])
+        term[1] += a * d
+        pairs.append((Ga, a))
+    pairs.append((master_public_key, mpk_scalar))
+    pairs += [(Gr, scalar) for Gr, scalar in gr_terms.values()]
+    if curve.eq(curve.multiply_base(g_scalar), curve.multi_multiply(pairs)):
+        return failed
+    failed += [i for i in batched if not verify(master_public_key, *sigs[i])]
+    return sorted(failed)
 
 
 class IdentityManager:
 
-    curve = bls12_381.bls12_381_curve
-    pairing = bls12_381.bls12_381_pairing
-    FQ = bls12_381_FQ
-    FQ2 = bls12_381_FQ2
-    FQ12 = bls12_381_FQ12
+    curve = bls_backend
 
     def __init__(self, secret_key) -> None:
         self.secret_key = secret_key
-        self.public_key_g1 = self.curve.multiply(
-            self.curve.G1, self.secret_key)
+        self.public_key_g1 = self.curve.multiply_base(self.secret_key)
         self.public_key_g2 = self.curve.multiply(
             self.curve.G2, self.secret_key)
 
     def generate_child_key(self, id: str) -> 'IdentityKey':
         r = random_scalar()
-        Gr = self.curve.multiply(self.curve.G1, r)
+        Gr = self.curve.multiply_base(r)
         Gr_and_id = hash_id(Gr, id)
         usk = r + ((self.secret_key * Gr_and_id) % self.curve.curve_order)
         return IdentityKey(usk, self.public_key_g1, id, Gr)
 
+    # Batch-verify (id, msg, Ga, b, Gr) signatures by any of this manager's keys
+    def batch_verify(self, sigs: List[Tuple[str, str, 'Point2D[bls12_381_FQ]', int, 'Point2D[bls12_381_FQ]']]) -> List[int]:
+        return batch_verify(self.public_key_g1, sigs)
+
 
 if __name__ == "__main__":
     sk = random_scalar()
@@ -119,4 +157,22 @@ if __name__ == "__main__":
     (Ga1, b1, Gr1) = id_key.sign("test-msg")
     assert (id_key.verify("test-msg", Ga1, b1, Gr1) == True)
     assert (id_key.verify("test-msg2", Ga1, b1, Gr1) == False)
+    assert (id_key.verify("test-msg", Ga1, b1 + 1, Gr1) == False)
+
+    keys = [id_key] + [ibs.generate_child_key("child-%d" % i) for i in range(2, 5)]
+    msgs = ["batch-msg-%d" % i for i in range(24)]
+    sigs = [(keys[i % 4].id, msg) + keys[i % 4].sign(msg) for i, msg in enumerate(msgs)]
+    assert (ibs.batch_verify(sigs) == [])
+    assert (ibs.batch_verify([]) == [])
+    assert (id_key.batch_verify([sig[1:] for sig in sigs[::4]]) == [])
+    # signed by child-2 but claimed for child-1
+    assert (id_key.batch_verify([sig[1:] for sig in sigs[:2]]) == [1])
+    bad = list(sigs)
+    bad[3] = bad[3][:1] + ("forged",) + bad[3][2:]
+    bad[9] = bad[9][:3] + (bad[9][3] + 1,) + bad[9][4:]
+    bad[14] = bad[14][:4] + (Gr1,)
+    bad[20] = bad[20][:2] + (Ga1[:1] + (Ga1[1] + 1,) + Ga1[2:],) + bad[20][3:]
+    assert (ibs.batch_verify(bad) == [3, 9, 14, 20])
+    other = IdentityManager(random_scalar())
+    assert (other.batch_verify(sigs[:3]) == [0, 1, 2])
     print("All tests passed!")
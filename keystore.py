@@ -0,0 +1,157 @@
+import mmap
+import os
+import struct
+
+from typing import (
+    BinaryIO,
+    Iterable,
+    Iterator,
+    Optional,
+    TYPE_CHECKING,
+    Union,
+)
+
+from eth_hash.auto import keccak
+
+import secp256k1
+
+if TYPE_CHECKING:
+    from py_ecc.typing import (  # noqa: F401
+        PlainPoint2D,
+    )
+
+
+COMPRESSED_SIZE = 33
+RAW_SIZE = 64
+
+# Store files start with a header: magic, record size and the number of
+# keys stored. The count is rewritten on every append, so the spare
+# capacity after the keys is never read back as keys, even from a store
+# that was not closed.
+_MAGIC = b"PKST"
+_HEADER = struct.Struct(">4sH2xQ")
+
+
+# Public keys packed back to back in one buffer: 33-byte compressed SEC1
+# records, or 64-byte raw x || y records (the bytes pub_to_address hashes).
+# The buffer is a bytearray, or an mmap of a file for stores that should
+# outlive the process. view() hands out zero-copy memoryviews; like any
+# exported buffer they must be released before the store can grow.
+class PublicKeyStore:
+
+    def __init__(self, compressed: bool = False) -> None:
+        self.compressed = compressed
+        self.record_size = COMPRESSED_SIZE if compressed else RAW_SIZE
+        self._buf: Union[bytearray, mmap.mmap] = bytearray()
+        # Where the records start in _buf: after the header in a file
+        self._start = 0
+        self._count = 0
+        self._file: Optional[BinaryIO] = None
+        self._writable = True
+
+    # Map a store file. The file may be bigger than the stored keys while it
+    # is open for writing; close() trims the spare capacity.
+    @classmethod
+    def open(cls, path: str, compressed: bool = False, writable: bool = True) -> "PublicKeyStore":
+        store = cls(compressed)
+        if writable and not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, store.record_size, 0))
+        f = open(path, "r+b" if writable else "rb")
+        size = os.fstat(f.fileno()).st_size
+        try:
+            magic, record_size, count = _HEADER.unpack(f.read(_HEADER.size))
+        except struct.error:
+            magic, record_size, count = b"", 0, 0
+        if magic != _MAGIC or record_size != store.record_size or \
+                size < _HEADER.size + count * record_size:
+            f.close()
+            raise ValueError("%s is not a store of %d-byte keys" % (path, store.record_size))
+        store._count = count
+        store._start = _HEADER.size
+        store._file = f
+        store._writable = writable
+        if writable and size < _HEADER.size + 1024 * store.record_size:
+            size = _HEADER.size + max(1024, 2 * count) * store.record_size
+            f.truncate(size)
+        store._buf = mmap.mmap(
+            f.fileno(), size, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        return store
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        if self._writable:
+            self._file.truncate(self._start + self._count * self.record_size)
+        self._file.close()
+        self._file = None
+        self._buf = bytearray()
+        self._start = 0
+
+    def __enter__(self) -> "PublicKeyStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def encode(self, pub: "PlainPoint2D") -> bytes:
+        if self.compressed:
+            return secp256k1.encode_pubkey(pub, compressed=True)
+        return secp256k1.encode_pubkey(pub, compressed=False)[1:]
+
+    def append(self, pub: "PlainPoint2D") -> int:
+        if not self._writable:
+            raise ValueError("store is read-only")
+        record = self.encode(pub)
+        end = self._start + (self._count + 1) * self.record_size
+        if isinstance(self._buf, bytearray):
+            self._buf += record
+            self._count += 1
+        else:
+            if end > len(self._buf):
+                # Grows the backing file as well
+                self._buf.resize(2 * len(self._buf))
+            self._buf[end - self.record_size:end] = record
+            self._count += 1
+            _HEADER.pack_into(self._buf, 0, _MAGIC, self.record_size, self._count)
+        return self._count - 1
+
+    def extend(self, pubs: Iterable["PlainPoint2D"]) -> None:
+        for pub in pubs:
+            self.append(pub)
+
+    def _offset(self, i: int) -> int:
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("key index out of range")
+        return self._start + i * self.record_size
+
+    def view(self, i: int) -> memoryview:
+        offset = self._offset(i)
+        return memoryview(self._buf)[offset:offset + self.record_size]
+
+    def __getitem__(self, i: int) -> "PlainPoint2D":
+        with self.view(i) as record:
+            return secp256k1.decode_pubkey(record)
+
+    def __iter__(self) -> Iterator["PlainPoint2D"]:
+        for i in range(self._count):
+            yield self[i]
+
+    # pub_to_address over the whole store. Raw records are already the
+    # hashed bytes, so they are hashed straight out of the buffer.
+    def addresses(self) -> Iterator[str]:
+        if self.compressed:
+            for pub in self:
+                yield secp256k1.pub_to_address(pub)
+            return
+        with memoryview(self._buf) as buf:
+            for offset in range(self._start, self._start + self._count * RAW_SIZE, RAW_SIZE):
+                with buf[offset:offset + RAW_SIZE] as record:
+                    yield '0x' + keccak.hasher(record)[-20:].hex()
@@ -1,5 +1,3 @@
-import py_ecc.bls12_381.bls12_381_curve as curve
-import py_ecc.bls12_381.bls12_381_pairing as pairing
 from py_ecc.typing import (
     Point2D,
     Field
@@ -7,6 +5,10 @@ from py_ecc.typing import (
 )
 from polynomial import lagrange_polynomial, polynomial_division
 
+# Points and pairings come from the selected BLS12-381 backend, which lives
+# at the repository root (test-kzg.py puts it on the path)
+import bls_backend as curve
+
 from binascii import hexlify
 from utils import format_data
 import random
@@ -93,13 +95,12 @@ def verify(commitment: Point2D[Field], proof: Point2D[Field], point: tuple[int,
     s_minus_x = curve.add(
         curve.multiply(curve.G2, curve.curve_order-point[0]),
         setup_g2)
-    result = pairing.pairing(s_minus_x, proof)
     c_minus_y = curve.add(
         curve.multiply(curve.G1, curve.curve_order-point[1]),
         commitment
     )
-    expected = pairing.pairing(curve.G2, c_minus_y)
-    return result == expected
+    # e(s - x, pi) == e(G2, C - y), checked as e(s - x, pi) * e(-G2, C - y) == 1
+    return curve.pairing_check([(s_minus_x, proof), (curve.neg(curve.G2), c_minus_y)])
 
 
 # Generate KZG proof of append only
@@ -129,7 +130,7 @@ def verify_append_only(commitment1: Point2D[Field], commitment2: Point2D[Field],
     # add c2 and -c1
     expected = curve.add(commitment2, curve.neg(commitment1))
     # should be equal
-    if expected != diff_commit:
+    if not curve.eq(expected, diff_commit):
         return False
     # Verify normal eval proof
     return verify(diff_commit, diff_pi, point, setup_g2)
@@ -1,5 +1,10 @@
+import os
 import random
-import kzg
+import sys
+
+# kzg takes its points and pairings from bls_backend, at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import kzg  # noqa: E402
 from polynomial import evaluate_polynomial
 import time
 
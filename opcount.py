@@ -0,0 +1,279 @@
+import functools
+import importlib
+import os
+import sys
+import time
+
+from collections import Counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+
+# Opt-in operation counting. Nothing is touched until count_ops() is
+# entered: it then swaps counting wrappers in for the curve and field
+# functions (in every loaded module that references them, so names pulled
+# in with "from ... import" are covered too) and puts the originals back on
+# exit. With no counter active the code runs exactly as written.
+#
+# secp256k1's point formulas are inline integer arithmetic, so their field
+# work is counted from the nominal cost of each formula as written below;
+# field operations that go through the field backend (normalization, batch
+# inversion, square roots) are counted as they happen. py_ecc's field
+# elements are objects, so their multiplications and inversions are
+# counted directly.
+
+# (multiplications, squarings) per call, small constant factors ignored
+SECP256K1_FORMULA_COSTS = {
+    "jacobian_double": (3, 6),
+    "jacobian_add": (12, 6),
+    "jacobian_add_affine": (8, 3),
+}
+
+SECP256K1_POINT_OPS = {
+    "jacobian_double": "point_double",
+    "jacobian_add": "point_add",
+    "jacobian_add_affine": "point_add_mixed",
+}
+
+PY_ECC_POINT_OPS = {
+    "double": "point_double",
+    "add": "point_add",
+}
+
+REPORT_ORDER = [
+    "point_double", "point_add", "point_add_mixed", "pairing", "final_exp",
+    "field_mul", "field_sqr", "field_inv", "field_sqrt",
+]
+
+
+class OpCounts:
+
+    def __init__(self, name: str = "") -> None:
+        self.name = name
+        self.counts: Counter = Counter()
+        self.wall_time = 0.0
+
+    def __getitem__(self, op: str) -> int:
+        return self.counts[op]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "wall_time": self.wall_time, "counts": dict(self.counts)}
+
+    def __str__(self) -> str:
+        ops = [op for op in REPORT_ORDER if self.counts[op]] + sorted(
+            op for op in self.counts if op not in REPORT_ORDER)
+        lines = ["%s (took %.4fs)" % (self.name or "operation counts", self.wall_time)]
+        lines += ["\t%-16s %10d" % (op, self.counts[op]) for op in ops]
+        return "\n".join(lines)
+
+
+_active: List[OpCounts] = []
+_patches: List[Tuple[Any, str, Any]] = []
+
+
+def _bump(op: str, amount: int = 1) -> None:
+    for counts in _active:
+        counts.counts[op] += amount
+
+
+def _counting(fn: Callable, op: str, mul: int = 0, sqr: int = 0) -> Callable:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for counts in _active:
+            counts.counts[op] += 1
+            if mul:
+                counts.counts["field_mul"] += mul
+            if sqr:
+                counts.counts["field_sqr"] += sqr
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+class _CountingFieldBackend:
+
+    def __init__(self, backend: Any) -> None:
+        self._backend = backend
+        self.name = backend.name
+        self.elem = backend.elem
+
+    def mul(self, a, b, n):
+        _bump("field_mul")
+        return self._backend.mul(a, b, n)
+
+    def sqr(self, a, n):
+        _bump("field_sqr")
+        return self._backend.sqr(a, n)
+
+    def inv(self, a, n):
+        _bump("field_inv")
+        return self._backend.inv(a, n)
+
+    def sqrt(self, a, n):
+        _bump("field_sqrt")
+        return self._backend.sqrt(a, n)
+
+
+def _set(owner: Any, name: str, value: Any) -> None:
+    _patches.append((owner, name, getattr(owner, name)))
+    setattr(owner, name, value)
+
+
+# Replace fn everywhere a loaded module holds a reference to it
+def _replace_function(fn: Callable, wrapper: Callable) -> None:
+    for module in list(sys.modules.values()):
+        namespace = getattr(module, "__dict__", None)
+        if not namespace or module is sys.modules[__name__]:
+            continue
+        for name, value in list(namespace.items()):
+            if value is fn:
+                _set(module, name, wrapper)
+
+
+def _install() -> None:
+    replacements: Dict[Callable, Callable] = {}
+    secp256k1 = sys.modules.get("secp256k1")
+    if secp256k1 is not None:
+        for name, op in SECP256K1_POINT_OPS.items():
+            mul, sqr = SECP256K1_FORMULA_COSTS[name]
+            fn = getattr(secp256k1, name)
+            replacements[fn] = _counting(fn, op, mul, sqr)
+        _set(secp256k1, "_field", _CountingFieldBackend(secp256k1._field))
+
+    if "py_ecc" in sys.modules:
+        from py_ecc.bls12_381 import bls12_381_curve, bls12_381_pairing
+        from py_ecc.fields import field_elements
+        from py_ecc import utils
+        for name, op in PY_ECC_POINT_OPS.items():
+            fn = getattr(bls12_381_curve, name)
+            replacements[fn] = _counting(fn, op)
+        replacements[bls12_381_pairing.pairing] = _counting(
+            bls12_381_pairing.pairing, "pairing")
+        replacements[utils.prime_field_inv] = _counting(
+            utils.prime_field_inv, "field_inv")
+        _set(field_elements.FQ, "__mul__", _counting(
+            field_elements.FQ.__mul__, "field_mul"))
+        _set(field_elements.FQP, "inv", _counting(
+            field_elements.FQP.inv, "field_inv"))
+
+        # optimized_bls12_381, the default BLS backend: projective formulas
+        # and a pairing whose final exponentiation can be deferred, so Miller
+        # loops and final exponentiations are counted separately
+        from py_ecc import optimized_bls12_381
+        from py_ecc.fields import optimized_field_elements
+        for name, op in PY_ECC_POINT_OPS.items():
+            fn = getattr(optimized_bls12_381, name)
+            replacements[fn] = _counting(fn, op)
+        replacements[optimized_bls12_381.pairing] = _counting(
+            optimized_bls12_381.pairing, "pairing")
+        replacements[optimized_bls12_381.final_exponentiate] = _counting(
+            optimized_bls12_381.final_exponentiate, "final_exp")
+        _set(optimized_field_elements.FQ, "__mul__", _counting(
+            optimized_field_elements.FQ.__mul__, "field_mul"))
+        _set(optimized_field_elements.FQP, "inv", _counting(
+            optimized_field_elements.FQP.inv, "field_inv"))
+
+    for fn, wrapper in replacements.items():
+        _replace_function(fn, wrapper)
+
+
+def _uninstall() -> None:
+    while _patches:
+        owner, name, value = _patches.pop()
+        setattr(owner, name, value)
+
+
+class count_ops:
+    """Count curve and field operations performed inside the block.
+
+        with count_ops("ecdsa_raw_sign") as counts:
+            secp256k1.ecdsa_raw_sign(msghash, priv)
+        print(counts)
+
+    Blocks may nest; every active counter sees the operations.
+    """
+
+    def __init__(self, name: str = "") -> None:
+        self.counts = OpCounts(name)
+
+    def __enter__(self) -> OpCounts:
+        if not _active:
+            _install()
+        _active.append(self.counts)
+        self._start = time.perf_counter()
+        return self.counts
+
+    def __exit__(self, *exc_info) -> None:
+        self.counts.wall_time = time.perf_counter() - self._start
+        _active.remove(self.counts)
+        if not _active:
+            _uninstall()
+
+
+# Decorator: count every call of fn and hand each call's OpCounts to report
+# (printed to stderr by default)
+def profiled(fn: Optional[Callable] = None, *, report: Optional[Callable[[OpCounts], Any]] = None) -> Callable:
+    if fn is None:
+        return functools.partial(profiled, report=report)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with count_ops(fn.__qualname__) as counts:
+            result = fn(*args, **kwargs)
+        if report is None:
+            print(counts, file=sys.stderr)
+        else:
+            report(counts)
+        return result
+    return wrapper
+
+
+# Profile one call of each hot path named in the docs
+def main() -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:0] = [here, os.path.join(here, "kzg-stuff")]
+    import secp256k1
+    import stealth_address
+    import kzg
+    ibs = importlib.import_module("ibs-secpk1")
+    bls_ibs = importlib.import_module("identity-signatures")
+    accumulator = importlib.import_module("universal-accumulator")
+
+    secp256k1.precompute_base_table()
+    priv = b'\x01' * 32
+    msghash = b'\x02' * 32
+    vrs = secp256k1.ecdsa_raw_sign(msghash, priv)
+    main_key = stealth_address.MainKey()
+    id_key = ibs.IdentityManager(ibs.random_scalar()).generate_child_key("child-1")
+    signature = id_key.sign("msg")
+    bls_id_key = bls_ibs.IdentityManager(bls_ibs.random_scalar()).generate_child_key("child-1")
+    bls_signature = bls_id_key.sign("msg")
+    setup_g1, _ = kzg.trusted_setup(4)
+    acc = accumulator.Accumulator(accumulator.random.randint(0, kzg.curve.curve_order))
+    acc.batch_add_elements(["1", "2"])
+    witness = acc.generate_membership_witness("1")
+
+    calls = [
+        ("secp256k1.ecdsa_raw_sign", lambda: secp256k1.ecdsa_raw_sign(msghash, priv)),
+        ("secp256k1.ecdsa_raw_recover", lambda: secp256k1.ecdsa_raw_recover(msghash, vrs)),
+        ("MainKey.generate_stealth_address(1)", lambda: main_key.generate_stealth_address(1)),
+        ("ibs-secpk1 IdentityKey.verify", lambda: id_key.verify("msg", *signature)),
+        ("identity-signatures IdentityKey.verify", lambda: bls_id_key.verify("msg", *bls_signature)),
+        ("kzg.commit (4 coefficients)", lambda: kzg.commit([1, 2, 3, 4], setup_g1)),
+        ("Accumulator.add_element_hash", lambda: acc.add_element_hash(b'\x03' * 32)),
+        ("Accumulator.verify_membership_witness", lambda: acc.verify_membership_witness(witness, "1")),
+    ]
+    for name, call in calls:
+        with count_ops(name) as counts:
+            call()
+        print(counts)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import multiprocessing
+
+from collections import deque
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+# Split items into lists of up to size items, pulling them lazily
+def chunks(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# fn(*args) for every args tuple, on a pool of workers processes, yielding
+# the results in input order. initializer(*initargs) runs once in each
+# worker, before its first call (for tables the calls share). Arguments are
+# pulled lazily and at most max_pending calls are in flight, so memory
+# stays bounded however long the input is. This is the pipeline behind
+# bulk_sign, stealth_scanner and the accumulator's bulk witnesses.
+def imap_ordered(
+    fn: Callable[..., T],
+    args: Iterable[Tuple[Any, ...]],
+    workers: int,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Tuple[Any, ...] = (),
+    max_pending: Optional[int] = None,
+) -> Iterator[T]:
+    max_pending = max_pending or 2 * workers
+    with multiprocessing.Pool(workers, initializer, initargs) as pool:
+        pending: deque = deque()
+        for a in args:
+            pending.append(pool.apply_async(fn, a))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
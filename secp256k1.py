@@ -1,12 +1,19 @@
 import hashlib
 import hmac
+import secrets
 import sys
+import time
 
 from typing import (
     Any,
     cast,
+    Dict,
+    Iterator,
+    List,
+    Optional,
     Tuple,
     TYPE_CHECKING,
+    Union,
 )
 
 if TYPE_CHECKING:
@@ -26,13 +33,15 @@ else:
             return ord(value)
 from eth_hash.auto import keccak
 
+import curves
+
 # Elliptic curve parameters (secp256k1)
-P = 2**256 - 2**32 - 977
-N = 115792089237316195423570985008687907852837564279074904382605163141518161494337
-A = 0
-B = 7
-Gx = 55066263022277343669578718895168534326250603453777594175500187360389116729240
-Gy = 32670510020758816978083085130507043184471273380659243275938904335757337482424
+P = curves.SECP256K1.p
+N = curves.SECP256K1.n
+A = curves.SECP256K1.a
+B = curves.SECP256K1.b
+Gx = curves.SECP256K1.Gx
+Gy = curves.SECP256K1.Gy
 G = cast("PlainPoint2D", (Gx, Gy))
 
 
@@ -63,33 +72,113 @@ def bytes_to_int(x: bytes) -> int:
     return o
 
 
-# Extended Euclidean Algorithm
+# Field arithmetic backends. mul/sqr/inv/sqrt take the modulus explicitly so
+# they serve arithmetic mod N as well as mod P. The point formulas stay
+# inline for speed: they work on whatever element type the backend's elem()
+# produces and reduce modulo _P, the backend's copy of P.
+class PythonFieldBackend:
+
+    name = "python"
+
+    @staticmethod
+    def elem(a: int) -> int:
+        return a
+
+    @staticmethod
+    def mul(a: int, b: int, n: int) -> int:
+        return (a * b) % n
+
+    @staticmethod
+    def sqr(a: int, n: int) -> int:
+        return (a * a) % n
+
+    @staticmethod
+    def inv(a: int, n: int) -> int:
+        a %= n
+        if a == 0:
+            return 0
+        return pow(a, -1, n)
+
+    # Only valid for n == 3 mod 4, which holds for P
+    @staticmethod
+    def sqrt(a: int, n: int) -> int:
+        return pow(a, (n + 1) // 4, n)
+
+
+class Gmpy2FieldBackend:
+
+    name = "gmpy2"
+
+    @staticmethod
+    def elem(a: int) -> Any:
+        return gmpy2.mpz(a)
+
+    @staticmethod
+    def mul(a: Any, b: Any, n: int) -> Any:
+        return (a * b) % n
+
+    @staticmethod
+    def sqr(a: Any, n: int) -> Any:
+        return (a * a) % n
+
+    @staticmethod
+    def inv(a: Any, n: int) -> Any:
+        a %= n
+        if a == 0:
+            return 0
+        return gmpy2.invert(a, n)
+
+    @staticmethod
+    def sqrt(a: Any, n: int) -> Any:
+        return gmpy2.powmod(a, (n + 1) // 4, n)
+
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+FIELD_BACKENDS: Dict[str, Any] = {"python": PythonFieldBackend}
+if gmpy2 is not None:
+    FIELD_BACKENDS["gmpy2"] = Gmpy2FieldBackend
+# gmpy2 is picked automatically when it is installed
+FIELD_BACKEND = "gmpy2" if gmpy2 is not None else "python"
+_field: Any = FIELD_BACKENDS[FIELD_BACKEND]
+_P = _field.elem(P)
+
+
+def set_field_backend(name: str) -> None:
+    global FIELD_BACKEND, _field, _P
+    if name not in FIELD_BACKENDS:
+        raise ValueError("unknown field backend %r, expected one of %s" % (
+            name, ", ".join(sorted(FIELD_BACKENDS))))
+    FIELD_BACKEND = name
+    _field = FIELD_BACKENDS[name]
+    _P = _field.elem(P)
+    # The generator table holds backend elements, so rebuild it, from the
+    # same cache it was loaded from
+    if _base_table is not None:
+        precompute_base_table(_base_table[0], _base_table_cache_dir)
+
+
 def inv(a: int, n: int) -> int:
-    if a == 0:
-        return 0
-    lm, hm = 1, 0
-    low, high = a % n, n
-    while low > 1:
-        r = high // low
-        nm, new = hm - lm * r, high - low * r
-        lm, low, hm, high = nm, new, lm, low
-    return lm % n
+    return int(_field.inv(a, n))
 
 
 def to_jacobian(p: "PlainPoint2D") -> "PlainPoint3D":
-    o = (p[0], p[1], 1)
+    o = (_field.elem(p[0]), _field.elem(p[1]), _field.elem(1))
     return cast("PlainPoint3D", o)
 
 
 def jacobian_double(p: "PlainPoint3D") -> "PlainPoint3D":
     if not p[1]:
         return cast("PlainPoint3D", (0, 0, 0))
-    ysq = (p[1] ** 2) % P
-    S = (4 * p[0] * ysq) % P
-    M = (3 * p[0] ** 2 + A * p[2] ** 4) % P
-    nx = (M**2 - 2 * S) % P
-    ny = (M * (S - nx) - 8 * ysq ** 2) % P
-    nz = (2 * p[1] * p[2]) % P
+    ysq = (p[1] ** 2) % _P
+    S = (4 * p[0] * ysq) % _P
+    M = (3 * p[0] ** 2 + A * p[2] ** 4) % _P
+    nx = (M**2 - 2 * S) % _P
+    ny = (M * (S - nx) - 8 * ysq ** 2) % _P
+    nz = (2 * p[1] * p[2]) % _P
     return cast("PlainPoint3D", (nx, ny, nz))
 
 
@@ -98,49 +187,618 @@ def jacobian_add(p: "PlainPoint3D", q: "PlainPoint3D") -> "PlainPoint3D":
         return q
     if not q[1]:
         return p
-    U1 = (p[0] * q[2] ** 2) % P
-    U2 = (q[0] * p[2] ** 2) % P
-    S1 = (p[1] * q[2] ** 3) % P
-    S2 = (q[1] * p[2] ** 3) % P
+    U1 = (p[0] * q[2] ** 2) % _P
+    U2 = (q[0] * p[2] ** 2) % _P
+    S1 = (p[1] * q[2] ** 3) % _P
+    S2 = (q[1] * p[2] ** 3) % _P
     if U1 == U2:
         if S1 != S2:
             return cast("PlainPoint3D", (0, 0, 1))
         return jacobian_double(p)
     H = U2 - U1
     R = S2 - S1
-    H2 = (H * H) % P
-    H3 = (H * H2) % P
-    U1H2 = (U1 * H2) % P
-    nx = (R ** 2 - H3 - 2 * U1H2) % P
-    ny = (R * (U1H2 - nx) - S1 * H3) % P
-    nz = (H * p[2] * q[2]) % P
+    H2 = (H * H) % _P
+    H3 = (H * H2) % _P
+    U1H2 = (U1 * H2) % _P
+    nx = (R ** 2 - H3 - 2 * U1H2) % _P
+    ny = (R * (U1H2 - nx) - S1 * H3) % _P
+    nz = (H * p[2] * q[2]) % _P
+    return cast("PlainPoint3D", (nx, ny, nz))
+
+
+def jacobian_add_affine(p: "PlainPoint3D", q: "PlainPoint2D") -> "PlainPoint3D":
+    # Mixed addition: q has an implicit z of 1, which saves the U1/S1 products
+    if not q[1]:
+        return p
+    if not p[1]:
+        return cast("PlainPoint3D", (q[0], q[1], 1))
+    z2 = (p[2] * p[2]) % _P
+    U2 = (q[0] * z2) % _P
+    S2 = (q[1] * z2 * p[2]) % _P
+    if p[0] == U2:
+        if p[1] != S2:
+            return cast("PlainPoint3D", (0, 0, 1))
+        return jacobian_double(p)
+    H = U2 - p[0]
+    R = S2 - p[1]
+    H2 = (H * H) % _P
+    H3 = (H * H2) % _P
+    U1H2 = (p[0] * H2) % _P
+    nx = (R ** 2 - H3 - 2 * U1H2) % _P
+    ny = (R * (U1H2 - nx) - p[1] * H3) % _P
+    nz = (H * p[2]) % _P
     return cast("PlainPoint3D", (nx, ny, nz))
 
 
 def from_jacobian(p: "PlainPoint3D") -> "PlainPoint2D":
     z = inv(p[2], P)
-    return cast("PlainPoint2D", ((p[0] * z**2) % P, (p[1] * z**3) % P))
+    z2 = _field.sqr(z, _P)
+    return cast("PlainPoint2D", (
+        int(_field.mul(p[0], z2, _P)), int(_field.mul(p[1], _field.mul(z2, z, _P), _P))))
+
+
+# Invert many values mod n with a single inversion (Montgomery's trick).
+# Zeros map to 0, same as inv.
+def batch_inv(values: List[int], n: int) -> List[int]:
+    prefix = []
+    acc = 1
+    for a in values:
+        prefix.append(acc)
+        if a % n:
+            acc = _field.mul(acc, a, n)
+    acc_inv = inv(acc, n)
+    out = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        a = values[i] % n
+        if not a:
+            continue
+        out[i] = int(_field.mul(acc_inv, prefix[i], n))
+        acc_inv = _field.mul(acc_inv, a, n)
+    return out
+
+
+# Normalize many Jacobian points with a single inversion. Points with
+# z == 0 map to (0, 0), same as from_jacobian.
+def batch_from_jacobian(points: List["PlainPoint3D"]) -> List["PlainPoint2D"]:
+    out = []
+    for (x, y, _), z_inv in zip(points, batch_inv([p[2] for p in points], P)):
+        z_inv2 = _field.sqr(z_inv, _P)
+        out.append(cast("PlainPoint2D", (
+            int(_field.mul(x, z_inv2, _P)),
+            int(_field.mul(y, _field.mul(z_inv2, z_inv, _P), _P)))))
+    return out
+
+
+# Width-w non-adjacent form, least significant digit first. Every non-zero
+# digit is odd with |d| < 2**(w-1), and any w consecutive digits contain at
+# most one non-zero digit.
+def wnaf(n: int, window: int) -> List[int]:
+    digits = []
+    full = 1 << window
+    half = full >> 1
+    while n:
+        if n & 1:
+            d = n & (full - 1)
+            if d >= half:
+                d -= full
+            n -= d
+        else:
+            d = 0
+        digits.append(d)
+        n >>= 1
+    return digits
+
+
+# a, 3a, 5a, ..., (2**(window-1) - 1)a
+def jacobian_odd_multiples(a: "PlainPoint3D", window: int) -> List["PlainPoint3D"]:
+    twice = jacobian_double(a)
+    table = [a]
+    for _ in range((1 << (window - 2)) - 1):
+        table.append(jacobian_add(table[-1], twice))
+    return table
+
+
+WNAF_WINDOW = 5
+
 
+def _negate_jacobian(p: "PlainPoint3D") -> "PlainPoint3D":
+    return cast("PlainPoint3D", (p[0], _P - p[1], p[2]))
 
-def jacobian_multiply(a: "PlainPoint3D", n: int) -> "PlainPoint3D":   # type: ignore
+
+def jacobian_multiply_wnaf(a: "PlainPoint3D", n: int, window: int = WNAF_WINDOW) -> "PlainPoint3D":
+    n %= N
+    if a[1] == 0 or n == 0:
+        return cast("PlainPoint3D", (0, 0, 1))
+    if n == 1:
+        return a
+    table = jacobian_odd_multiples(a, window)
+    digits = wnaf(n, window)
+    # The most significant digit is always positive
+    o = table[digits[-1] >> 1]
+    for i in range(len(digits) - 2, -1, -1):
+        o = jacobian_double(o)
+        d = digits[i]
+        if d > 0:
+            o = jacobian_add(o, table[d >> 1])
+        elif d < 0:
+            o = jacobian_add(o, _negate_jacobian(table[-d >> 1]))
+    return o
+
+
+# Interleaved (Strauss) evaluation of several wNAF-recoded scalars against
+# their odd-multiple tables, sharing a single chain of doublings.
+def _jacobian_interleaved(terms: List[Tuple[List["PlainPoint3D"], List[int]]]) -> "PlainPoint3D":
+    o = cast("PlainPoint3D", (0, 0, 1))
+    length = max([len(digits) for _, digits in terms] + [0])
+    for i in range(length - 1, -1, -1):
+        o = jacobian_double(o)
+        for table, digits in terms:
+            if i < len(digits):
+                d = digits[i]
+                if d > 0:
+                    o = jacobian_add(o, table[d >> 1])
+                elif d < 0:
+                    o = jacobian_add(o, _negate_jacobian(table[-d >> 1]))
+    return o
+
+
+# GLV endomorphism: lambda * (x, y) == (beta * x, y) on secp256k1
+GLV_LAMBDA = 0x5363ad4cc05c30e0a5261c028812645a122e22ea20816678df02967c1b23bd72
+GLV_BETA = 0x7ae96a2b657c07106e64479eac3434e99cf0497512f58995c1396c28719501ee
+# Short basis of the lattice {(x, y) : x + y * lambda == 0 mod N}
+GLV_A1 = 0x3086d221a7d46bcde86c90e49284eb15
+GLV_B1 = -0xe4437ed6010e88286f547fa90abfe4c3
+GLV_A2 = 0x114ca50f7a8e2f3f657c1108d9d44cfd8
+GLV_B2 = GLV_A1
+
+
+# Split n into (k1, k2) with n == k1 + k2 * lambda (mod N) and |k1|, |k2|
+# around 128 bits.
+def glv_split(n: int) -> Tuple[int, int]:
+    n %= N
+    c1 = (2 * GLV_B2 * n + N) // (2 * N)
+    c2 = (-2 * GLV_B1 * n + N) // (2 * N)
+    k1 = n - c1 * GLV_A1 - c2 * GLV_A2
+    k2 = -c1 * GLV_B1 - c2 * GLV_B2
+    return k1, k2
+
+
+def jacobian_endomorphism(p: "PlainPoint3D") -> "PlainPoint3D":
+    return cast("PlainPoint3D", ((GLV_BETA * p[0]) % _P, p[1], p[2]))
+
+
+# Recode n once as the two half-length GLV scalars: (use the endomorphism,
+# signed wNAF digits) for each non-zero half
+def _glv_recode(n: int, window: int) -> List[Tuple[bool, List[int]]]:
+    recoded = []
+    for endo, k in zip((False, True), glv_split(n)):
+        if k:
+            digits = wnaf(abs(k), window)
+            recoded.append((endo, digits if k > 0 else [-d for d in digits]))
+    return recoded
+
+
+# Recode n * a as the two half-length terms k1 * a + k2 * (lambda * a)
+def _glv_terms(a: "PlainPoint3D", n: int, window: int) -> List[Tuple[List["PlainPoint3D"], List[int]]]:
+    table = jacobian_odd_multiples(a, window)
+    return [([jacobian_endomorphism(p) for p in table] if endo else table, digits)
+            for endo, digits in _glv_recode(n, window)]
+
+
+def jacobian_multiply_glv(a: "PlainPoint3D", n: int, window: int = WNAF_WINDOW) -> "PlainPoint3D":
+    n %= N
     if a[1] == 0 or n == 0:
         return cast("PlainPoint3D", (0, 0, 1))
     if n == 1:
         return a
-    if n < 0 or n >= N:
-        return jacobian_multiply(a, n % N)
-    if (n % 2) == 0:
-        return jacobian_double(jacobian_multiply(a, n // 2))
-    if (n % 2) == 1:
-        return jacobian_add(jacobian_double(jacobian_multiply(a, n // 2)), a)
+    return _jacobian_interleaved(_glv_terms(a, n, window))
+
+
+MULTIPLY_ENGINES = {
+    "wnaf": jacobian_multiply_wnaf,
+    "glv": jacobian_multiply_glv,
+}
+MULTIPLY_ENGINE = "glv"
+
+
+def set_multiply_engine(name: str) -> None:
+    global MULTIPLY_ENGINE
+    if name not in MULTIPLY_ENGINES:
+        raise ValueError("unknown multiply engine %r, expected one of %s" % (
+            name, ", ".join(sorted(MULTIPLY_ENGINES))))
+    MULTIPLY_ENGINE = name
+
+
+def jacobian_multiply(a: "PlainPoint3D", n: int, window: int = WNAF_WINDOW) -> "PlainPoint3D":
+    return MULTIPLY_ENGINES[MULTIPLY_ENGINE](a, n, window)
+
+
+# As _jacobian_interleaved, for affine tables: every addition is mixed
+def _jacobian_interleaved_affine(terms: List[Tuple[List["PlainPoint2D"], List[int]]]) -> "PlainPoint3D":
+    o = cast("PlainPoint3D", (0, 0, 1))
+    length = max([len(digits) for _, digits in terms] + [0])
+    for i in range(length - 1, -1, -1):
+        o = jacobian_double(o)
+        for table, digits in terms:
+            if i < len(digits):
+                d = digits[i]
+                if d > 0:
+                    o = jacobian_add_affine(o, table[d >> 1])
+                elif d < 0:
+                    x, y = table[-d >> 1]
+                    o = jacobian_add_affine(o, cast("PlainPoint2D", (x, _P - y)))
+    return o
+
+
+# n * a for one scalar and many bases, e.g. one private key against many
+# peers' public keys in ECDH. The scalar is split and recoded once for all
+# bases. The odd-multiple tables of all bases are normalized together with
+# one inversion so that every addition is a mixed one, and the results with
+# another. Returns the shared points in input order; (0, 0) if n is a
+# multiple of N.
+def batch_ecdh(n: int, pubs: List["PlainPoint2D"], window: int = WNAF_WINDOW) -> List["PlainPoint2D"]:
+    for i, pub in enumerate(pubs):
+        if pub is None or not (0 <= pub[0] < P and 0 <= pub[1] < P) or not is_on_curve(pub):
+            raise ValueError("public key %d is not a point on the curve" % i)
+    n %= N
+    if MULTIPLY_ENGINE == "glv":
+        recoded = _glv_recode(n, window)
+    else:
+        recoded = [(False, wnaf(n, window))] if n else []
+    size = 1 << (window - 2)
+    flat = batch_from_jacobian([
+        p for pub in pubs for p in jacobian_odd_multiples(to_jacobian(pub), window)])
+    out = []
+    for i in range(len(pubs)):
+        table = [(_field.elem(x), _field.elem(y)) for x, y in flat[i * size:(i + 1) * size]]
+        out.append(_jacobian_interleaved_affine([
+            ([((GLV_BETA * x) % _P, y) for x, y in table] if endo else table, digits)
+            for endo, digits in recoded]))
+    return batch_from_jacobian(out)
+
+
+# Fixed-base precomputation. Row i of the table holds d * 2**(window * i) * a
+# for every window digit d, so a multiplication is one mixed addition per
+# window and no doublings at all.
+BASE_TABLE_WINDOW = 8
+
+FixedBaseTable = Tuple[int, List[List["PlainPoint2D"]]]
+
+
+def precompute_fixed_base(a: "PlainPoint2D", window: int = BASE_TABLE_WINDOW) -> FixedBaseTable:
+    if not 1 <= window <= 16:
+        raise ValueError("window must be in range 1-16, got %d" % window)
+    rows_jacobian = []
+    base = to_jacobian(a)
+    for _ in range((N.bit_length() + window - 1) // window):
+        row = [base]
+        for _ in range((1 << window) - 2):
+            row.append(jacobian_add(row[-1], base))
+        rows_jacobian.append(row)
+        base = jacobian_add(row[-1], base)
+    flat = [(_field.elem(x), _field.elem(y)) for x, y in batch_from_jacobian(
+        [p for row in rows_jacobian for p in row])]
+    width = (1 << window) - 1
+    rows = [flat[i:i + width] for i in range(0, len(flat), width)]
+    return window, rows
+
+
+def jacobian_fixed_base_multiply(table: FixedBaseTable, n: int) -> "PlainPoint3D":
+    window, rows = table
+    n %= N
+    mask = (1 << window) - 1
+    o = cast("PlainPoint3D", (0, 0, 1))
+    for row in rows:
+        if not n:
+            break
+        d = n & mask
+        if d:
+            o = jacobian_add_affine(o, row[d - 1])
+        n >>= window
+    return o
+
+
+def fixed_base_table_size(table: FixedBaseTable) -> int:
+    _, rows = table
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for x, y in row:
+            size += sys.getsizeof((x, y)) + sys.getsizeof(x) + sys.getsizeof(y)
+    return size
+
+
+_base_table: Optional[FixedBaseTable] = None
+_base_table_cache_dir: Optional[str] = None
+_base_table_stats: Dict[str, float] = {}
+
+
+# Load (or switch to a different window) the generator table. Wider windows
+# mean fewer additions per multiplication but exponentially more points:
+# 2**window - 1 per row, ceil(256 / window) rows. The table is built once
+# and persisted in the curves cache (see curves.py); later processes map the
+# cached file instead of building it again.
+def precompute_base_table(window: int = BASE_TABLE_WINDOW, cache_dir: Optional[str] = None) -> Dict[str, float]:
+    global _base_table, _base_table_cache_dir, _base_table_stats
+    if not 1 <= window <= 16:
+        raise ValueError("window must be in range 1-16, got %d" % window)
+    start = time.perf_counter()
+    rows, cached = curves.load_fixed_base_table(
+        curves.SECP256K1, window, lambda: precompute_fixed_base(G, window)[1], cache_dir)
+    table = (window, [[(_field.elem(x), _field.elem(y)) for x, y in row] for row in rows])
+    build_time = time.perf_counter() - start
+    _base_table = table
+    _base_table_cache_dir = cache_dir
+    _base_table_stats = {
+        "window": window,
+        "points": sum(len(row) for row in table[1]),
+        "additions_per_multiply": len(table[1]),
+        "build_seconds": build_time,
+        "bytes": fixed_base_table_size(table),
+        "cached": cached,
+    }
+    return dict(_base_table_stats)
+
+
+def base_table_stats() -> Dict[str, float]:
+    _get_base_table()
+    return dict(_base_table_stats)
+
+
+def _get_base_table() -> FixedBaseTable:
+    if _base_table is None:
+        precompute_base_table()
+    return cast(FixedBaseTable, _base_table)
 
 
 def multiply(a: "PlainPoint2D", n: int) -> "PlainPoint2D":
-    return from_jacobian(jacobian_multiply(to_jacobian(a), n))
+    return (AffinePoint(*a) * n).to_affine().to_tuple()
+
+
+# From this many points on, multi-scalar multiplications use Pippenger's
+# bucket method instead of Strauss' per-point tables
+PIPPENGER_MIN_POINTS = 32
+
+
+# sum(n_i * a_i) with one shared doubling chain (Strauss-Shamir). Scalars on
+# G are folded together and taken from the fixed-base table, the remaining
+# terms are split with GLV when that engine is selected (unless they are
+# half length already). Large sums go to jacobian_pippenger_multi_multiply.
+#
+# The batch verifiers (ecdsa_batch_verify here, batch_verify in ibs-secpk1
+# and identity-signatures) are built on this. Each signature scheme has an
+# equation that sums to infinity for a valid signature; weighting every
+# signature's terms by its own random odd 128-bit factor and adding them
+# all up gives a sum that is still infinity when all are valid, and misses
+# it with probability about 2**-128 otherwise. Terms on a shared point (G,
+# a public key) fold into a single scalar, so a whole batch costs one
+# multi-scalar multiplication. When the sum is not infinity each signature
+# is verified on its own to find the bad ones; the verifiers return their
+# indices, so an empty list means all passed.
+def jacobian_multi_multiply(pairs: List[Tuple["PlainPoint3D", int]], window: int = WNAF_WINDOW) -> "PlainPoint3D":
+    g_scalar = 0
+    rest = []
+    for a, n in pairs:
+        n %= N
+        if a[1] == 0 or n == 0:
+            continue
+        if a[2] == 1 and a[0] == Gx and a[1] == Gy:
+            g_scalar += n
+        else:
+            rest.append((a, n))
+    if len(rest) >= PIPPENGER_MIN_POINTS:
+        o = jacobian_pippenger_multi_multiply(rest)
+    else:
+        terms = []
+        for a, n in rest:
+            if MULTIPLY_ENGINE == "glv" and n.bit_length() > 128:
+                terms.extend(_glv_terms(a, n, window))
+            else:
+                terms.append((jacobian_odd_multiples(a, window), wnaf(n, window)))
+        o = _jacobian_interleaved(terms)
+    if g_scalar % N:
+        o = jacobian_add(o, jacobian_fixed_base_multiply(_get_base_table(), g_scalar))
+    return o
+
+
+# Bucket window for pippenger_multi_multiply, by number of (GLV-split) terms
+def pippenger_window(terms: int) -> int:
+    return max(2, terms.bit_length() - 3)
+
+
+# sum(n_i * a_i) with Pippenger's bucket method, for large numbers of terms
+# where Strauss' per-point tables stop paying off. Scalars are GLV-split
+# (when that engine is selected) and the points normalized to affine
+# together with one inversion. Each window then drops every point into the
+# bucket of its digit with a mixed addition and sums the buckets with a
+# running sum: about terms + 2**(window+1) additions per window instead of
+# one table per point.
+def jacobian_pippenger_multi_multiply(pairs: List[Tuple["PlainPoint3D", int]], window: Optional[int] = None) -> "PlainPoint3D":
+    live = [(a, n % N) for a, n in pairs if a[1] and a[2] and n % N]
+    points = []
+    scalars = []
+    # Scalars that are already half length (e.g. random batch weights) are
+    # left whole: splitting them would only double their points
+    split = [glv_split(n) if MULTIPLY_ENGINE == "glv" and n.bit_length() > 128 else (n, 0)
+             for _, n in live]
+    for a, (k1, k2) in zip(batch_from_jacobian([a for a, _ in live]), split):
+        x, y = _field.elem(a[0]), _field.elem(a[1])
+        for pt, k in (((x, y), k1), (((GLV_BETA * x) % _P, y), k2)):
+            if k < 0:
+                pt, k = (pt[0], _P - pt[1]), -k
+            if k:
+                points.append(pt)
+                scalars.append(k)
+    if not points:
+        return cast("PlainPoint3D", (0, 0, 1))
+    if window is None:
+        window = pippenger_window(len(points))
+    mask = (1 << window) - 1
+    o = cast("PlainPoint3D", (0, 0, 1))
+    for shift in range((max(scalars).bit_length() - 1) // window * window, -1, -window):
+        for _ in range(window):
+            o = jacobian_double(o)
+        buckets: List[Any] = [None] * (mask + 1)
+        for pt, k in zip(points, scalars):
+            d = (k >> shift) & mask
+            if d:
+                b = buckets[d]
+                buckets[d] = (pt[0], pt[1], 1) if b is None else jacobian_add_affine(b, pt)
+        # sum(d * bucket[d]) == sum over d of (bucket[mask] + ... + bucket[d])
+        running = cast("PlainPoint3D", (0, 0, 1))
+        for d in range(mask, 0, -1):
+            if buckets[d] is not None:
+                running = jacobian_add(running, buckets[d])
+            o = jacobian_add(o, running)
+    return o
+
+
+def pippenger_multi_multiply(pairs: List[Tuple["PlainPoint2D", int]]) -> "PlainPoint2D":
+    return from_jacobian(jacobian_pippenger_multi_multiply(
+        [(to_jacobian(a), n) for a, n in pairs]))
+
+
+def multi_multiply(pairs: List[Tuple["PlainPoint2D", int]]) -> "PlainPoint2D":
+    return from_jacobian(jacobian_multi_multiply(
+        [(to_jacobian(a), n) for a, n in pairs]))
+
+
+# Point objects. A JacobianPoint stays in Jacobian form through any chain of
+# additions and multiplications and is only normalized (one inversion) when
+# its affine coordinates are asked for. Adding an AffinePoint to it uses the
+# cheaper mixed addition. (0, 0) stands for the point at infinity, as it
+# does for the tuple functions.
+class AffinePoint:
+
+    __slots__ = ("x", "y")
+
+    def __init__(self, x: int, y: int) -> None:
+        self.x = x
+        self.y = y
+
+    def is_infinity(self) -> bool:
+        return not self.y
+
+    def to_tuple(self) -> "PlainPoint2D":
+        return cast("PlainPoint2D", (self.x, self.y))
+
+    def to_jacobian(self) -> "JacobianPoint":
+        return JacobianPoint(self.x, self.y, 1)
+
+    def to_affine(self) -> "AffinePoint":
+        return self
+
+    def __iter__(self):
+        return iter((self.x, self.y))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, JacobianPoint):
+            return other == self
+        if isinstance(other, AffinePoint):
+            return self.x == other.x and self.y == other.y
+        if isinstance(other, tuple):
+            return (self.x, self.y) == other
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.x, self.y))
+
+    def __repr__(self) -> str:
+        return "AffinePoint(%d, %d)" % (self.x, self.y)
+
+    def __neg__(self) -> "AffinePoint":
+        return AffinePoint(self.x, (P - self.y) % P)
+
+    def __add__(self, other: "Point") -> "JacobianPoint":
+        if isinstance(other, AffinePoint):
+            return self.to_jacobian() + other
+        if isinstance(other, JacobianPoint):
+            return other + self
+        return NotImplemented
+
+    def __sub__(self, other: "Point") -> "JacobianPoint":
+        return self + (-other)
+
+    def __mul__(self, n: int) -> "JacobianPoint":
+        if self.x == Gx and self.y == Gy:
+            return JacobianPoint(*jacobian_fixed_base_multiply(_get_base_table(), n))
+        return JacobianPoint(*jacobian_multiply(to_jacobian(self.to_tuple()), n))
+
+    __rmul__ = __mul__
+
+
+class JacobianPoint:
+
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x: int, y: int, z: int) -> None:
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def is_infinity(self) -> bool:
+        return not self.y or not self.z
+
+    def to_tuple(self) -> "PlainPoint3D":
+        return cast("PlainPoint3D", (self.x, self.y, self.z))
+
+    def to_jacobian(self) -> "JacobianPoint":
+        return self
+
+    def to_affine(self) -> AffinePoint:
+        if self.is_infinity():
+            return AffinePoint(0, 0)
+        return AffinePoint(*from_jacobian(self.to_tuple()))
+
+    @staticmethod
+    def batch_to_affine(points: List["JacobianPoint"]) -> List[AffinePoint]:
+        return [AffinePoint(x, y) for x, y in batch_from_jacobian(
+            [(0, 0, 0) if p.is_infinity() else p.to_tuple() for p in points])]
+
+    def __iter__(self):
+        return iter(self.to_affine())
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, tuple):
+            other = AffinePoint(*other)
+        if not isinstance(other, (AffinePoint, JacobianPoint)):
+            return NotImplemented
+        other = other.to_jacobian()
+        if self.is_infinity() or other.is_infinity():
+            return self.is_infinity() and other.is_infinity()
+        z1, z2 = self.z * self.z, other.z * other.z
+        return (self.x * z2 - other.x * z1) % P == 0 and \
+            (self.y * z2 * other.z - other.y * z1 * self.z) % P == 0
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return "JacobianPoint(%d, %d, %d)" % (self.x, self.y, self.z)
+
+    def __neg__(self) -> "JacobianPoint":
+        return JacobianPoint(self.x, (P - self.y) % P, self.z)
+
+    def __add__(self, other: "Point") -> "JacobianPoint":
+        if isinstance(other, AffinePoint):
+            return JacobianPoint(*jacobian_add_affine(self.to_tuple(), other.to_tuple()))
+        if isinstance(other, JacobianPoint):
+            return JacobianPoint(*jacobian_add(self.to_tuple(), other.to_tuple()))
+        return NotImplemented
+
+    def __sub__(self, other: "Point") -> "JacobianPoint":
+        return self + (-other)
+
+    def __mul__(self, n: int) -> "JacobianPoint":
+        return JacobianPoint(*jacobian_multiply(self.to_tuple(), n))
+
+    __rmul__ = __mul__
+
+
+Point = Union[AffinePoint, JacobianPoint]
 
 
 def add(a: "PlainPoint2D", b: "PlainPoint2D") -> "PlainPoint2D":
-    return from_jacobian(jacobian_add(to_jacobian(a), to_jacobian(b)))
+    return (AffinePoint(*a).to_jacobian() + AffinePoint(*b)).to_affine().to_tuple()
 
 
 # bytes32
@@ -172,32 +830,204 @@ def ecdsa_raw_sign(msghash: bytes, priv: bytes) -> Tuple[int, int, int]:
     return v, r, s
 
 
-def ecdsa_raw_recover(msghash: bytes, vrs: Tuple[int, int, int]) -> "PlainPoint2D":
+# The curve point with the given x coordinate and y parity, using the
+# (P + 1) / 4 square root (P == 3 mod 4)
+def lift_x(x: int, odd: int) -> "PlainPoint2D":
+    xcubedaxb = (x * x * x + A * x + B) % P
+    beta = _field.sqrt(xcubedaxb, P)
+    y = beta if beta % 2 == odd else (P - beta)
+    # If xcubedaxb is not a quadratic residue, then x cannot be the x coord
+    # for a point on the curve
+    if not 0 <= x < P or (xcubedaxb - y * y) % P != 0:
+        raise ValueError("%d cannot be the x coord for point on curve" % x)
+    return cast("PlainPoint2D", (x, int(y)))
+
+
+# The point R of a signature, with x == r and y picked by the parity in v
+def _recover_r_point(vrs: Tuple[int, int, int]) -> "PlainPoint2D":
     v, r, s = vrs
     if not (27 <= v <= 34):
         raise ValueError("%d must in range 27-31" % v)
-    x = r
-    xcubedaxb = (x * x * x + A * x + B) % P
-    beta = pow(xcubedaxb, (P + 1) // 4, P)
-    y = beta if v % 2 ^ beta % 2 else (P - beta)
-    # If xcubedaxb is not a quadratic residue, then r cannot be the x coord
-    # for a point on the curve, and so the sig is invalid
-    if (xcubedaxb - y * y) % P != 0 or not (r % N) or not (s % N):
+    try:
+        if not (r % N) or not (s % N):
+            raise ValueError
+        return lift_x(r, (v + 1) % 2)
+    except ValueError:
         raise ValueError(
             "sig is invalid, %d cannot be the x coord for point on curve" % r)
+
+
+# Q = r^-1 * (s * R - z * G)
+def _jacobian_recover(msghash: bytes, R: "PlainPoint2D", s: int, r_inv: int) -> "PlainPoint3D":
     z = bytes_to_int(msghash)
-    Gz = jacobian_multiply(cast("PlainPoint3D", (Gx, Gy, 1)), (N - z) % N)
-    XY = jacobian_multiply(cast("PlainPoint3D", (x, y, 1)), s)
-    Qr = jacobian_add(Gz, XY)
-    Q = jacobian_multiply(Qr, inv(r, N))
+    return jacobian_multi_multiply([
+        (cast("PlainPoint3D", (Gx, Gy, 1)), (N - z) * r_inv),
+        (to_jacobian(R), s * r_inv),
+    ])
+
+
+def ecdsa_raw_recover(msghash: bytes, vrs: Tuple[int, int, int]) -> "PlainPoint2D":
+    R = _recover_r_point(vrs)
+    _, r, s = vrs
+    Q = _jacobian_recover(msghash, R, s, inv(r, N))
     Q_jacobian = from_jacobian(Q)
 
     return Q_jacobian
 
 
+# Recover the signers of many signatures at once. The r^-1 values and the
+# final affine normalization each cost one inversion for the whole batch.
+# Results come back in input order; an invalid signature yields its
+# ValueError in place of a point instead of aborting the batch.
+def ecdsa_batch_recover(
+    sigs: List[Tuple[bytes, Tuple[int, int, int]]],
+) -> List[Union["PlainPoint2D", ValueError]]:
+    results: List[Union["PlainPoint2D", ValueError]] = [
+        cast("PlainPoint2D", None)] * len(sigs)
+    valid = []
+    for i, (msghash, vrs) in enumerate(sigs):
+        try:
+            valid.append((i, msghash, _recover_r_point(vrs), vrs[2], vrs[1]))
+        except ValueError as e:
+            results[i] = e
+    r_invs = batch_inv([r for _, _, _, _, r in valid], N)
+    Qs = [_jacobian_recover(msghash, R, s, r_inv)
+          for (_, msghash, R, s, _), r_inv in zip(valid, r_invs)]
+    for (i, _, _, _, _), Q in zip(valid, batch_from_jacobian(Qs)):
+        results[i] = Q
+    return results
+
+
+# Standard ECDSA verification against a known public key. v is not needed
+# here and is ignored.
+def ecdsa_raw_verify(msghash: bytes, vrs: Tuple[int, int, int], pub: "PlainPoint2D") -> bool:
+    _, r, s = vrs
+    # is_on_curve accepts the point at infinity, which is no public key
+    if pub is None or not (0 < r < N and 0 < s < N) or not is_on_curve(pub):
+        return False
+    w = inv(s, N)
+    X = jacobian_multi_multiply([
+        (cast("PlainPoint3D", (Gx, Gy, 1)), bytes_to_int(msghash) * w),
+        (to_jacobian(pub), r * w),
+    ])
+    x, y, z = X
+    if not y or not z:
+        return False
+    # Compare x / z^2 against r (or r + N) without leaving Jacobian form
+    z2 = (z * z) % P
+    return (x - r * z2) % P == 0 or (r + N < P and (x - (r + N) * z2) % P == 0)
+
+
+# Batch verification (see jacobian_multi_multiply): with the R point
+# recovered from (v, r), a valid signature satisfies
+# s^-1 * (z * G + r * Q) - R == 0.
+def ecdsa_batch_verify(sigs: List[Tuple[bytes, Tuple[int, int, int], "PlainPoint2D"]]) -> List[int]:
+    batched = []
+    single = []
+    for i, (msghash, vrs, pub) in enumerate(sigs):
+        _, r, s = vrs
+        if pub is None or not (0 < r < N and 0 < s < N) or not is_on_curve(pub):
+            single.append(i)
+            continue
+        try:
+            batched.append((i, msghash, _recover_r_point(vrs), r, s, pub))
+        except ValueError:
+            single.append(i)
+    g_scalar = 0
+    pairs: List[Tuple["PlainPoint3D", int]] = []
+    for (_, msghash, R, r, _, pub), w in zip(batched, batch_inv([s for _, _, _, _, s, _ in batched], N)):
+        a = secrets.randbits(128) | 1
+        g_scalar += a * w * bytes_to_int(msghash)
+        pairs.append((to_jacobian(pub), a * w * r))
+        pairs.append((to_jacobian(R), -a))
+    pairs.append((cast("PlainPoint3D", (Gx, Gy, 1)), g_scalar))
+    if batched and jacobian_multi_multiply(pairs)[1]:
+        single.extend(i for i, _, _, _, _, _ in batched)
+    return sorted(i for i in single if not ecdsa_raw_verify(*sigs[i]))
+
+
+# SEC1 encoding: 02/03 || x when compressed, 04 || x || y otherwise
+def encode_pubkey(pub: "PlainPoint2D", compressed: bool = True) -> bytes:
+    x, y = pub
+    if compressed:
+        return bytes([2 + (y & 1)]) + x.to_bytes(32, 'big')
+    return b'\x04' + x.to_bytes(32, 'big') + y.to_bytes(32, 'big')
+
+
+# Accepts compressed or uncompressed SEC1, and the raw 64-byte x || y form
+# that pub_to_address hashes
+def decode_pubkey(data: bytes) -> "PlainPoint2D":
+    if len(data) == 33 and data[0] in (2, 3):
+        return lift_x(int.from_bytes(data[1:], 'big'), data[0] & 1)
+    if len(data) == 65 and data[0] == 4:
+        data = data[1:]
+    if len(data) != 64:
+        raise ValueError("not a SEC1 encoded public key: %s" % bytes(data).hex())
+    pub = cast("PlainPoint2D", (int.from_bytes(data[:32], 'big'), int.from_bytes(data[32:], 'big')))
+    if not (pub[0] < P and pub[1] < P and is_on_curve(pub)):
+        raise ValueError("point is not on the curve: %s" % bytes(data).hex())
+    return pub
+
+
 def pub_to_address(pubKey: "PlainPoint2D") -> str:
     x, y = pubKey
     concat_x_y = x.to_bytes(32, byteorder='big') + \
         y.to_bytes(32, byteorder='big')
 
     return '0x' + keccak.hasher(concat_x_y)[-20:].hex()
+
+
+_generator_multiples: List["PlainPoint2D"] = []
+
+
+# [G, 2G, ..., count * G]. One table for every caller: it is extended when
+# a larger count is asked for, so it is only ever as big as the largest
+# block size in use.
+def _get_generator_multiples(count: int) -> List["PlainPoint2D"]:
+    if len(_generator_multiples) < count:
+        G3 = to_jacobian(G)
+        last = to_jacobian(_generator_multiples[-1]) if _generator_multiples else None
+        multiples = []
+        for _ in range(count - len(_generator_multiples)):
+            last = G3 if last is None else jacobian_add(last, G3)
+            multiples.append(last)
+        _generator_multiples.extend(batch_from_jacobian(multiples))
+    return _generator_multiples[:count]
+
+
+# Stream (k, pubkey, address) for k = start, start + 1, ..., start + count - 1,
+# skipping any k that is a multiple of N.
+# Only start * G is a full multiplication. Every block of block_size keys is
+# then start' * G + i * G for a cached table of small multiples, computed as
+# independent affine additions whose slope denominators share one batched
+# inversion. The step to the next block is part of the same batch.
+def enumerate_addresses(
+    start: int, count: int, block_size: int = 256,
+) -> Iterator[Tuple[int, "PlainPoint2D", str]]:
+    if block_size < 1:
+        raise ValueError("block_size must be positive, got %d" % block_size)
+    multiples = _get_generator_multiples(block_size)
+    Q = multiply(G, start)
+    k = start
+    while count > 0:
+        size = min(block_size, count)
+        qx, qy = Q
+        # Q + i*G for i = 1..size; the last one is the next block's base
+        denominators = [mx - qx for mx, _ in multiples[:size]]
+        inverses = batch_inv(denominators, P) if qy else [0] * size
+        block = [Q]
+        for (mx, my), d_inv in zip(multiples[:size], inverses):
+            if not d_inv:
+                # Q is infinity, or Q == +-(i*G): take the general path
+                block.append(add(Q, (mx, my)))
+                continue
+            lam = ((my - qy) * d_inv) % P
+            x = (lam * lam - qx - mx) % P
+            block.append(cast("PlainPoint2D", (x, (lam * (qx - x) - qy) % P)))
+        for i in range(size):
+            # k == 0 mod N is the point at infinity, which has no address
+            if block[i] != (0, 0):
+                yield k + i, block[i], pub_to_address(block[i])
+        Q = block[size]
+        k += size
+        count -= size
@@ -1,8 +1,12 @@
-import sys
 import random
 import pytest
 
 
+from typing import (
+    Iterator,
+    Optional,
+)
+
 from py_ecc.utils import (
     prime_field_inv,
 )
@@ -15,7 +19,12 @@ from py_ecc.typing import (
 
 random.seed(a='tests2', version=2)
 
-sys.setrecursionlimit(10000000)
+# Window of the fixed-base table built for a MainKey's public key the first
+# time it generates enough addresses to pay for it. Below
+# PUBLIC_KEY_TABLE_MIN_ADDRESSES the table costs more to build than it saves
+# (the two break even at about 64; `bench-secp256k1.py stealth-table`).
+PUBLIC_KEY_TABLE_WINDOW = 6
+PUBLIC_KEY_TABLE_MIN_ADDRESSES = 64
 
 
 def string_to_number(id: str) -> int:
@@ -23,6 +32,27 @@ def string_to_number(id: str) -> int:
     return int.from_bytes(id_hash, "big") % secp256k1.N
 
 
+# What a stealth address is derived from: the hash of the shared secret.
+# Its first byte is the announcement's view tag, which lets the recipient
+# rule out almost every announcement that is not theirs after the DH alone.
+def shared_secret_hash(shared_secret: "PlainPoint2D") -> bytes:
+    ssx, ssy = shared_secret
+    return keccak.hasher(f"{ssx}{ssy}".encode("utf-8"))
+
+
+def view_tag(shared_secret: "PlainPoint2D") -> int:
+    return shared_secret_hash(shared_secret)[0]
+
+
+# A published announcement: the compressed ephemeral public key, followed
+# by the view tag when the shared secret is given
+def announcement(ephemeral_public_key: "PlainPoint2D", shared_secret: Optional["PlainPoint2D"] = None) -> bytes:
+    record = secp256k1.encode_pubkey(ephemeral_public_key)
+    if shared_secret is not None:
+        record += bytes([view_tag(shared_secret)])
+    return record
+
+
 def random_scalar():
     return random.randint(0, secp256k1.N) % secp256k1.N
 
@@ -31,39 +61,67 @@ class MainKey:
 
     curve = secp256k1
 
-    def __init__(self) -> None:
-        self.secret_key = random_scalar()
+    def __init__(self, secret_key: Optional[int] = None) -> None:
+        self.secret_key = random_scalar() if secret_key is None else secret_key
         self.public_key = secp256k1.multiply(secp256k1.G, self.secret_key)
+        self._public_key_table: Optional[secp256k1.FixedBaseTable] = None
 
     def generate_stealth_address(self, num_addresses: int) -> list[tuple["PlainPoint2D", int, "PlainPoint2D"]]:
+        return list(self.iter_stealth_addresses(num_addresses))
+
+    # Same addresses as generate_stealth_address, yielded lazily; with
+    # num_addresses=None the stream never ends. Addresses are worked out a
+    # block at a time: the shared secret is computed once, on the sender
+    # side, multiplications use fixed-base tables (for G, and for this key's
+    # public key once the stream is long enough to pay for one), and each
+    # block is normalized with one inversion per stage, so memory stays at
+    # one block however many are generated.
+    def iter_stealth_addresses(
+        self,
+        num_addresses: Optional[int] = None,
+        block_size: int = 256,
+    ) -> Iterator[tuple["PlainPoint2D", int, "PlainPoint2D"]]:
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1, got %d" % block_size)
         ephemeral_key = random_scalar()
 
-        keys = []
-
-        for _ in range(num_addresses):
-
-            ephemeral_public_key = secp256k1.multiply(
-                secp256k1.G, ephemeral_key)
-
-            shared_secret_1 = secp256k1.multiply(
-                ephemeral_public_key, self.secret_key)
-            shared_secret_2 = secp256k1.multiply(
-                self.public_key, ephemeral_key)
-            assert shared_secret_1 == shared_secret_2
-            ssx, ssy = shared_secret_1
-            str_sxy = f"{ssx}{ssy}"
-            s = string_to_number(str_sxy)
-            sG = secp256k1.multiply(secp256k1.G, s)
-
-            stealth_private_key = s + self.secret_key
-            stealth_public_key = secp256k1.add(sG, self.public_key)
-
-            keys.append(
-                (ephemeral_public_key, stealth_private_key, stealth_public_key))
-
-            ephemeral_key = (ephemeral_key*ephemeral_key) % secp256k1.N
-
-        return keys
+        if self._public_key_table is None and (
+                num_addresses is None or num_addresses >= PUBLIC_KEY_TABLE_MIN_ADDRESSES):
+            self._public_key_table = secp256k1.precompute_fixed_base(
+                self.public_key, PUBLIC_KEY_TABLE_WINDOW)
+        table = self._public_key_table
+        G = secp256k1.AffinePoint(*secp256k1.G)
+        public_key = secp256k1.AffinePoint(*self.public_key)
+
+        remaining = num_addresses
+        while remaining is None or remaining > 0:
+            count = block_size if remaining is None else min(block_size, remaining)
+            ephemeral_keys = []
+            for _ in range(count):
+                ephemeral_keys.append(ephemeral_key)
+                ephemeral_key = (ephemeral_key*ephemeral_key) % secp256k1.N
+
+            if table is None:
+                shared = [public_key * e for e in ephemeral_keys]
+            else:
+                shared = [secp256k1.JacobianPoint(*secp256k1.jacobian_fixed_base_multiply(table, e))
+                          for e in ephemeral_keys]
+            points = secp256k1.JacobianPoint.batch_to_affine(
+                [G * e for e in ephemeral_keys] + shared)
+            ephemeral_public_keys, shared_secrets = points[:count], points[count:]
+
+            tweaks = [string_to_number(f"{ss.x}{ss.y}") for ss in shared_secrets]
+            stealth_public_keys = secp256k1.JacobianPoint.batch_to_affine(
+                [G * s + public_key for s in tweaks])
+
+            for ephemeral_public_key, s, stealth_public_key in zip(
+                    ephemeral_public_keys, tweaks, stealth_public_keys):
+                stealth_private_key = s + self.secret_key
+                yield (ephemeral_public_key.to_tuple(), stealth_private_key,
+                       stealth_public_key.to_tuple())
+
+            if remaining is not None:
+                remaining -= count
 
 
 if __name__ == "__main__":
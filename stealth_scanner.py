@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+import parallel
+import secp256k1
+import stealth_address
+from atomic_file import atomic_write
+
+if TYPE_CHECKING:
+    from py_ecc.typing import (  # noqa: F401
+        PlainPoint2D,
+    )
+
+
+# Announcements are packed back to back in a file: the 33-byte compressed
+# ephemeral public key, followed by a 1-byte view tag when the file has
+# them. Fixed-size records let a resumed scan seek straight to where it
+# stopped.
+ANNOUNCEMENT_SIZE = 33
+TAGGED_ANNOUNCEMENT_SIZE = 34
+
+# (announcement index, stealth address, stealth private key)
+Match = Tuple[int, str, int]
+
+
+# Receiver side of stealth_address: for each announcement R, the shared
+# secret secret_key * R gives the tweak s and the stealth address of
+# s * G + public_key. The shared secrets of a chunk come from one batch_ecdh
+# call, a view tag mismatch rules an announcement out before any further
+# work, and the surviving stealth public keys are normalized together.
+# Malformed announcements are skipped. With watched None every derived
+# address is reported.
+def scan_chunk(
+    secret_key: int,
+    public_key: "PlainPoint2D",
+    watched: Optional[Set[str]],
+    start: int,
+    data: bytes,
+    record_size: int,
+) -> List[Match]:
+    tagged = record_size == TAGGED_ANNOUNCEMENT_SIZE
+    indices = []
+    points = []
+    tags = []
+    for offset in range(0, len(data) - record_size + 1, record_size):
+        try:
+            points.append(secp256k1.decode_pubkey(data[offset:offset + ANNOUNCEMENT_SIZE]))
+        except ValueError:
+            continue
+        indices.append(start + offset // record_size)
+        tags.append(data[offset + ANNOUNCEMENT_SIZE] if tagged else None)
+
+    candidates = []
+    for index, tag, shared_secret in zip(indices, tags, secp256k1.batch_ecdh(secret_key, points)):
+        h = stealth_address.shared_secret_hash(shared_secret)
+        if tag is not None and h[0] != tag:
+            continue
+        candidates.append((index, int.from_bytes(h, "big") % secp256k1.N))
+
+    G = secp256k1.AffinePoint(*secp256k1.G)
+    pub = secp256k1.AffinePoint(*public_key)
+    stealth_public_keys = secp256k1.JacobianPoint.batch_to_affine(
+        [G * s + pub for _, s in candidates])
+    matches = []
+    for (index, s), stealth_public_key in zip(candidates, stealth_public_keys):
+        address = secp256k1.pub_to_address(stealth_public_key.to_tuple())
+        if watched is None or address in watched:
+            matches.append((index, address, s + secret_key))
+    return matches
+
+
+# Per-worker copy of the scan parameters, sent once when the pool starts
+_worker_args: Tuple[Any, ...] = ()
+
+
+def _init_worker(secret_key: int, watched: Optional[Set[str]]) -> None:
+    global _worker_args
+    secp256k1.precompute_base_table()
+    _worker_args = (secret_key, secp256k1.multiply(secp256k1.G, secret_key), watched)
+
+
+# (announcements scanned once this chunk is done, its matches)
+def _scan_chunk(start: int, data: bytes, record_size: int) -> Tuple[int, List[Match]]:
+    return (start + len(data) // record_size,
+            scan_chunk(*_worker_args, start, data, record_size))
+
+
+def _chunks(f: BinaryIO, start: int, record_size: int, chunk_size: int) -> Iterator[Tuple[int, bytes]]:
+    while True:
+        data = f.read(chunk_size * record_size)
+        if len(data) < record_size:
+            return
+        yield start, data
+        start += len(data) // record_size
+
+
+# Scan the announcements in f, starting at announcement index start (f must
+# be positioned there). Yields (announcements scanned so far, matches) per
+# chunk, in input order. Chunks are scanned on a process pool with at most
+# max_pending in flight; workers == 1 scans in this process.
+def scan(
+    f: BinaryIO,
+    secret_key: int,
+    watched: Optional[Set[str]] = None,
+    view_tags: bool = False,
+    workers: Optional[int] = None,
+    chunk_size: int = 4096,
+    max_pending: Optional[int] = None,
+    start: int = 0,
+) -> Iterator[Tuple[int, List[Match]]]:
+    record_size = TAGGED_ANNOUNCEMENT_SIZE if view_tags else ANNOUNCEMENT_SIZE
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(f, start, record_size, chunk_size)
+    if workers == 1:
+        public_key = secp256k1.multiply(secp256k1.G, secret_key)
+        for chunk_start, data in chunks:
+            yield (chunk_start + len(data) // record_size,
+                   scan_chunk(secret_key, public_key, watched, chunk_start, data, record_size))
+        return
+    yield from parallel.imap_ordered(
+        _scan_chunk, ((chunk_start, data, record_size) for chunk_start, data in chunks),
+        workers, _init_worker, (secret_key, watched), max_pending)
+
+
+def _write_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    with atomic_write(path) as f:
+        json.dump(state, f)
+
+
+# Scan a whole announcements file and return its matches. With a checkpoint
+# path, progress and the matches found so far are saved there (atomically,
+# at most every checkpoint_interval seconds and at the end), and a later
+# call with the same checkpoint carries on from where the last one stopped.
+def scan_file(
+    path: str,
+    secret_key: int,
+    watched: Optional[Set[str]] = None,
+    view_tags: bool = False,
+    checkpoint: Optional[str] = None,
+    checkpoint_interval: float = 30.0,
+    **kwargs: Any,
+) -> List[Match]:
+    record_size = TAGGED_ANNOUNCEMENT_SIZE if view_tags else ANNOUNCEMENT_SIZE
+    # Identifies the scan, so a checkpoint is never resumed against another
+    # key or announcements file
+    scan_id = {
+        "announcements": os.path.abspath(path),
+        "record_size": record_size,
+        "public_key": secp256k1.encode_pubkey(secp256k1.multiply(secp256k1.G, secret_key)).hex(),
+    }
+    scanned = 0
+    matches: List[Match] = []
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            state = json.load(f)
+        if state["scan"] != scan_id:
+            raise ValueError("%s is a checkpoint for a different scan" % checkpoint)
+        scanned = state["scanned"]
+        matches = [(i, address, int(key, 16)) for i, address, key in state["matches"]]
+
+    def save() -> None:
+        if checkpoint is not None:
+            _write_checkpoint(checkpoint, {
+                "scan": scan_id,
+                "scanned": scanned,
+                "matches": [(i, address, "%064x" % key) for i, address, key in matches],
+            })
+
+    last_save = time.monotonic()
+    with open(path, "rb") as f:
+        f.seek(scanned * record_size)
+        for scanned, chunk_matches in scan(f, secret_key, watched, view_tags, start=scanned, **kwargs):
+            matches.extend(chunk_matches)
+            if time.monotonic() - last_save >= checkpoint_interval:
+                save()
+                last_save = time.monotonic()
+    save()
+    return matches
+
+
+# count announcements, of which every hundredth is a real payment to main_key
+# (with its view tag); the rest are random points with random tags
+def random_announcements(
+    main_key: stealth_address.MainKey, count: int, seed: str = 'stealth-scanner',
+) -> Tuple[bytes, Set[str]]:
+    rng = random.Random(seed)
+    payments = main_key.iter_stealth_addresses()
+    records = []
+    watched = set()
+    start = rng.randrange(1, secp256k1.N - count)
+    for i, (_, pub, _) in enumerate(secp256k1.enumerate_addresses(start, count)):
+        if i % 100 == 0:
+            ephemeral_public_key, _, stealth_public_key = next(payments)
+            shared_secret = secp256k1.multiply(ephemeral_public_key, main_key.secret_key)
+            records.append(stealth_address.announcement(ephemeral_public_key, shared_secret))
+            watched.add(secp256k1.pub_to_address(stealth_public_key))
+        else:
+            records.append(secp256k1.encode_pubkey(pub) + bytes([rng.randrange(256)]))
+    return b"".join(records), watched
+
+
+def benchmark(count: int, worker_counts: List[int], chunk_size: int) -> None:
+    main_key = stealth_address.MainKey()
+    data, watched = random_announcements(main_key, count)
+    untagged = b"".join(data[i:i + ANNOUNCEMENT_SIZE]
+                        for i in range(0, len(data), TAGGED_ANNOUNCEMENT_SIZE))
+    print("Scanning %d announcements for %d payments" % (count, len(watched)))
+    with tempfile.TemporaryDirectory() as tmp:
+        for view_tags, records in ((False, untagged), (True, data)):
+            path = os.path.join(tmp, "announcements")
+            with open(path, "wb") as f:
+                f.write(records)
+            for workers in worker_counts:
+                start_time = time.perf_counter()
+                matches = scan_file(path, main_key.secret_key, watched, view_tags,
+                                    workers=workers, chunk_size=chunk_size)
+                t = time.perf_counter() - start_time
+                assert len(matches) == len(watched)
+                print("\t%-12s %2d workers: %8.0f announcements/s (took %.2fs)" % (
+                    "view tags," if view_tags else "no tags,", workers, count / t, t))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Scan stealth address announcements for payments to a key")
+    parser.add_argument("announcements", nargs="?",
+                        help="file of packed 33-byte compressed ephemeral public keys "
+                             "(34 bytes with --view-tags)")
+    parser.add_argument("--secret-key-file",
+                        help="file holding the recipient's secret key in hex")
+    parser.add_argument("--watch",
+                        help="file of stealth addresses to look for, one per line "
+                             "(default: report every derived address)")
+    parser.add_argument("--view-tags", action="store_true",
+                        help="every announcement carries a 1-byte view tag")
+    parser.add_argument("--checkpoint",
+                        help="save progress here and resume from it if it exists")
+    parser.add_argument("-o", "--output", default="-",
+                        help="where to write '<index> <address> <stealth key hex>' lines, - for stdout")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("--benchmark", type=int, metavar="COUNT",
+                        help="scan COUNT random announcements with 1..WORKERS workers "
+                             "and report throughput")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        worker_counts = sorted({1, args.workers} | {
+            w for w in (2, 4, 8, 16, 32) if w < args.workers})
+        benchmark(args.benchmark, worker_counts, args.chunk_size)
+        return
+    if not args.announcements or not args.secret_key_file:
+        parser.error("announcements and --secret-key-file are required")
+
+    with open(args.secret_key_file) as f:
+        secret_key = int(f.read().strip(), 16)
+    watched = None
+    if args.watch:
+        with open(args.watch) as f:
+            watched = {line.strip().lower() for line in f if line.strip()}
+
+    start_time = time.perf_counter()
+    matches = scan_file(args.announcements, secret_key, watched, args.view_tags,
+                        args.checkpoint, workers=args.workers, chunk_size=args.chunk_size)
+    t = time.perf_counter() - start_time
+    fout = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        for index, address, key in matches:
+            fout.write("%d %s %064x\n" % (index, address, key))
+    finally:
+        if fout is not sys.stdout:
+            fout.close()
+    print("Found %d payments with %d workers (took %.2fs)" % (
+        len(matches), args.workers, t), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
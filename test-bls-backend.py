@@ -0,0 +1,186 @@
+import importlib
+import os
+import random
+import sys
+
+import bls_backend
+from bls_backend import OptimizedBLSBackend, ReferenceBLSBackend
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "kzg-stuff"))
+import kzg  # noqa: E402
+
+bls_ibs = importlib.import_module("identity-signatures")
+accumulator = importlib.import_module("universal-accumulator")
+
+
+random.seed(a='test-bls-backend', version=2)
+
+ORDER = bls_backend.curve_order
+
+
+# Affine coordinates as plain integers (None at infinity), comparable across
+# backends
+def coordinates(backend, pt):
+    pt = backend.normalize(pt)
+    if pt is None:
+        return None
+    return tuple(tuple(int(c) for c in getattr(v, "coeffs", (v,))) for v in pt)
+
+
+def test_multiply_matches_reference():
+    print("Testing optimized multiply against the reference backend")
+    for k in [0, 1, 2, 3, ORDER - 1, ORDER, ORDER + 1, 2 * ORDER - 5] + \
+            [random.randrange(ORDER) for _ in range(5)]:
+        assert coordinates(OptimizedBLSBackend, OptimizedBLSBackend.multiply(OptimizedBLSBackend.G1, k)) == \
+            coordinates(ReferenceBLSBackend, ReferenceBLSBackend.multiply(ReferenceBLSBackend.G1, k))
+    for k in [0, ORDER - 1, random.randrange(ORDER)]:
+        assert coordinates(OptimizedBLSBackend, OptimizedBLSBackend.multiply(OptimizedBLSBackend.G2, k)) == \
+            coordinates(ReferenceBLSBackend, ReferenceBLSBackend.multiply(ReferenceBLSBackend.G2, k))
+    Z1 = OptimizedBLSBackend.Z1
+    assert OptimizedBLSBackend.is_inf(OptimizedBLSBackend.multiply(Z1, 12345))
+
+
+def test_multi_multiply_and_base():
+    print("Testing multi-scalar and fixed-base multiplication")
+    for B in (ReferenceBLSBackend, OptimizedBLSBackend):
+        for k in [0, 1, 63, 64, ORDER - 1, ORDER, ORDER + 7, random.randrange(ORDER)]:
+            assert B.eq(B.multiply_base(k), B.multiply(B.G1, k))
+        points = [B.multiply(B.G1, random.randrange(ORDER)) for _ in range(4)] + [B.Z1]
+        scalars = [random.randrange(ORDER) for _ in range(4)] + [5]
+        scalars[1] = 0
+        expected = B.Z1
+        for P, k in zip(points, scalars):
+            expected = B.add(expected, B.multiply(P, k))
+        assert B.eq(B.multi_multiply(list(zip(points, scalars))), expected)
+        assert B.eq(B.multi_multiply([(B.G2, 3), (B.G2, ORDER - 3)]), B.Z2)
+        assert B.is_inf(B.multi_multiply([]))
+        assert B.zero_like(B.G2) is B.Z2 and B.zero_like(points[0]) is B.Z1
+        assert B.is_inf(B.zero_like(B.Z2)) and B.is_inf(B.zero_like(B.Z1))
+        table = B.fixed_base_table(points[0], 4)
+        for k in [0, 1, 15, 16, ORDER - 1, random.randrange(ORDER)]:
+            assert B.eq(B.fixed_base_multiply(table, k), B.multiply(points[0], k))
+
+
+def test_eq_and_serialize():
+    print("Testing projective equality and canonical serialization")
+    k = random.randrange(1, ORDER)
+    P = OptimizedBLSBackend.multiply(OptimizedBLSBackend.G1, k)
+    # Same point, different projective representation
+    z = OptimizedBLSBackend.FQ(random.randrange(1, 2**64))
+    scaled = (P[0] * z, P[1] * z, P[2] * z)
+    assert scaled != P and OptimizedBLSBackend.eq(scaled, P)
+    assert OptimizedBLSBackend.serialize_g1(scaled) == OptimizedBLSBackend.serialize_g1(P)
+    assert not OptimizedBLSBackend.eq(P, OptimizedBLSBackend.G1)
+
+    R = ReferenceBLSBackend.multiply(ReferenceBLSBackend.G1, k)
+    assert ReferenceBLSBackend.serialize_g1(R) == OptimizedBLSBackend.serialize_g1(P)
+    assert ReferenceBLSBackend.serialize_g1(ReferenceBLSBackend.Z1) == \
+        OptimizedBLSBackend.serialize_g1(OptimizedBLSBackend.Z1)
+    assert len(OptimizedBLSBackend.serialize_g1(P)) == 48
+    for B, pt in ((ReferenceBLSBackend, R), (OptimizedBLSBackend, P)):
+        assert B.eq(B.deserialize_g1(B.serialize_g1(pt)), pt)
+        assert B.is_inf(B.deserialize_g1(B.serialize_g1(B.Z1)))
+
+
+def test_pairing_matches_reference():
+    print("Testing pairings against the reference backend")
+    reference = ReferenceBLSBackend.pairing(ReferenceBLSBackend.G2, ReferenceBLSBackend.G1)
+    optimized = OptimizedBLSBackend.pairing(OptimizedBLSBackend.G2, OptimizedBLSBackend.G1)
+    assert [int(c) for c in reference.coeffs] == [int(c) for c in optimized.coeffs]
+
+    B = OptimizedBLSBackend
+    a, b = random.randrange(1, ORDER), random.randrange(1, ORDER)
+    aG2, bG1 = B.multiply(B.G2, a), B.multiply(B.G1, b)
+    abG1 = B.multiply(B.G1, a * b)
+    assert B.pairing_check([(aG2, bG1), (B.neg(B.G2), abG1)])
+    assert not B.pairing_check([(aG2, bG1), (B.neg(B.G2), B.add(abG1, B.G1))])
+    assert B.pairing_check([])
+
+
+def test_set_bls_backend():
+    print("Testing backend selection")
+    assert bls_backend.BLS_BACKEND == "optimized"
+    assert bls_backend.multiply == OptimizedBLSBackend.multiply
+    bls_backend.set_bls_backend("reference")
+    try:
+        assert bls_backend.get_bls_backend() is ReferenceBLSBackend
+        assert bls_backend.G1 == ReferenceBLSBackend.G1
+    finally:
+        bls_backend.set_bls_backend("optimized")
+    try:
+        bls_backend.set_bls_backend("no-such-backend")
+        assert False, "unknown backend should be rejected"
+    except ValueError:
+        pass
+
+
+# Run fn once under each backend, switching back to the default after
+def on_both_backends(fn):
+    for name in ("reference", "optimized"):
+        bls_backend.set_bls_backend(name)
+        try:
+            fn(name)
+        finally:
+            bls_backend.set_bls_backend("optimized")
+
+
+def test_identity_signatures_on_both_backends():
+    print("Testing identity signatures on both backends")
+    sk = random.randrange(1, ORDER)
+    a = random.randrange(1, ORDER)
+    hashes = []
+
+    def check(name):
+        Ga = bls_backend.multiply(bls_backend.G1, a)
+        hashes.append((bls_ibs.hash_message("msg", "id", Ga), bls_ibs.hash_id(Ga, "id")))
+        id_key = bls_ibs.IdentityManager(sk).generate_child_key("child-1")
+        (Ga1, b1, Gr1) = id_key.sign("test-msg")
+        assert id_key.verify("test-msg", Ga1, b1, Gr1)
+        assert not id_key.verify("test-msg2", Ga1, b1, Gr1)
+        sigs = [("child-1", "m%d" % i) + id_key.sign("m%d" % i) for i in range(3)]
+        assert bls_ibs.batch_verify(id_key.master_public_key, sigs) == []
+
+    on_both_backends(check)
+    # hashes depend on the point, not on how a backend represents it
+    assert hashes[0] == hashes[1]
+
+
+def test_accumulator_on_both_backends():
+    print("Testing the accumulator on both backends")
+    sk = random.randrange(1, ORDER)
+
+    def check(name):
+        accumulator.test1(sk)
+        accumulator.test2(sk)
+        accumulator.test3(sk)
+        accumulator.test4(sk)
+        accumulator.test5(sk)
+
+    on_both_backends(check)
+
+
+def test_kzg_on_both_backends():
+    print("Testing KZG commit, proof and verify on both backends")
+
+    def check(name):
+        setup_g1, setup_g2 = kzg.trusted_setup(4)
+        points, polynomial = kzg.encode_as_polynomial(b'\x99' * 100, 4)
+        commitment = kzg.commit(polynomial, setup_g1)
+        point = points[2]
+        pi = kzg.proof(polynomial, point, setup_g1)
+        assert kzg.verify(commitment, pi, point, setup_g2)
+        assert not kzg.verify(commitment, pi, (point[0], point[1] + 1), setup_g2)
+
+    on_both_backends(check)
+
+
+if __name__ == "__main__":
+    test_multiply_matches_reference()
+    test_multi_multiply_and_base()
+    test_eq_and_serialize()
+    test_pairing_matches_reference()
+    test_set_bls_backend()
+    test_identity_signatures_on_both_backends()
+    test_accumulator_on_both_backends()
+    test_kzg_on_both_backends()
+    print("All tests passed!")
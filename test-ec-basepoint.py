@@ -0,0 +1,175 @@
+import os
+import random
+import tempfile
+
+import curves
+import secp256k1
+from ec_basepoint import EllipticCurve, INF_POINT, SECPK1_256, G, n, get_curve, register_curve
+
+
+random.seed(a='test-ec-basepoint', version=2)
+
+# Fixed-base tables built by these tests go to a throwaway cache directory,
+# not the user's
+_cache_dir = tempfile.TemporaryDirectory()
+os.environ[curves.CACHE_ENV] = _cache_dir.name
+
+# NIST P-256 (a = -3) exercises the a term of the Jacobian doubling
+P256 = get_curve("P-256")
+P256_G = P256.G
+P256_N = P256.n
+
+# y^2 = x^3 + 2x + 3 over GF(97), small enough to hit every special case
+SMALL = EllipticCurve(97, 2, 3)
+SMALL_G = (3, 6)
+
+
+def reference_multiple(curve, k, P):
+    result = INF_POINT
+    while k:
+        if k & 1:
+            result = curve.addition(result, P)
+        P = curve.addition(P, P)
+        k >>= 1
+    return result
+
+
+def test_secp256k1_multiple():
+    print("Testing SECPK1_256.multiple against secp256k1.multiply")
+    for k in [1, 2, 3, n - 1, n + 1] + [random.randrange(1, n) for _ in range(10)]:
+        expected = secp256k1.multiply(secp256k1.G, k)
+        assert SECPK1_256.multiple(k, G) == expected
+        for window in (1, 2, 4, 6):
+            assert SECPK1_256.multiple(k, G, window) == expected
+    assert SECPK1_256.multiple(n, G) == INF_POINT
+    assert SECPK1_256.multiple(0, G) == INF_POINT
+    assert SECPK1_256.multiple(5, INF_POINT) == INF_POINT
+
+
+def test_p256_multiple():
+    print("Testing P-256 multiple against double-and-add")
+    assert P256.is_point_on_curve(*P256_G)
+    for k in [1, 2, P256_N - 1] + [random.randrange(1, P256_N) for _ in range(5)]:
+        Q = P256.multiple(k, P256_G)
+        assert Q == reference_multiple(P256, k, P256_G)
+        assert P256.is_point_on_curve(*Q)
+    assert P256.multiple(P256_N, P256_G) == INF_POINT
+
+
+def test_multiple_base():
+    print("Testing fixed-base multiples of the generator")
+    for curve in (SECPK1_256, P256):
+        for k in [1, 2, curve.n - 1, curve.n, curve.n + 1] + [random.randrange(curve.n) for _ in range(5)]:
+            assert curve.multiple_base(k) == curve.multiple(k, curve.G, 4)
+            assert curve.multiple(k, curve.G) == curve.multiple_base(k)
+
+
+def test_batch_ecdh():
+    print("Testing batch ECDH")
+    for curve, G1, k_max in ((SECPK1_256, G, n), (P256, P256_G, P256_N), (SMALL, SMALL_G, 5)):
+        points = [curve.multiple(random.randrange(1, k_max), G1, 4) for _ in range(6)]
+        for k in [0, 1, 2, k_max - 1] + [random.randrange(1, k_max) for _ in range(3)]:
+            expected = [reference_multiple(curve, k, P) for P in points]
+            assert curve.batch_ecdh(k, points) == expected
+            assert curve.batch_ecdh(k, points, 2) == expected
+    (x, y) = P256_G
+    for bad in (INF_POINT, (x, y + 1)):
+        try:
+            P256.batch_ecdh(7, [P256_G, bad])
+            assert False, "off-curve point should be rejected"
+        except ValueError:
+            pass
+
+
+def test_curve_registry():
+    print("Testing curve registry")
+    assert get_curve("secp256k1") is SECPK1_256
+    assert SECPK1_256.p == secp256k1.P and SECPK1_256.n == secp256k1.N
+    assert SECPK1_256.G == secp256k1.G
+    assert P256.a == -3 and P256.is_point_on_curve(*P256.G)
+    try:
+        get_curve("no-such-curve")
+        assert False, "unknown curve should not resolve"
+    except KeyError:
+        pass
+    toy = register_curve(EllipticCurve(97, 2, 3, SMALL_G, 5, "toy-97"))
+    assert get_curve("toy-97") is toy
+    try:
+        register_curve(EllipticCurve(97, 2, 3, (3, 7), 5, "bad-97"))
+        assert False, "generator off the curve should be rejected"
+    except ValueError:
+        pass
+
+
+def test_table_cache():
+    print("Testing persisted fixed-base tables")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Toy curve: its table contains the point at infinity
+        toy = EllipticCurve(97, 2, 3, SMALL_G, 5, "toy-97", cache_dir)
+        rows, cached = curves.load_fixed_base_table(
+            toy.parameters(), 3, lambda: toy.build_fixed_base_table(3), cache_dir)
+        assert not cached and INF_POINT in [pt for row in rows for pt in row]
+        assert curves.load_fixed_base_table(
+            toy.parameters(), 3, lambda: None, cache_dir) == (rows, True)
+        for k in range(20):
+            assert toy.multiple_base(k) == reference_multiple(toy, k, SMALL_G)
+
+        curve = EllipticCurve.from_parameters(curves.P256, cache_dir)
+        expected = curve.multiple_base(12345)
+        assert os.path.exists(curves.table_path(curves.P256, 6, cache_dir))
+        reloaded = EllipticCurve.from_parameters(curves.P256, cache_dir)
+        reloaded.build_fixed_base_table = None  # must come from the cache
+        assert reloaded.multiple_base(12345) == expected
+
+        # Same name, different generator: must not share the cached table
+        other = EllipticCurve.from_parameters(
+            curves.P256._replace(Gx=expected[0], Gy=expected[1]), cache_dir)
+        assert other.multiple_base(2) == curve.multiple_base(2 * 12345)
+
+        stats = secp256k1.precompute_base_table(5, cache_dir)
+        assert not stats["cached"]
+        assert secp256k1.precompute_base_table(5, cache_dir)["cached"]
+        assert secp256k1.multiply(secp256k1.G, 777) == reference_multiple(SECPK1_256, 777, G)
+
+        # A damaged file is rebuilt and rewritten, never used
+        path = curves.table_path(curves.SECP256K1, 5, cache_dir)
+        with open(path, "r+b") as f:
+            f.seek(100)
+            byte = f.read(1)
+            f.seek(100)
+            f.write(bytes([byte[0] ^ 1]))
+        assert not secp256k1.precompute_base_table(5, cache_dir)["cached"]
+        assert secp256k1.privtopub((2).to_bytes(32, "big")) == reference_multiple(SECPK1_256, 2, G)
+        assert secp256k1.precompute_base_table(5, cache_dir)["cached"]
+        # So is one with an intact digest over the wrong points
+        rows, _ = curves.load_fixed_base_table(curves.SECP256K1, 5, lambda: None, cache_dir)
+        rows[0][0] = rows[0][1]
+        curves.write_table(path, curves.SECP256K1, 5, rows)
+        try:
+            curves.read_table(path, curves.SECP256K1, 5)
+            assert False, "table not starting at G should be rejected"
+        except ValueError:
+            pass
+        assert not secp256k1.precompute_base_table(5, cache_dir)["cached"]
+        assert secp256k1.multiply(secp256k1.G, 777) == reference_multiple(SECPK1_256, 777, G)
+    secp256k1.precompute_base_table()
+
+
+def test_small_curve_multiple():
+    print("Testing small curve multiple for every scalar")
+    assert SMALL.is_point_on_curve(*SMALL_G)
+    for k in range(200):
+        expected = reference_multiple(SMALL, k, SMALL_G)
+        for window in (1, 2, 3, 5):
+            assert SMALL.multiple(k, SMALL_G, window) == expected
+
+
+if __name__ == "__main__":
+    test_secp256k1_multiple()
+    test_p256_multiple()
+    test_small_curve_multiple()
+    test_multiple_base()
+    test_batch_ecdh()
+    test_curve_registry()
+    test_table_cache()
+    print("All tests passed!")
@@ -0,0 +1,567 @@
+import json
+import os
+import random
+import tempfile
+import time
+
+import bulk_sign
+import curves
+import keystore
+import opcount
+import parallel
+import secp256k1
+import stealth_address
+import stealth_scanner
+from atomic_file import atomic_write
+
+random.seed(a='test-secp256k1', version=2)
+
+# Fixed-base tables built by these tests go to a throwaway cache directory,
+# not the user's
+_cache_dir = tempfile.TemporaryDirectory()
+os.environ[curves.CACHE_ENV] = _cache_dir.name
+
+
+# Plain double-and-add, used as the reference every engine is checked against
+def reference_multiply(pt, n):
+    n %= secp256k1.N
+    result = (0, 0, 1)
+    addend = secp256k1.to_jacobian(pt)
+    while n:
+        if n & 1:
+            result = secp256k1.jacobian_add(result, addend)
+        addend = secp256k1.jacobian_double(addend)
+        n >>= 1
+    return secp256k1.from_jacobian(result)
+
+
+def random_scalars(count):
+    edges = [0, 1, 2, secp256k1.N - 1, secp256k1.N, secp256k1.N + 1]
+    return edges + [random.randrange(secp256k1.N) for _ in range(count)]
+
+
+def test_fixed_base_table():
+    for window in (1, 4, 5, 8):
+        start_time = time.time()
+        table = secp256k1.precompute_fixed_base(secp256k1.G, window)
+        t = time.time() - start_time
+        print("Built window-%d generator table (took %.2fs)" % (window, t))
+        for k in random_scalars(10):
+            expected = reference_multiply(secp256k1.G, k)
+            actual = secp256k1.from_jacobian(
+                secp256k1.jacobian_fixed_base_multiply(table, k))
+            assert actual == expected, "fixed-base mismatch for %d" % k
+
+
+def test_multiply_uses_base_table():
+    stats = secp256k1.precompute_base_table(6)
+    assert stats["window"] == 6
+    assert stats["additions_per_multiply"] == 43
+    for k in random_scalars(10):
+        assert secp256k1.multiply(secp256k1.G, k) == reference_multiply(
+            secp256k1.G, k)
+    assert secp256k1.privtopub(b'\x01' * 32) == reference_multiply(
+        secp256k1.G, secp256k1.bytes_to_int(b'\x01' * 32))
+    secp256k1.precompute_base_table()
+
+
+def test_wnaf_digits():
+    for window in (2, 4, 5, 7):
+        for k in random_scalars(20):
+            digits = secp256k1.wnaf(k % secp256k1.N, window)
+            assert sum(d << i for i, d in enumerate(digits)) == k % secp256k1.N
+            for i, d in enumerate(digits):
+                if d:
+                    assert d % 2 == 1 and abs(d) < 1 << (window - 1)
+                    assert not any(digits[i + 1:i + window])
+
+
+def test_wnaf_multiply():
+    pt = reference_multiply(secp256k1.G, random.randrange(secp256k1.N))
+    for window in (2, 3, 5, 6):
+        for k in random_scalars(10) + [-5, 2**256 - 1]:
+            actual = secp256k1.from_jacobian(secp256k1.jacobian_multiply_wnaf(
+                secp256k1.to_jacobian(pt), k, window))
+            assert actual == reference_multiply(pt, k), "wNAF mismatch for %d" % k
+
+
+def test_glv_split():
+    for k in random_scalars(50):
+        k1, k2 = secp256k1.glv_split(k)
+        assert (k1 + k2 * secp256k1.GLV_LAMBDA - k) % secp256k1.N == 0
+        assert abs(k1).bit_length() <= 129 and abs(k2).bit_length() <= 129
+    lam_G = secp256k1.multiply(secp256k1.G, secp256k1.GLV_LAMBDA)
+    assert lam_G == secp256k1.from_jacobian(secp256k1.jacobian_endomorphism(
+        secp256k1.to_jacobian(secp256k1.G)))
+
+
+def test_glv_multiply():
+    for _ in range(3):
+        pt = reference_multiply(secp256k1.G, random.randrange(secp256k1.N))
+        for window in (2, 4, 5):
+            for k in random_scalars(10):
+                actual = secp256k1.from_jacobian(secp256k1.jacobian_multiply_glv(
+                    secp256k1.to_jacobian(pt), k, window))
+                assert actual == reference_multiply(pt, k), "GLV mismatch for %d" % k
+
+
+def test_multiply_engine_selection():
+    pt = reference_multiply(secp256k1.G, random.randrange(secp256k1.N))
+    k = random.randrange(secp256k1.N)
+    for engine in ("wnaf", "glv"):
+        secp256k1.set_multiply_engine(engine)
+        assert secp256k1.multiply(pt, k) == reference_multiply(pt, k)
+    try:
+        secp256k1.set_multiply_engine("binary")
+        assert False, "unknown engine accepted"
+    except ValueError:
+        pass
+    assert secp256k1.MULTIPLY_ENGINE == "glv"
+
+
+def test_multi_multiply():
+    points = [secp256k1.G] + [
+        reference_multiply(secp256k1.G, random.randrange(secp256k1.N))
+        for _ in range(3)]
+    for engine in ("wnaf", "glv"):
+        secp256k1.set_multiply_engine(engine)
+        for count in (1, 2, 4):
+            pairs = [(pt, random.choice(random_scalars(5)) - secp256k1.N // 2)
+                     for pt in random.sample(points, count)]
+            expected = (0, 0, 1)
+            for pt, k in pairs:
+                expected = secp256k1.jacobian_add(
+                    expected, secp256k1.to_jacobian(reference_multiply(pt, k)))
+            assert secp256k1.multi_multiply(pairs) == \
+                secp256k1.from_jacobian(expected)
+        # Terms cancelling to the point at infinity
+        assert secp256k1.multi_multiply(
+            [(points[1], 5), (points[1], -5)]) == (0, 0)
+    secp256k1.set_multiply_engine("glv")
+
+
+def test_pippenger_multi_multiply():
+    points = [reference_multiply(secp256k1.G, k) for k in random_scalars(40)[5:]]
+    scalars = random_scalars(40)
+    # Short scalars (as in batch verification) and an infinite point too
+    scalars[7:12] = [random.getrandbits(128) for _ in range(5)]
+    points[3] = (0, 0)
+    pairs = list(zip(points, scalars))
+    expected = (0, 0, 1)
+    for pt, k in pairs:
+        if pt != (0, 0):
+            expected = secp256k1.jacobian_add(
+                expected, secp256k1.to_jacobian(reference_multiply(pt, k)))
+    expected = secp256k1.from_jacobian(expected)
+    for engine in ("wnaf", "glv"):
+        secp256k1.set_multiply_engine(engine)
+        for window in (None, 1, 4, 7):
+            assert secp256k1.from_jacobian(secp256k1.jacobian_pippenger_multi_multiply(
+                [(secp256k1.to_jacobian(pt), k) for pt, k in pairs], window)) == expected
+        for count in (1, 2, 5):
+            assert secp256k1.pippenger_multi_multiply(pairs[:count]) == \
+                secp256k1.multi_multiply(pairs[:count])
+        # Large enough to take the Pippenger path of multi_multiply
+        assert len(pairs) >= secp256k1.PIPPENGER_MIN_POINTS
+        assert secp256k1.multi_multiply(pairs) == expected
+        assert secp256k1.pippenger_multi_multiply(
+            [(points[5], 3), (points[5], -3)]) == (0, 0)
+    secp256k1.set_multiply_engine("glv")
+
+
+def test_batch_ecdh():
+    pubs = [reference_multiply(secp256k1.G, k) for k in random_scalars(8)[5:]]
+    for engine in ("wnaf", "glv"):
+        secp256k1.set_multiply_engine(engine)
+        for priv in random_scalars(5):
+            expected = [reference_multiply(pub, priv) for pub in pubs]
+            assert secp256k1.batch_ecdh(priv, pubs) == expected
+    assert secp256k1.batch_ecdh(5, []) == []
+    for bad in [(0, 0), (secp256k1.Gx, secp256k1.Gy + 1),
+                (secp256k1.Gx + secp256k1.P, secp256k1.Gy)]:
+        try:
+            secp256k1.batch_ecdh(5, pubs[:2] + [bad])
+            assert False, "off-curve key should be rejected"
+        except ValueError as e:
+            assert "public key 2" in str(e)
+
+
+def test_stealth_addresses():
+    main_key = stealth_address.MainKey()
+    addresses = list(main_key.iter_stealth_addresses(7, block_size=3))
+    # too few addresses to pay for a public-key table
+    assert main_key._public_key_table is None
+    assert len(addresses) == 7
+    for ephemeral_public_key, stealth_private_key, stealth_public_key in addresses:
+        # The receiver's side of the exchange finds the same key
+        ssx, ssy = reference_multiply(ephemeral_public_key, main_key.secret_key)
+        s = stealth_address.string_to_number(f"{ssx}{ssy}")
+        assert stealth_private_key == s + main_key.secret_key
+        assert stealth_public_key == reference_multiply(secp256k1.G, stealth_private_key)
+    # an endless stream does build one, and gets the same keys through it
+    stream = main_key.iter_stealth_addresses(block_size=4)
+    streamed = [next(stream) for _ in range(9)]
+    assert main_key._public_key_table is not None
+    for ephemeral_public_key, stealth_private_key, stealth_public_key in streamed:
+        ssx, ssy = reference_multiply(ephemeral_public_key, main_key.secret_key)
+        assert stealth_private_key == stealth_address.string_to_number(f"{ssx}{ssy}") + main_key.secret_key
+        assert stealth_public_key == reference_multiply(secp256k1.G, stealth_private_key)
+    for block_size in (0, -1):
+        try:
+            next(main_key.iter_stealth_addresses(block_size=block_size))
+            assert False, "block_size %d accepted" % block_size
+        except ValueError:
+            pass
+
+
+def test_stealth_scanner():
+    main_key = stealth_address.MainKey(random.randrange(1, secp256k1.N))
+    data, watched = stealth_scanner.random_announcements(main_key, 250)
+    untagged = b"".join(data[i:i + 33] for i in range(0, len(data), 34))
+    with tempfile.TemporaryDirectory() as tmp:
+        tagged_path = os.path.join(tmp, "tagged")
+        untagged_path = os.path.join(tmp, "untagged")
+        with open(tagged_path, "wb") as f:
+            f.write(data + b'\x05' * 34)  # a malformed trailing announcement
+        with open(untagged_path, "wb") as f:
+            f.write(untagged)
+
+        matches = stealth_scanner.scan_file(
+            tagged_path, main_key.secret_key, watched, view_tags=True, workers=1, chunk_size=64)
+        assert [i for i, _, _ in matches] == [0, 100, 200]
+        for _, address, key in matches:
+            assert address in watched
+            assert secp256k1.pub_to_address(reference_multiply(secp256k1.G, key)) == address
+        assert stealth_scanner.scan_file(
+            untagged_path, main_key.secret_key, watched, workers=2, chunk_size=64) == matches
+        # No watch list: every derived address is reported
+        assert len(stealth_scanner.scan_file(
+            untagged_path, main_key.secret_key, workers=1, chunk_size=64)) == 250
+
+        # Resume from a checkpoint taken half way through
+        checkpoint = os.path.join(tmp, "checkpoint.json")
+        assert stealth_scanner.scan_file(
+            tagged_path, main_key.secret_key, watched, True, checkpoint,
+            workers=1, chunk_size=64) == matches
+        with open(checkpoint) as f:
+            state = json.load(f)
+        assert state["scanned"] == 251
+        state["scanned"] = 128
+        state["matches"] = state["matches"][:2]
+        with open(checkpoint, "w") as f:
+            json.dump(state, f)
+        assert stealth_scanner.scan_file(
+            tagged_path, main_key.secret_key, watched, True, checkpoint,
+            workers=1, chunk_size=64) == matches
+        try:
+            stealth_scanner.scan_file(tagged_path, main_key.secret_key + 1, watched, True, checkpoint)
+            assert False, "checkpoint of another key should be refused"
+        except ValueError:
+            pass
+
+
+def test_sign_recover():
+    for engine in ("wnaf", "glv"):
+        secp256k1.set_multiply_engine(engine)
+        for i in range(5):
+            priv = random.randrange(1, secp256k1.N).to_bytes(32, 'big')
+            msghash = random.getrandbits(256).to_bytes(32, 'big')
+            vrs = secp256k1.ecdsa_raw_sign(msghash, priv)
+            assert secp256k1.ecdsa_raw_recover(msghash, vrs) == \
+                reference_multiply(secp256k1.G, secp256k1.bytes_to_int(priv))
+    secp256k1.set_multiply_engine("glv")
+
+
+def test_batch_inv():
+    values = [random.randrange(1, secp256k1.N) for _ in range(20)] + [0]
+    random.shuffle(values)
+    assert secp256k1.batch_inv(values, secp256k1.N) == [
+        secp256k1.inv(v, secp256k1.N) for v in values]
+    assert secp256k1.batch_inv([], secp256k1.N) == []
+
+
+def test_batch_recover():
+    sigs = []
+    expected = []
+    for i in range(12):
+        priv = random.randrange(1, secp256k1.N).to_bytes(32, 'big')
+        msghash = random.getrandbits(256).to_bytes(32, 'big')
+        sigs.append((msghash, secp256k1.ecdsa_raw_sign(msghash, priv)))
+        expected.append(secp256k1.privtopub(priv))
+    # r == 0, v out of range, and an r that is not an x coordinate
+    sigs[3] = (sigs[3][0], (27, 0, sigs[3][1][2]))
+    sigs[7] = (sigs[7][0], (35,) + sigs[7][1][1:])
+    sigs[9] = (sigs[9][0], (27, 5, 1))
+    results = secp256k1.ecdsa_batch_recover(sigs)
+    for i, result in enumerate(results):
+        if i in (3, 7, 9):
+            assert isinstance(result, ValueError)
+        else:
+            assert result == expected[i]
+            assert result == secp256k1.ecdsa_raw_recover(*sigs[i])
+    assert secp256k1.ecdsa_batch_recover([]) == []
+
+
+def test_verify():
+    priv = random.randrange(1, secp256k1.N).to_bytes(32, 'big')
+    pub = secp256k1.privtopub(priv)
+    other = secp256k1.privtopub(b'\x02' * 32)
+    for i in range(5):
+        msghash = random.getrandbits(256).to_bytes(32, 'big')
+        v, r, s = secp256k1.ecdsa_raw_sign(msghash, priv)
+        assert secp256k1.ecdsa_raw_verify(msghash, (v, r, s), pub)
+        # The high-s twin is still a valid ECDSA signature
+        assert secp256k1.ecdsa_raw_verify(msghash, (v, r, secp256k1.N - s), pub)
+        assert not secp256k1.ecdsa_raw_verify(msghash, (v, r, s), other)
+        assert not secp256k1.ecdsa_raw_verify(msghash, (v, r, s + 1), pub)
+        assert not secp256k1.ecdsa_raw_verify(b'\x00' * 32, (v, r, s), pub)
+        assert not secp256k1.ecdsa_raw_verify(msghash, (v, 0, s), pub)
+        assert not secp256k1.ecdsa_raw_verify(msghash, (v, r, s), (1, 1))
+        assert not secp256k1.ecdsa_raw_verify(msghash, (v, r, s), None)
+
+
+def test_batch_verify():
+    sigs = []
+    for i in range(10):
+        priv = random.randrange(1, secp256k1.N).to_bytes(32, 'big')
+        msghash = random.getrandbits(256).to_bytes(32, 'big')
+        sigs.append((msghash, secp256k1.ecdsa_raw_sign(msghash, priv),
+                     secp256k1.privtopub(priv)))
+    assert secp256k1.ecdsa_batch_verify(sigs) == []
+    assert secp256k1.ecdsa_batch_verify([]) == []
+
+    # A wrong parity in v fails the batch but the signature is still valid
+    msghash, (v, r, s), pub = sigs[1]
+    sigs[1] = (msghash, (55 - v, r, s), pub)
+    assert secp256k1.ecdsa_batch_verify(sigs) == []
+
+    msghash, (v, r, s), pub = sigs[4]
+    sigs[4] = (msghash, (v, r, (s + 1) % secp256k1.N), pub)
+    sigs[8] = (sigs[8][0], sigs[8][1], sigs[0][2])
+    sigs[9] = (sigs[9][0], (40,) + sigs[9][1][1:], (1, 1))
+    assert secp256k1.ecdsa_batch_verify(sigs) == [4, 8, 9]
+    # The point at infinity is not a public key
+    sigs[2] = (sigs[2][0], sigs[2][1], None)
+    assert secp256k1.ecdsa_batch_verify(sigs) == [2, 4, 8, 9]
+
+
+def test_point_classes():
+    a, b = random.randrange(secp256k1.N), random.randrange(secp256k1.N)
+    A = secp256k1.AffinePoint(*reference_multiply(secp256k1.G, a))
+    B = secp256k1.AffinePoint(*reference_multiply(secp256k1.G, b))
+    G = secp256k1.AffinePoint(*secp256k1.G)
+
+    assert A * b == B * a == reference_multiply(secp256k1.G, a * b)
+    assert (a + b) * G == A + B == B.to_jacobian() + A
+    assert (A + B).to_affine() == secp256k1.add(A.to_tuple(), B.to_tuple())
+    assert A - B == (a - b) * G
+    assert -(A * 3) == A * -3 == -A * 3
+    assert (A + B) - B == A
+    assert (A - A).is_infinity() and (A - A).to_affine() == (0, 0)
+    assert A + A == 2 * A and A.to_jacobian() + A == A * 2
+    assert not (A.to_jacobian() == B)
+    x, y = (A + B) * 7
+    assert (x, y) == reference_multiply(secp256k1.G, (a + b) * 7)
+
+    points = [A * k for k in range(-3, 4)]
+    assert secp256k1.JacobianPoint.batch_to_affine(points) == [
+        p.to_affine() for p in points]
+    assert len({A, A.to_jacobian().to_affine(), B}) == 2
+
+
+def test_field_backends():
+    assert secp256k1.FIELD_BACKEND in secp256k1.FIELD_BACKENDS
+    default = secp256k1.FIELD_BACKEND
+    priv = random.randrange(1, secp256k1.N).to_bytes(32, 'big')
+    msghash = random.getrandbits(256).to_bytes(32, 'big')
+    pub = reference_multiply(secp256k1.G, secp256k1.bytes_to_int(priv))
+    k = random.randrange(secp256k1.N)
+    expected = reference_multiply(pub, k)
+    for name, backend in secp256k1.FIELD_BACKENDS.items():
+        secp256k1.set_field_backend(name)
+        for a in (1, 2, secp256k1.P - 1, random.randrange(secp256k1.P)):
+            a_inv = backend.inv(a, secp256k1.P)
+            assert backend.mul(a, a_inv, secp256k1.P) == 1
+            assert backend.sqr(backend.sqrt(backend.sqr(a, secp256k1.P), secp256k1.P),
+                               secp256k1.P) == backend.sqr(a, secp256k1.P)
+        assert backend.inv(0, secp256k1.P) == 0
+
+        assert secp256k1.privtopub(priv) == pub
+        assert secp256k1.multiply(pub, k) == expected
+        vrs = secp256k1.ecdsa_raw_sign(msghash, priv)
+        assert all(type(c) is int for c in vrs)
+        assert secp256k1.ecdsa_raw_recover(msghash, vrs) == pub
+        assert all(type(c) is int for c in secp256k1.ecdsa_raw_recover(msghash, vrs))
+        assert secp256k1.ecdsa_raw_verify(msghash, vrs, pub)
+    secp256k1.set_field_backend(default)
+
+    # Switching backends rebuilds the generator table from its own cache
+    with tempfile.TemporaryDirectory() as tmp:
+        secp256k1.precompute_base_table(5, cache_dir=tmp)
+        os.environ[curves.CACHE_ENV] = os.path.join(tmp, "elsewhere")
+        try:
+            secp256k1.set_field_backend(default)
+            assert secp256k1.base_table_stats()["cached"]
+            assert not os.path.exists(os.path.join(tmp, "elsewhere"))
+        finally:
+            os.environ[curves.CACHE_ENV] = _cache_dir.name
+            secp256k1.precompute_base_table()
+
+
+def test_bulk_sign():
+    records = bulk_sign.random_records(50)
+    expected = [secp256k1.ecdsa_raw_sign(h, k) for h, k in records]
+    assert list(bulk_sign.bulk_sign(
+        iter(records), workers=2, chunk_size=7, max_pending=2)) == expected
+    assert list(bulk_sign.bulk_sign([], workers=1)) == []
+
+
+def test_parallel_helpers():
+    assert list(parallel.chunks(iter(range(7)), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(parallel.chunks([], 3)) == []
+    assert list(parallel.imap_ordered(
+        pow, ((i, 2) for i in range(20)), 2, max_pending=3)) == [i * i for i in range(20)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.json")
+        with atomic_write(path) as f:
+            f.write("old")
+        try:
+            with atomic_write(path) as f:
+                f.write("new")
+                raise RuntimeError("interrupted")
+        except RuntimeError:
+            pass
+        with open(path) as f:
+            assert f.read() == "old"
+        assert os.listdir(tmp) == ["out.json"]
+
+
+def test_enumerate_addresses():
+    # Includes a range that wraps through the point at infinity at k == N
+    for start, count, block_size in ((1, 40, 16), (secp256k1.N - 20, 41, 8),
+                                     (random.randrange(secp256k1.N), 33, 33)):
+        results = list(secp256k1.enumerate_addresses(start, count, block_size))
+        assert [k for k, _, _ in results] == [
+            k for k in range(start, start + count) if k % secp256k1.N]
+        for k, pub, address in results:
+            assert pub == reference_multiply(secp256k1.G, k)
+            assert address == secp256k1.pub_to_address(pub)
+    # One shared table, grown to the largest block size asked for
+    multiples = secp256k1._get_generator_multiples(50)
+    assert len(secp256k1._generator_multiples) >= 50
+    assert multiples == [reference_multiply(secp256k1.G, i) for i in range(1, 51)]
+    assert secp256k1._get_generator_multiples(8) == multiples[:8]
+
+
+def test_sec1_encoding():
+    for k in random_scalars(10)[1:]:
+        pub = secp256k1.multiply(secp256k1.G, k)
+        if pub == (0, 0):
+            continue
+        compressed = secp256k1.encode_pubkey(pub)
+        uncompressed = secp256k1.encode_pubkey(pub, compressed=False)
+        assert len(compressed) == 33 and len(uncompressed) == 65
+        assert secp256k1.decode_pubkey(compressed) == pub
+        assert secp256k1.decode_pubkey(uncompressed) == pub
+        assert secp256k1.decode_pubkey(uncompressed[1:]) == pub
+    for bad in (b'\x02' + b'\x00' * 31 + b'\x05', b'\x04' + b'\x01' * 64,
+                b'\x05' + b'\x00' * 32, b''):
+        try:
+            secp256k1.decode_pubkey(bad)
+            assert False, "decoded %s" % bad.hex()
+        except ValueError:
+            pass
+
+
+def test_keystore():
+    pubs = [secp256k1.multiply(secp256k1.G, k) for k in random_scalars(20)[5:]]
+    for compressed in (False, True):
+        store = keystore.PublicKeyStore(compressed)
+        store.extend(pubs)
+        assert len(store) == len(pubs) and list(store) == pubs
+        assert store[-1] == pubs[-1]
+        assert bytes(store.view(2)) == store.encode(pubs[2])
+        assert len(store.view(2)) == store.record_size
+        assert list(store.addresses()) == [
+            secp256k1.pub_to_address(pub) for pub in pubs]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "keys.bin")
+            with keystore.PublicKeyStore.open(path, compressed) as store:
+                store.extend(pubs[:5])
+            # Reopening appends after the existing keys and grows the map
+            with keystore.PublicKeyStore.open(path, compressed) as store:
+                store.extend(pubs[5:] * 100)
+            assert os.path.getsize(path) == keystore._HEADER.size + \
+                (5 + 100 * (len(pubs) - 5)) * store.record_size
+            with keystore.PublicKeyStore.open(path, compressed, writable=False) as store:
+                assert store[4] == pubs[4] and store[5] == pubs[5]
+                assert store[-1] == pubs[-1]
+                try:
+                    store.append(pubs[0])
+                    assert False, "appended to a read-only store"
+                except ValueError:
+                    pass
+
+            # A store that was never closed keeps its spare capacity, which
+            # must not read back as keys
+            path = os.path.join(tmp, "unclosed.bin")
+            unclosed = keystore.PublicKeyStore.open(path, compressed)
+            unclosed.extend(pubs[:3])
+            assert os.path.getsize(path) > 3 * store.record_size + keystore._HEADER.size
+            with keystore.PublicKeyStore.open(path, compressed, writable=False) as store:
+                assert len(store) == 3 and list(store) == pubs[:3]
+            unclosed.close()
+
+
+def test_opcount():
+    double, field = secp256k1.jacobian_double, secp256k1._field
+    pt = secp256k1.to_jacobian(secp256k1.G)
+    with opcount.count_ops("outer") as outer:
+        with opcount.count_ops("inner") as inner:
+            secp256k1.jacobian_double(pt)
+        secp256k1.ecdsa_raw_sign(b'\x02' * 32, b'\x01' * 32)
+    assert inner["point_double"] == 1 and inner["field_sqr"] == 6
+    assert outer["point_double"] == 1
+    # Fixed-base signing: one mixed addition per window, k^-1 and one
+    # normalization
+    assert outer["point_add_mixed"] > 0 and outer["field_inv"] == 2
+    assert outer.wall_time >= inner.wall_time > 0
+    assert secp256k1.jacobian_double is double and secp256k1._field is field
+
+    reports = []
+    recover = opcount.profiled(secp256k1.ecdsa_raw_recover, report=reports.append)
+    vrs = secp256k1.ecdsa_raw_sign(b'\x02' * 32, b'\x01' * 32)
+    assert recover(b'\x02' * 32, vrs) == secp256k1.privtopub(b'\x01' * 32)
+    assert len(reports) == 1 and reports[0]["field_sqrt"] == 1
+    assert reports[0].name == "ecdsa_raw_recover"
+
+
+if __name__ == '__main__':
+    test_fixed_base_table()
+    test_multiply_uses_base_table()
+    test_wnaf_digits()
+    test_wnaf_multiply()
+    test_glv_split()
+    test_glv_multiply()
+    test_multiply_engine_selection()
+    test_multi_multiply()
+    test_pippenger_multi_multiply()
+    test_batch_ecdh()
+    test_stealth_addresses()
+    test_stealth_scanner()
+    test_sign_recover()
+    test_batch_inv()
+    test_batch_recover()
+    test_verify()
+    test_batch_verify()
+    test_point_classes()
+    test_field_backends()
+    test_bulk_sign()
+    test_parallel_helpers()
+    test_enumerate_addresses()
+    test_sec1_encoding()
+    test_keystore()
+    test_opcount()
+    print("All tests passed!")
@@ -1,30 +1,23 @@
+import json
+import os
 import random
+import tempfile
 import pytest
 
-from py_ecc import (
-    bls12_381,
-)
-
-from py_ecc.fields import (
-    bls12_381_FQ,
-    bls12_381_FQ2,
-    bls12_381_FQ12,
-
-)
-
 from py_ecc.utils import (
     prime_field_inv,
 )
 
 from hashlib import sha256
+
+import bls_backend
+import parallel
+from atomic_file import atomic_write
+from secp256k1 import batch_inv
 random.seed(a='tests2', version=2)
 class Accumulator:
 
-    curve = bls12_381.bls12_381_curve
-    pairing = bls12_381.bls12_381_pairing
-    FQ = bls12_381_FQ
-    FQ2 = bls12_381_FQ2
-    FQ12 = bls12_381_FQ12
+    curve = bls_backend
 
 
 
@@ -34,15 +27,23 @@ class Accumulator:
         self.public_key_g2 = self.curve.multiply(self.curve.G2, self.secret_key)
         self.elements = []
         self.value = self.curve.G1
+        # Changes since the last end_epoch, and the value they started from.
+        # _epoch_ops keeps every change until end_epoch publishes them, so it
+        # grows without limit if end_epoch is never called.
+        self.epoch = 0
+        self._epoch_value = self.value
+        self._epoch_ops = []
 
 
     def add_element_hash(self, element:bytes):
         self.elements.append(element)
+        self._epoch_ops.append(("add", element))
         scalar = int.from_bytes(element, "big") + self.secret_key
         self.value = self.curve.multiply(self.value, scalar)
 
     def remove_element_hash(self, element:bytes):
         self.elements.remove(element)
+        self._epoch_ops.append(("remove", element))
         scalar = int.from_bytes(element, "big") + self.secret_key
         inv_scalar = prime_field_inv(scalar, self.curve.curve_order)
         self.value = self.curve.multiply(self.value, inv_scalar)
@@ -52,9 +53,41 @@ class Accumulator:
         self.remove_element_hash(element_hash)
 
     def batch_add_elements(self, elements:list[str]):
-        for element in elements:
-            element_hash = sha256(element.encode("utf-8")).digest()
-            self.add_element_hash(element_hash)
+        self.update(elements, [])
+
+    def batch_remove_elements(self, elements:list[str]):
+        self.update([], elements)
+
+    # V is G1 * prod(y + alpha) over the accumulated y, so adding and
+    # removing a batch of elements multiplies V by
+    # prod(y_add + alpha) / prod(y_remove + alpha). Both products are taken
+    # mod the curve order and the removals share one inversion, which leaves
+    # a single scalar multiplication for the whole delta. Removing an element
+    # that is not in the accumulator raises ValueError, before anything in
+    # the update is applied.
+    def update(self, adds:list[str], removes:list[str]):
+        self.update_hashes(
+            [sha256(element.encode("utf-8")).digest() for element in adds],
+            [sha256(element.encode("utf-8")).digest() for element in removes])
+
+    def update_hashes(self, adds:list[bytes], removes:list[bytes]):
+        elements = self.elements + list(adds)
+        for element in removes:
+            elements.remove(element)
+        order = self.curve.curve_order
+        scalar = 1
+        for element in adds:
+            scalar = scalar * (int.from_bytes(element, "big") + self.secret_key) % order
+        remove_scalar = 1
+        for element in removes:
+            remove_scalar = remove_scalar * (int.from_bytes(element, "big") + self.secret_key) % order
+        if removes:
+            scalar = scalar * prime_field_inv(remove_scalar, order) % order
+        self.elements = elements
+        self._epoch_ops += [("add", element) for element in adds]
+        self._epoch_ops += [("remove", element) for element in removes]
+        if scalar != 1:
+            self.value = self.curve.multiply(self.value, scalar)
 
     # Membership Witness. Let (V, YV ) be an accumulator state and y an element
     # inACC.Thenwy,V isamembershipwitnessforywithrespecttotheaccumulator
@@ -66,6 +99,78 @@ class Accumulator:
         inv_scalar = prime_field_inv(scalar, self.curve.curve_order)
         return self.curve.multiply(self.value, inv_scalar)
 
+    # A membership witness with the (epoch, number of changes made so far in
+    # it) it was issued at. The witness already reflects those changes, so
+    # when the epoch ends its holder passes the count as `since` to
+    # update_witness or batch_update_witness to skip them.
+    def issue_membership_witness(self, element:str):
+        return (self.generate_membership_witness(element), self.epoch, len(self._epoch_ops))
+
+    # Publish this epoch's changes so witness holders can update their own
+    # witnesses (update_witness, batch_update_witness) without the secret
+    # key, and start the next epoch. Returns (op, element hash, V) per
+    # change, in the order they were made: for "add", V is the value just
+    # before the element went in; for "remove", the value just after it
+    # came out. All of these are multiples of the epoch's starting value,
+    # so they are computed here, from one fixed-base table when there are
+    # many, rather than on every add or remove. V serializes with
+    # bls_backend.serialize_g1 for publishing.
+    def end_epoch(self):
+        order = self.curve.curve_order
+        ops = self._epoch_ops
+        scalars = [int.from_bytes(element, "big") + self.secret_key for _, element in ops]
+        inverses = iter(batch_inv(
+            [scalar for (op, _), scalar in zip(ops, scalars) if op == "remove"], order))
+        steps = []
+        step = 1
+        for (op, _), scalar in zip(ops, scalars):
+            if op == "add":
+                steps.append(step)
+                step = step * scalar % order
+            else:
+                step = step * next(inverses) % order
+                steps.append(step)
+        if len(steps) >= EPOCH_TABLE_MIN_UPDATES:
+            table = self.curve.fixed_base_table(self._epoch_value)
+            values = [self.curve.fixed_base_multiply(table, step) for step in steps]
+        else:
+            values = [self.curve.multiply(self._epoch_value, step) for step in steps]
+        updates = [(op, element, value) for (op, element), value in zip(ops, values)]
+        self.epoch += 1
+        self._epoch_value = self.value
+        self._epoch_ops = []
+        return updates
+
+    # Membership witnesses for many elements at once: every accumulated
+    # element by default, else the given ones, which must all be accumulated
+    # (ValueError otherwise). The (y + alpha) inverses share one inversion,
+    # and the multiplications of V by them are spread over a process pool
+    # (see bulk_witnesses). Yields (element hash, compressed witness) in
+    # order.
+    def iter_membership_witnesses(self, elements=None, **kwargs):
+        if elements is None:
+            hashes = list(self.elements)
+        else:
+            hashes = [sha256(element.encode("utf-8")).digest() for element in elements]
+            accumulated = set(self.elements)
+            for element, element_hash in zip(elements, hashes):
+                if element_hash not in accumulated:
+                    raise ValueError("%s is not in the accumulator" % element)
+        inv_scalars = batch_inv(
+            [int.from_bytes(element, "big") + self.secret_key for element in hashes],
+            self.curve.curve_order)
+        return bulk_witnesses(self.value, zip(hashes, inv_scalars), **kwargs)
+
+    # Stream witnesses to path as JSON lines of
+    # {"element": <hash hex>, "witness": <compressed G1 hex>}, written as
+    # they arrive and moved into place once complete. Returns the count.
+    def write_membership_witnesses(self, path:str, elements=None, **kwargs) -> int:
+        count = 0
+        with atomic_write(path) as f:
+            for element, witness in self.iter_membership_witnesses(elements, **kwargs):
+                f.write(json.dumps({"element": element.hex(), "witness": witness.hex()}) + "\n")
+                count += 1
+        return count
 
     #  e(C, y*G2 + pk_g2) = e(V, G2)
     def verify_membership_witness(self, witness, element:str):
@@ -74,10 +179,122 @@ class Accumulator:
 
         yg2 = self.curve.multiply(self.curve.G2, scalar)
         yg2_pk_g2 = self.curve.add(yg2, self.public_key_g2)
-        pairing1 = self.pairing.pairing(yg2_pk_g2, witness)
-
-        pairing2 = self.pairing.pairing(self.curve.G2, self.value)
-        return pairing1 == pairing2
+        return self.curve.pairing_check(
+            [(yg2_pk_g2, witness), (self.curve.neg(self.curve.G2), self.value)])
+
+
+# Epochs with at least this many changes get their values from a
+# fixed-base table of the starting value
+EPOCH_TABLE_MIN_UPDATES = 16
+
+
+# Bring the witness C for element y up to date with an epoch's updates from
+# Accumulator.end_epoch, one change at a time. With V the value before and
+# V' the value after a change to y', C = V/(y + alpha) becomes
+#   add y':    C' = V'/(y + alpha) = C * (y' - y) + V
+#   remove y': C' = V'/(y + alpha) = (C - V') / (y' - y)
+# so each change costs one scalar multiplication and one addition, and
+# alpha is never needed. A witness issued partway through the epoch skips
+# the first `since` updates, which it already reflects (see
+# Accumulator.issue_membership_witness).
+def update_witness(witness, element:str, updates, since:int=0):
+    curve = bls_backend
+    order = curve.curve_order
+    y = int.from_bytes(sha256(element.encode("utf-8")).digest(), "big")
+    for op, changed, value in updates[since:]:
+        d = (int.from_bytes(changed, "big") - y) % order
+        if op == "add":
+            witness = curve.add(curve.multiply(witness, d), value)
+        else:
+            if d == 0:
+                raise ValueError("%s was removed from the accumulator" % element)
+            witness = curve.multiply(curve.add(witness, curve.neg(value)), prime_field_inv(d, order))
+    return witness
+
+
+# Same as update_witness, in one multi-scalar multiplication. Every change
+# maps C to C * f + V * g (add: f = y' - y, g = 1; remove:
+# f = 1/(y' - y), g = -1/(y' - y)), so the result is C times the product
+# of all f plus each V times its g and the f's of the changes after it.
+# The removals' inverses share one inversion.
+def batch_update_witness(witness, element:str, updates, since:int=0):
+    curve = bls_backend
+    order = curve.curve_order
+    updates = updates[since:]
+    y = int.from_bytes(sha256(element.encode("utf-8")).digest(), "big")
+    ds = [(int.from_bytes(changed, "big") - y) % order for _, changed, _ in updates]
+    if any(d == 0 for (op, _, _), d in zip(updates, ds) if op == "remove"):
+        raise ValueError("%s was removed from the accumulator" % element)
+    inverses = iter(batch_inv([d for (op, _, _), d in zip(updates, ds) if op == "remove"], order))
+    factors = []
+    for (op, _, _), d in zip(updates, ds):
+        if op == "add":
+            factors.append((d, 1))
+        else:
+            d_inv = next(inverses)
+            factors.append((d_inv, order - d_inv))
+    pairs = []
+    f = 1
+    for (_, _, value), (step, g) in zip(reversed(updates), reversed(factors)):
+        pairs.append((value, g * f % order))
+        f = f * step % order
+    pairs.append((witness, f))
+    return curve.multi_multiply(pairs)
+
+
+# A fixed-base table of V costs about as much to build as ten plain
+# multiplications of V, and starting a worker adds a few more, so a table
+# (and each worker, which builds its own) needs at least this many
+# witnesses to pay off
+WITNESS_TABLE_MIN_ITEMS = 16
+
+
+# V * inv_scalar for each (element hash, inv_scalar), serialized
+def witness_chunk(table, chunk):
+    curve = bls_backend
+    return [(element, curve.serialize_g1(curve.fixed_base_multiply(table, inv_scalar)))
+            for element, inv_scalar in chunk]
+
+
+# Per-worker fixed-base table of V, built once when the pool starts
+_worker_table = None
+
+
+def _init_worker(backend:str, value:bytes):
+    global _worker_table
+    bls_backend.set_bls_backend(backend)
+    _worker_table = bls_backend.fixed_base_table(bls_backend.deserialize_g1(value))
+
+
+def _witness_chunk(chunk):
+    return witness_chunk(_worker_table, chunk)
+
+
+# Multiply value by every inv_scalar of (element hash, inv_scalar) items and
+# yield (element hash, compressed witness) in input order. Each worker
+# builds a fixed-base table of value once, so a witness costs one addition
+# per 6 bits of scalar instead of a full multiplication. Workers are capped
+# so each gets WITNESS_TABLE_MIN_ITEMS items; with one left the work stays
+# in this process, without a table below WITNESS_TABLE_MIN_ITEMS items. At
+# most max_pending chunks are in flight.
+def bulk_witnesses(value, items, workers=None, chunk_size:int=64, max_pending=None):
+    items = list(items)
+    workers = min(workers or os.cpu_count() or 1, len(items) // WITNESS_TABLE_MIN_ITEMS)
+    if workers <= 1:
+        curve = bls_backend
+        if len(items) < WITNESS_TABLE_MIN_ITEMS:
+            for element, inv_scalar in items:
+                yield (element, curve.serialize_g1(curve.multiply(value, inv_scalar)))
+            return
+        table = curve.fixed_base_table(value)
+        for chunk in parallel.chunks(items, chunk_size):
+            yield from witness_chunk(table, chunk)
+        return
+    initargs = (bls_backend.BLS_BACKEND, bls_backend.serialize_g1(value))
+    for witnesses in parallel.imap_ordered(
+            _witness_chunk, ((chunk,) for chunk in parallel.chunks(items, chunk_size)),
+            workers, _init_worker, initargs, max_pending):
+        yield from witnesses
 
 
 def test1(sk):
@@ -89,7 +306,7 @@ def test1(sk):
 
     accumulator2 = Accumulator(sk)
     accumulator2.batch_add_elements(['1'])
-    assert(accumulator1.value==accumulator2.value)
+    assert(bls_backend.eq(accumulator1.value, accumulator2.value))
 
 def test2(sk):
     elements = ['1', '2', '4', '5', '6']
@@ -109,10 +326,133 @@ def test2(sk):
     assert(accumulator1.verify_membership_witness(witness3, '2') == False)
 
 
+def test3(sk):
+    # batched updates land on the same value as one element at a time
+    accumulator1 = Accumulator(sk)
+    for element in ['1', '2', '3', '4']:
+        accumulator1.add_element_hash(sha256(element.encode("utf-8")).digest())
+    accumulator1.remove_element('2')
+    accumulator1.remove_element('4')
+    accumulator1.add_element_hash(sha256('5'.encode("utf-8")).digest())
+
+    accumulator2 = Accumulator(sk)
+    accumulator2.batch_add_elements(['1', '2', '3', '4'])
+    accumulator2.batch_remove_elements(['2', '4'])
+    accumulator2.batch_add_elements(['5'])
+    assert(bls_backend.eq(accumulator1.value, accumulator2.value))
+
+    accumulator3 = Accumulator(sk)
+    accumulator3.batch_add_elements(['1', '2', '4'])
+    accumulator3.update(['3', '5'], ['2', '4'])
+    assert(bls_backend.eq(accumulator1.value, accumulator3.value))
+    assert(sorted(accumulator3.elements) == sorted(accumulator1.elements))
+
+    # a removal of a missing element rejects the whole update
+    value = accumulator3.value
+    ops = list(accumulator3._epoch_ops)
+    with pytest.raises(ValueError):
+        accumulator3.update(['6'], ['1', '7'])
+    with pytest.raises(ValueError):
+        accumulator3.batch_remove_elements(['7'])
+    assert(accumulator3.value == value and len(accumulator3.elements) == 3)
+    assert(accumulator3._epoch_ops == ops)
+
+    witness = accumulator3.generate_membership_witness('5')
+    assert(accumulator3.verify_membership_witness(witness, '5') == True)
+
+
+def test4(sk):
+    elements = [str(i) for i in range(2 * WITNESS_TABLE_MIN_ITEMS)]
+    accumulator1 = Accumulator(sk)
+    accumulator1.batch_add_elements(elements)
+    for workers in (1, 2):
+        witnesses = list(accumulator1.iter_membership_witnesses(workers=workers, chunk_size=3))
+        assert([element for element, _ in witnesses] == accumulator1.elements)
+        for element, (_, witness) in zip(elements, witnesses):
+            assert(bls_backend.eq(bls_backend.deserialize_g1(witness),
+                                  accumulator1.generate_membership_witness(element)))
+    assert(accumulator1.verify_membership_witness(bls_backend.deserialize_g1(witnesses[7][1]), '7') == True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "witnesses.jsonl")
+        assert(accumulator1.write_membership_witnesses(path, ['3', '11'], workers=2) == 2)
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert([line["witness"] for line in lines] == [witnesses[3][1].hex(), witnesses[11][1].hex()])
+        assert(os.listdir(tmp) == ["witnesses.jsonl"])
+
+        # elements that were never accumulated are rejected up front
+        with pytest.raises(ValueError):
+            accumulator1.write_membership_witnesses(path, ['3', 'not-there'])
+        assert(os.listdir(tmp) == ["witnesses.jsonl"])
+
+    # too few witnesses for a pool (or a table) are worked out in process,
+    # the same as with one
+    few = [(element, inv_scalar) for element, inv_scalar in zip(
+        [b"a", b"b"], [5, bls_backend.curve_order - 1])]
+    assert(list(bulk_witnesses(accumulator1.value, few, workers=4)) == [
+        (b"a", bls_backend.serialize_g1(bls_backend.multiply(accumulator1.value, 5))),
+        (b"b", bls_backend.serialize_g1(bls_backend.neg(accumulator1.value)))])
+
+
+def test5(sk):
+    accumulator1 = Accumulator(sk)
+    accumulator1.batch_add_elements(['1', '2', '3', '4'])
+    accumulator1.end_epoch()
+    witness = accumulator1.generate_membership_witness('1')
+
+    accumulator1.add_element_hash(sha256('5'.encode("utf-8")).digest())
+    accumulator1.remove_element('2')
+    accumulator1.update(['6', '7'], ['3', '5'])
+    updates = accumulator1.end_epoch()
+    assert([op for op, _, _ in updates] == ["add", "remove", "add", "add", "remove", "remove"])
+    assert(accumulator1.verify_membership_witness(witness, '1') == False)
+
+    witness1 = update_witness(witness, '1', updates)
+    assert(accumulator1.verify_membership_witness(witness1, '1') == True)
+    witness2 = batch_update_witness(witness, '1', updates)
+    assert(bls_backend.eq(witness1, witness2))
+    assert(bls_backend.eq(witness1, accumulator1.generate_membership_witness('1')))
+
+    # next epoch: enough changes for the fixed-base path
+    accumulator1.update([str(i) for i in range(10, 30)], ['4'])
+    updates = accumulator1.end_epoch()
+    assert(len(updates) >= EPOCH_TABLE_MIN_UPDATES)
+    witness3 = batch_update_witness(witness2, '1', updates)
+    assert(accumulator1.verify_membership_witness(witness3, '1') == True)
+    assert(bls_backend.eq(witness3, update_witness(witness2, '1', updates)))
+    assert(accumulator1.end_epoch() == [] and accumulator1.epoch == 4)
+
+    # witnesses issued mid-epoch skip the changes they already reflect,
+    # including the addition of their own element
+    accumulator1.update(['40', '41'], ['10'])
+    witness5, epoch, since = accumulator1.issue_membership_witness('1')
+    assert((epoch, since) == (accumulator1.epoch, 3))
+    accumulator1.update(['42'], [])
+    witness6, _, since6 = accumulator1.issue_membership_witness('42')
+    accumulator1.update(['43'], ['11', '40'])
+    updates = accumulator1.end_epoch()
+    for update in (update_witness, batch_update_witness):
+        assert(accumulator1.verify_membership_witness(update(witness5, '1', updates, since), '1') == True)
+        assert(accumulator1.verify_membership_witness(update(witness6, '42', updates, since6), '42') == True)
+    assert(accumulator1.verify_membership_witness(update_witness(witness5, '1', updates), '1') == False)
+
+    # a removed element's witness cannot be brought forward
+    witness4 = accumulator1.generate_membership_witness('6')
+    accumulator1.remove_element('6')
+    updates = accumulator1.end_epoch()
+    with pytest.raises(ValueError):
+        update_witness(witness4, '6', updates)
+    with pytest.raises(ValueError):
+        batch_update_witness(witness4, '6', updates)
+
 
 
 if __name__ == "__main__":
-    sk = random.randint(0, bls12_381.bls12_381_curve.curve_order)
+    sk = random.randint(0, bls_backend.curve_order)
     test1(sk)
     test2(sk)
+    test3(sk)
+    test4(sk)
+    test5(sk)
 